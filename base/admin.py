@@ -1,9 +1,11 @@
 from django.contrib import admin
-from .models import Institution, UserProfile, MoodEntry
+from . import mood_sync
+from .models import (Institution, UserProfile, MoodEntry, MoodReason, MoodDailyAggregate, CrisisAlert,
+                     ChatTranscriptTurn)
 
 @admin.register(Institution)
 class InstitutionAdmin(admin.ModelAdmin):
-    list_display = ['id', 'name', 'created_at']
+    list_display = ['id', 'name', 'chat_user_rate_per_minute', 'chat_institution_rate_per_minute', 'transcript_retention_days', 'created_at']
     search_fields = ['name']
     ordering = ['-created_at']
 
@@ -20,7 +22,55 @@ class MoodEntryAdmin(admin.ModelAdmin):
     list_filter = ['mood_value', 'mood_label', 'created_at']
     search_fields = ['user__username', 'user__email', 'reason', 'notes']
     ordering = ['-created_at']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['created_at', 'updated_at', 'version']
     
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('user')
+    
+    # Edits and deletes go through mood_sync so rollups, reason links and delta syncs see them
+    def save_model(self, request, obj, form, change):
+        mood_sync.save_edited_entry(obj)
+    
+    def delete_model(self, request, obj):
+        mood_sync.delete_entries([obj])
+    
+    def delete_queryset(self, request, queryset):
+        mood_sync.delete_entries(list(queryset))
+
+@admin.register(MoodReason)
+class MoodReasonAdmin(admin.ModelAdmin):
+    list_display = ['id', 'slug', 'label', 'created_at']
+    search_fields = ['slug', 'label']
+    ordering = ['label']
+
+@admin.register(MoodDailyAggregate)
+class MoodDailyAggregateAdmin(admin.ModelAdmin):
+    list_display = ['id', 'day', 'user', 'institution', 'count', 'total', 'min_value', 'max_value']
+    list_filter = ['institution', 'day']
+    search_fields = ['user__username', 'user__email', 'institution__name']
+    ordering = ['-day']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user', 'institution')
+
+@admin.register(CrisisAlert)
+class CrisisAlertAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'institution', 'status', 'attempts', 'latency_ms', 'created_at', 'notified_at']
+    list_filter = ['status', 'institution', 'created_at']
+    search_fields = ['user__username', 'user__email', 'conversation_id']
+    ordering = ['-created_at']
+    readonly_fields = ['created_at', 'notified_at', 'latency_ms', 'recipients', 'last_error']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user', 'institution')
+
+@admin.register(ChatTranscriptTurn)
+class ChatTranscriptTurnAdmin(admin.ModelAdmin):
+    list_display = ['id', 'conversation_id', 'user', 'institution', 'sender', 'model', 'created_at']
+    list_filter = ['sender', 'institution', 'created_at']
+    search_fields = ['conversation_id', 'user__username', 'user__email']
+    ordering = ['-created_at']
+    readonly_fields = ['created_at']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user', 'institution')
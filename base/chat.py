@@ -0,0 +1,299 @@
+"""
+Request handling shared by the sync and async chat views
+
+ChatRequest parses a chat request and carries what the reply helpers need;
+the views in views.py decide where the reply comes from (triage, cache or
+the model) and hand it back here to be recorded and sent.
+"""
+
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+
+from . import chat_cache, conversation_store, crisis_alerts, transcripts
+
+logger = logging.getLogger(__name__)
+
+CHAT_FALLBACK_RESPONSE = "I'm here to listen and support you. Could you tell me more about what's on your mind?"
+CHAT_ERROR_RESPONSE = "I'm experiencing technical difficulties. Please contact campus counseling for immediate support."
+
+
+def chat_engine():
+    """Chat functions from gemini_config, or the local fallback when the Google module is not available"""
+    try:
+        import gemini_config as engine
+    except ImportError:
+        import gemini_fallback as engine
+    return engine
+
+
+class ChatRequest:
+    """
+    A parsed chat request
+
+    Clients send the new message and the conversation_id from their previous
+    reply; the history is loaded from the server-side conversation store.
+    When the store has nothing for the id (the turns expired, or were evicted
+    from the cache) the request is answered with history_missing_reply, and
+    the client resends once with its recent turns as conversation_history,
+    which are then stored again. Older clients that post only
+    conversation_history get a fresh conversation id.
+    """
+
+    def __init__(self, request):
+        data = json.loads(request.body)
+        self.user_message = data.get('message', '').strip()
+        self.stream = bool(data.get('stream'))
+        self.user = getattr(request, 'user', None)
+
+        conversation_id = data.get('conversation_id')
+        if conversation_store.is_valid_id(conversation_id):
+            self.conversation_id = conversation_id
+            self.history = conversation_store.load_history(conversation_id)
+        else:
+            self.conversation_id = conversation_store.new_conversation_id()
+            self.history = []
+        self._unsaved_history = []
+        if not self.history:
+            self.history = self._unsaved_history = self._client_history(data)
+        # A continued conversation the store lost, with no turns to rebuild it from
+        self.history_missing = (conversation_id == self.conversation_id and not self.history
+                                and 'conversation_history' not in data)
+
+        logger.debug(f"Chat message received ({len(self.user_message)} chars, {len(self.history)} previous turns)")
+
+    def _client_history(self, data):
+        """The recent turns the client sent, without the current message"""
+        history = [
+            {'sender': msg.get('sender'), 'content': msg.get('content', '')}
+            for msg in data.get('conversation_history') or []
+            if isinstance(msg, dict) and msg.get('sender') in ('user', 'ai')
+        ][-conversation_store.MAX_STORED_TURNS - 1:]
+        # The frontend sends the current message as the last entry
+        if history and history[-1] == {'sender': 'user', 'content': self.user_message}:
+            history.pop()
+        return history[-conversation_store.MAX_STORED_TURNS:]
+
+    def history_missing_reply(self):
+        """Ask the client to resend this message with its recent turns"""
+        return JsonResponse({
+            'success': False,
+            'error': 'Conversation history not found; resend with conversation_history',
+            'history_missing': True,
+            'conversation_id': self.conversation_id
+        }, status=409)
+
+    def record(self, reply):
+        """
+        Store this exchange in the conversation so the next request can build on it
+
+        The exchange is also buffered for the transcript store, and messages
+        with a crisis phrase queue an alert for the student's counsellors.
+        """
+        if reply.get('error'):
+            return
+        if crisis_alerts.should_alert(self.user_message):
+            crisis_alerts.enqueue_alert(self.user, self.conversation_id, self.user_message)
+        conversation_store.append_turns(self.conversation_id, self._unsaved_history + [
+            {'sender': 'user', 'content': self.user_message},
+            {'sender': 'ai', 'content': reply['text']},
+        ])
+        self._unsaved_history = []
+        transcripts.record_exchange(self.user, self.conversation_id, self.user_message, reply)
+
+    def early_reply(self, engine):
+        """
+        Answer the message without calling the model when possible
+
+        Crisis messages are triaged first - before the topic filter - so they
+        are always answered with crisis resources, never with the off-topic
+        redirect. Returns None when the message should go on to the model.
+        """
+        crisis_response = engine.triage_message(self.user_message)
+        if crisis_response:
+            return crisis_response
+
+        # Check if message is mental health related
+        if not engine.is_mental_health_related(self.user_message):
+            return {**engine.get_off_topic_response(), 'model': 'gemini-mental-health-filter'}
+        return None
+
+    def reply(self, response_data):
+        """Record a complete reply and send it, as JSON or as stream events"""
+        self.record(response_data)
+        return self._send(response_data)
+
+    async def areply(self, response_data):
+        """Async version of reply; streamed replies use an async iterator"""
+        await sync_to_async(self.record)(response_data)
+        return self._send(response_data, asynchronous=True)
+
+    def _send(self, response_data, asynchronous=False):
+        if self.stream:
+            events = self._complete_reply_events(response_data)
+            return ndjson_stream_response(_async_events(events) if asynchronous else events)
+        return self._json_reply(response_data)
+
+    def stream_reply(self, events):
+        """Stream model events to the client, then cache and record the full reply"""
+        on_event, finish = self._collector()
+
+        def completing():
+            for event in events:
+                yield on_event(event)
+            finish()
+
+        return ndjson_stream_response(completing())
+
+    def astream_reply(self, events):
+        """Async version of stream_reply"""
+        on_event, finish = self._collector()
+
+        async def completing():
+            async for event in events:
+                yield on_event(event)
+            await sync_to_async(finish)()
+
+        return ndjson_stream_response(completing())
+
+    def _collector(self):
+        """Return (on_event, finish) callbacks that assemble a streamed reply"""
+        parts = []
+        state = {'done': None}
+
+        def on_event(event):
+            if event['type'] == 'chunk':
+                parts.append(event['text'])
+            elif event['type'] == 'done':
+                state['done'] = event
+                event = {**event, 'conversation_id': self.conversation_id}
+            return event
+
+        def finish():
+            done = state['done']
+            if done is None:
+                return
+            reply = {
+                'text': ''.join(parts),
+                'safety_flags': done.get('safety_flags', []),
+                'model': done.get('model', ''),
+                'timestamp': done.get('timestamp', ''),
+            }
+            chat_cache.store_response(self.user_message, self.history, reply)
+            self.record(reply)
+
+        return on_event, finish
+
+    def _complete_reply_events(self, response_data):
+        """Wrap a complete reply in the same event shape used for streamed replies"""
+        yield {'type': 'chunk', 'text': response_data['text']}
+        yield {
+            'type': 'done',
+            'safety_flags': response_data.get('safety_flags', []),
+            'redirect': response_data.get('redirect', False),
+            'model': response_data.get('model', ''),
+            'timestamp': response_data.get('timestamp', ''),
+            'cached': response_data.get('cached', False),
+            'conversation_id': self.conversation_id
+        }
+
+    def _json_reply(self, gemini_response):
+        """JSON reply for a completed (non-streamed) chat response"""
+        if gemini_response.get('error'):
+            return JsonResponse({
+                'success': False,
+                'error': gemini_response['error'],
+                'fallback_response': CHAT_FALLBACK_RESPONSE
+            }, status=500)
+
+        return JsonResponse({
+            'success': True,
+            'response': gemini_response['text'],
+            'safety_flags': gemini_response.get('safety_flags', []),
+            'model': gemini_response.get('model', 'gemini-1.5-flash'),
+            'timestamp': gemini_response.get('timestamp', ''),
+            'redirect': gemini_response.get('redirect', False),
+            'cached': gemini_response.get('cached', False),
+            'crisis_detected': 'crisis_detected' in gemini_response.get('safety_flags', []),
+            'conversation_id': self.conversation_id
+        })
+
+
+async def _async_events(events):
+    for event in events:
+        yield event
+
+
+def chat_error_reply(error):
+    """Reply for requests that failed before a chat response could be produced"""
+    if isinstance(error, json.JSONDecodeError):
+        return JsonResponse({
+            'success': False,
+            'error': 'Invalid JSON data'
+        }, status=400)
+    return JsonResponse({
+        'success': False,
+        'error': str(error),
+        'fallback_response': CHAT_ERROR_RESPONSE
+    }, status=500)
+
+
+def empty_message_reply():
+    return JsonResponse({
+        'success': False,
+        'error': 'Message cannot be empty'
+    }, status=400)
+
+
+def _stream_event_line(event):
+    """Serialize one chat event as a line of newline-delimited JSON"""
+    if event['type'] == 'done':
+        event = {
+            **event,
+            'success': True,
+            'redirect': event.get('redirect', False),
+            'crisis_detected': 'crisis_detected' in event.get('safety_flags', [])
+        }
+    elif event['type'] == 'error':
+        event = {
+            'type': 'error',
+            'success': False,
+            'error': event.get('error', ''),
+            'fallback_response': CHAT_FALLBACK_RESPONSE
+        }
+    return json.dumps(event) + '\n'
+
+
+def _stream_failure_line(error):
+    logger.error(f"Chat stream failed: {error}")
+    return _stream_event_line({'type': 'error', 'error': str(error)})
+
+
+def ndjson_stream_response(events):
+    """
+    Send chat events to the client as newline-delimited JSON, one line per event,
+    flushing every chunk as soon as the model produces it. Accepts a regular
+    iterator (WSGI) or an async iterator (ASGI).
+    """
+    if hasattr(events, '__aiter__'):
+        async def lines():
+            try:
+                async for event in events:
+                    yield _stream_event_line(event)
+            except Exception as e:
+                yield _stream_failure_line(e)
+    else:
+        def lines():
+            try:
+                for event in events:
+                    yield _stream_event_line(event)
+            except Exception as e:
+                yield _stream_failure_line(e)
+
+    response = StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+    response['Cache-Control'] = 'no-cache'
+    # Stop reverse proxies (nginx, Render) from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
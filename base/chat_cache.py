@@ -0,0 +1,124 @@
+"""
+Response cache for repeated chat prompts
+
+Many first-turn messages are near-identical (the suggested prompts on the AI
+support page, "I'm stressed about exams"). Replies are cached in the Django
+cache - shared by every worker when Redis is configured - keyed on the
+normalized message plus a hash of the conversation history, so the same
+prompt in a different conversation is never answered from the cache.
+
+Crisis-flagged messages are never cached: they are answered by triage before
+the cache is consulted, and store_response refuses them as well.
+"""
+
+import hashlib
+import json
+import logging
+import re
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from keyword_classifier import is_crisis_message
+
+KEY_PREFIX = 'chat-response'
+STATS_KEYS = {
+    'hits': 'chat-response-stats:hits',
+    'misses': 'chat-response-stats:misses',
+}
+
+# Replies carrying any of these flags are not reused; failover and rate-limited
+# replies come from the local engine and should not outlive the condition
+UNCACHEABLE_FLAGS = {'crisis_detected', 'api_error', 'content_blocked', 'gemini_failover', 'rate_limited'}
+
+_WHITESPACE = re.compile(r'\s+')
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_message(message):
+    """Lowercase, collapse whitespace and drop trailing punctuation"""
+    return _WHITESPACE.sub(' ', message.lower()).strip().rstrip('.!?')
+
+
+def response_cache_key(user_message, conversation_history=None):
+    """Cache key for a message in the context of its conversation history"""
+    history = [
+        [msg.get('sender', ''), msg.get('content', '')]
+        for msg in (conversation_history or [])
+    ]
+    # The frontend sends the current message as the last history entry
+    if history and history[-1] == ['user', user_message]:
+        history.pop()
+
+    digest = hashlib.sha256(
+        json.dumps([normalize_message(user_message), history]).encode()
+    ).hexdigest()
+    return f'{KEY_PREFIX}:{digest}'
+
+
+def _is_enabled():
+    return settings.CHAT_RESPONSE_CACHE_TTL > 0
+
+
+def _count(name):
+    key = STATS_KEYS[name]
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted between add and incr - start counting again
+        cache.set(key, 1, timeout=None)
+
+
+def get_cached_response(user_message, conversation_history=None):
+    """Return the cached reply for this prompt, or None on a miss"""
+    if not _is_enabled():
+        return None
+
+    # A cache outage must never break chat - treat it as a miss
+    try:
+        response = cache.get(response_cache_key(user_message, conversation_history))
+        _count('hits' if response is not None else 'misses')
+    except Exception as e:
+        logger.warning(f"Chat response cache lookup failed: {e}")
+        return None
+    return response
+
+
+def store_response(user_message, conversation_history, response):
+    """Cache a successful, non-crisis reply for the configured TTL"""
+    if not _is_enabled() or response.get('error'):
+        return
+    if UNCACHEABLE_FLAGS.intersection(response.get('safety_flags', [])):
+        return
+    if is_crisis_message(user_message):
+        return
+
+    try:
+        cache.set(
+            response_cache_key(user_message, conversation_history),
+            {**response, 'cached': True},
+            timeout=settings.CHAT_RESPONSE_CACHE_TTL
+        )
+    except Exception as e:
+        logger.warning(f"Chat response cache store failed: {e}")
+
+
+aget_cached_response = sync_to_async(get_cached_response)
+astore_response = sync_to_async(store_response)
+
+
+def get_response_cache_stats():
+    """Hit/miss counters, summed across every worker sharing the cache"""
+    hits = cache.get(STATS_KEYS['hits'], 0)
+    misses = cache.get(STATS_KEYS['misses'], 0)
+    lookups = hits + misses
+    return {
+        'enabled': _is_enabled(),
+        'ttl_seconds': settings.CHAT_RESPONSE_CACHE_TTL,
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+    }
@@ -0,0 +1,59 @@
+"""
+Server-side conversation history for the AI chat
+
+Clients send only the new message plus a conversation id; the recent turns
+are kept in the Django cache (shared by every worker when Redis is
+configured). Turns older than CHAT_CONVERSATION_TTL are pruned on every read
+and write, and a conversation idle for that long expires entirely, so request
+bodies, parse time and log volume stay flat however long a chat gets.
+"""
+
+import re
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+KEY_PREFIX = 'conversation'
+
+# More than the prompt ever uses; older turns are dropped
+MAX_STORED_TURNS = 20
+
+_CONVERSATION_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+def new_conversation_id():
+    return uuid.uuid4().hex
+
+
+def is_valid_id(conversation_id):
+    """Conversation ids are random 128-bit hex strings issued by the server"""
+    return isinstance(conversation_id, str) and bool(_CONVERSATION_ID.match(conversation_id))
+
+
+def _key(conversation_id):
+    return f'{KEY_PREFIX}:{conversation_id}'
+
+
+def _live_turns(conversation_id):
+    cutoff = time.time() - settings.CHAT_CONVERSATION_TTL
+    return [turn for turn in cache.get(_key(conversation_id), []) if turn['at'] >= cutoff]
+
+
+def load_history(conversation_id):
+    """Recent turns of a conversation as [{'sender', 'content'}], oldest first"""
+    return [
+        {'sender': turn['sender'], 'content': turn['content']}
+        for turn in _live_turns(conversation_id)
+    ]
+
+
+def append_turns(conversation_id, turns):
+    """Append [{'sender', 'content'}] turns, pruning expired and surplus ones"""
+    now = time.time()
+    stored = _live_turns(conversation_id) + [
+        {'sender': turn['sender'], 'content': turn['content'], 'at': now}
+        for turn in turns
+    ]
+    cache.set(_key(conversation_id), stored[-MAX_STORED_TURNS:], timeout=settings.CHAT_CONVERSATION_TTL)
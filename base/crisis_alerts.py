@@ -0,0 +1,159 @@
+"""
+Crisis alerts to counsellors
+
+When a chat message contains a crisis phrase, ChatRequest.record queues a
+CrisisAlert row - one INSERT inside the request, so the alert survives a
+worker restart and the reply never waits on mail delivery. Phrases are
+matched as whole words (keyword_classifier.has_crisis_phrase). The broader
+crisis_detected triage, which also matches 'die' inside 'studied' or
+'diet', decides only which reply the student gets; it never emails
+counsellors.
+
+The process_crisis_alerts management command drains the queue: it emails the
+student's institution's counsellors (Institution.crisis_alert_emails, or the
+CRISIS_ALERT_EMAILS setting) through the configured EMAIL_BACKEND, records
+how long the alert took from detection to delivery, and retries failed sends
+with backoff. Each alert is claimed with SELECT ... FOR UPDATE SKIP LOCKED,
+so several workers can run side by side.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from keyword_classifier import has_crisis_phrase
+
+from .models import CrisisAlert, UserProfile
+
+# Longer messages are cut when queued; counsellors get the gist, the chat has the rest
+MESSAGE_LIMIT = 1000
+MAX_ATTEMPTS = 5
+RETRY_BASE_SECONDS = 30
+
+logger = logging.getLogger(__name__)
+
+
+def should_alert(message):
+    """Whether a chat message warrants an alert to counsellors"""
+    return has_crisis_phrase(message)
+
+
+def enqueue_alert(user, conversation_id, message):
+    """
+    Queue a crisis alert for this chat message
+
+    Never raises: a crisis reply must reach the student even if the queue
+    write fails, so errors are logged instead.
+    """
+    try:
+        if user is not None and user.is_authenticated:
+            institution_id = UserProfile.objects.filter(user=user).values_list('institution_id', flat=True).first()
+        else:
+            user, institution_id = None, None
+        return CrisisAlert.objects.create(
+            user=user,
+            institution_id=institution_id,
+            conversation_id=conversation_id or '',
+            message=message[:MESSAGE_LIMIT],
+        )
+    except Exception:
+        logger.exception("Could not queue crisis alert")
+        return None
+
+
+def alert_recipients(alert):
+    """Counsellor addresses for an alert: its institution's, else CRISIS_ALERT_EMAILS"""
+    emails = alert.institution.crisis_alert_emails if alert.institution else ''
+    recipients = [email.strip() for email in emails.split(',') if email.strip()]
+    return recipients or list(settings.CRISIS_ALERT_EMAILS)
+
+
+def _alert_email(alert):
+    student = 'An anonymous student'
+    if alert.user:
+        student = f"{alert.user.username} ({alert.user.email or 'no email'})"
+    institution = alert.institution.name if alert.institution else 'unknown institution'
+    subject = f"[MindCare] Crisis alert - {institution}"
+    body = (
+        f"{student} sent a message to the MindCare AI chat that matched crisis language.\n"
+        f"They were shown crisis resources and helpline numbers. Please follow up.\n\n"
+        f"Detected: {timezone.localtime(alert.created_at).strftime('%Y-%m-%d %H:%M:%S %Z')}\n"
+        f"Institution: {institution}\n"
+        f"Conversation: {alert.conversation_id or '-'}\n\n"
+        f"Message:\n{alert.message}\n"
+    )
+    return subject, body
+
+
+def deliver(alert):
+    """Send one alert and record the outcome on it (the caller saves it)"""
+    recipients = alert_recipients(alert)
+    alert.attempts += 1
+    if not recipients:
+        alert.status = 'failed'
+        alert.last_error = 'No counsellor addresses: set Institution.crisis_alert_emails or CRISIS_ALERT_EMAILS'
+        logger.error(f"Crisis alert {alert.pk} has no recipients")
+        return
+
+    subject, body = _alert_email(alert)
+    try:
+        send_mail(subject, body, None, recipients, fail_silently=False)
+    except Exception as e:
+        alert.last_error = str(e)
+        if alert.attempts >= MAX_ATTEMPTS:
+            alert.status = 'failed'
+            logger.error(f"Crisis alert {alert.pk} failed after {alert.attempts} attempts: {e}")
+        else:
+            alert.next_attempt_at = timezone.now() + timedelta(seconds=RETRY_BASE_SECONDS * 2 ** (alert.attempts - 1))
+            logger.warning(f"Crisis alert {alert.pk} send failed (attempt {alert.attempts}), retrying: {e}")
+        return
+
+    alert.status = 'sent'
+    alert.recipients = ', '.join(recipients)
+    alert.notified_at = timezone.now()
+    alert.latency_ms = round((alert.notified_at - alert.created_at).total_seconds() * 1000)
+    alert.last_error = ''
+    logger.info(f"Crisis alert {alert.pk} sent to {len(recipients)} counsellor(s) {alert.latency_ms} ms after detection")
+
+
+def process_pending(limit=None):
+    """
+    Deliver due alerts, oldest first, until none are left (or `limit` are done)
+
+    Returns the number of alerts processed.
+    """
+    processed = 0
+    while limit is None or processed < limit:
+        with transaction.atomic():
+            alert = (
+                CrisisAlert.objects
+                .select_for_update(skip_locked=True, of=('self',))
+                .select_related('user', 'institution')
+                .filter(status='pending', next_attempt_at__lte=timezone.now())
+                .order_by('created_at')
+                .first()
+            )
+            if alert is None:
+                break
+            deliver(alert)
+            alert.save()
+        processed += 1
+    return processed
+
+
+def get_crisis_alert_stats():
+    """Queue counts and detection-to-delivery latency of the last 100 sent alerts"""
+    counts = dict(CrisisAlert.objects.values_list('status').annotate(Count('id')).order_by())
+    stats = {status: counts.get(status, 0) for status, _ in CrisisAlert.STATUS_CHOICES}
+    latencies = sorted(
+        CrisisAlert.objects.filter(status='sent').order_by('-notified_at').values_list('latency_ms', flat=True)[:100]
+    )
+    if latencies:
+        stats['latency_p50_ms'] = latencies[len(latencies) // 2]
+        stats['latency_p95_ms'] = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+    return stats
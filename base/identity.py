@@ -0,0 +1,123 @@
+"""
+Looking up users by email
+
+The login, mood and history APIs identify students by email address. Django's
+auth_user.email is neither indexed nor unique, so a plain
+User.objects.get(email=...) scans the whole table. Lookups here filter on
+LOWER(email), which migration 0007 indexes, and match addresses regardless
+of case - "Ana@Uni.edu" and "ana@uni.edu" are the same student. (Django's
+email__iexact compiles to UPPER()/LIKE, which can't use that index.)
+
+Signed-in clients (the mood tracker, at login or from /api/device-token/)
+get a device token: the user's id, username and a fingerprint of their
+password hash, signed with SECRET_KEY. Mood calls that send it in an
+"Authorization: Device <token>" header are checked by verifying the
+signature and fetching the user by primary key, never by email. Tokens
+expire after MOOD_DEVICE_TOKEN_DAYS; changing the password, deactivating or
+deleting the account revokes the user's tokens, and changing SECRET_KEY
+revokes them all.
+"""
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.db.models.functions import Lower
+
+DEVICE_TOKEN_SALT = 'base.identity.device-token'
+DEVICE_TOKEN_SCHEME = 'Device'
+
+
+def normalize_email(email):
+    """The form emails are compared in: trimmed and lowercased"""
+    return (email or '').strip().lower()
+
+
+def users_with_email(email):
+    """Queryset of users whose email matches, ignoring case"""
+    return User.objects.alias(email_lower=Lower('email')).filter(email_lower=normalize_email(email))
+
+
+def user_by_email(email):
+    """
+    The user with this email, or None
+
+    Addresses were never unique, so when several accounts share one the
+    active account wins, then the oldest.
+    """
+    if not normalize_email(email):
+        return None
+    return users_with_email(email).order_by('-is_active', 'id').first()
+
+
+def _password_key(user):
+    """Changes whenever the user's password does, so old tokens stop working"""
+    return salted_hmac(DEVICE_TOKEN_SALT, user.password).hexdigest()[::2]
+
+
+def issue_device_token(user):
+    """A signed device token for the user"""
+    return signing.dumps({'id': user.pk, 'username': user.username, 'key': _password_key(user)},
+                         salt=DEVICE_TOKEN_SALT)
+
+
+def device_token_max_age():
+    """How long device tokens stay valid, in seconds"""
+    return settings.MOOD_DEVICE_TOKEN_DAYS * 24 * 60 * 60
+
+
+def device_token_user(token):
+    """
+    The user a device token was issued to, or None if it is forged, expired
+    or revoked
+
+    One primary-key query, loading only id, username and password; other
+    fields load from the database if read.
+    """
+    try:
+        payload = signing.loads(token, salt=DEVICE_TOKEN_SALT, max_age=device_token_max_age())
+        user = User.objects.only('id', 'username', 'password').filter(pk=int(payload['id']), is_active=True).first()
+        key = str(payload['key'])
+    except (signing.BadSignature, KeyError, TypeError, ValueError):
+        return None
+    if user is None or not constant_time_compare(key, _password_key(user)):
+        return None
+    return user
+
+
+def request_device_token(request):
+    """The device token in the request's Authorization header, or None"""
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme != DEVICE_TOKEN_SCHEME:
+        return None
+    return token.strip() or None
+
+
+def mood_api_user(request, user_data):
+    """
+    The user a mood API call is for
+
+    The signed-in user, else the device token's user, else the account for
+    user_data['email'], which mood trackers without a session or token send
+    from localStorage; only saves use it, and no token is ever issued for it.
+    An address with no account gets an inactive placeholder user to hold its
+    entries. Returns None when none of them is available or the device
+    token is invalid.
+    """
+    if request.user.is_authenticated:
+        return request.user
+    token = request_device_token(request)
+    if token:
+        return device_token_user(token)
+    if not user_data or not user_data.get('email'):
+        return None
+    user = user_by_email(user_data['email'])
+    if user is None:
+        # Create a temporary user for anonymous mood tracking
+        user = User.objects.create_user(
+            username=f"anonymous_{user_data['email']}",
+            email=user_data['email'],
+            first_name=user_data.get('username', 'Anonymous'),
+            is_active=False  # Mark as inactive since it's anonymous
+        )
+    return user
@@ -0,0 +1,33 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from base.crisis_alerts import process_pending
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued crisis alerts to counsellors (runs until stopped unless --once)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='deliver what is due now, then exit')
+        parser.add_argument('--interval', type=float, default=2.0, help='seconds between polls of an empty queue')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            processed = process_pending()
+            self.stdout.write(f"Processed {processed} crisis alert(s)")
+            return
+
+        self.stdout.write(f"Watching the crisis alert queue every {options['interval']}s...")
+        while True:
+            try:
+                processed = process_pending()
+            except Exception:
+                # A database blip shouldn't stop the worker; try again next poll
+                logger.exception("Crisis alert worker error")
+                processed = 0
+            if not processed:
+                time.sleep(options['interval'])
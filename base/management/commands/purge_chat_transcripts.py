@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from base.transcripts import purge_expired_turns
+
+
+class Command(BaseCommand):
+    help = 'Delete chat transcript turns older than their institution\'s retention period (run daily)'
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_turns()
+        self.stdout.write(f"Deleted {deleted} expired transcript turn(s)")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from base.mood_sync import DEFAULT_TOMBSTONE_DAYS, purge_tombstones
+
+
+class Command(BaseCommand):
+    help = 'Delete mood tombstones older than --days days; clients that last synced before them resync in full (run daily)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=DEFAULT_TOMBSTONE_DAYS)
+
+    def handle(self, *args, **options):
+        deleted = purge_tombstones(options['days'])
+        self.stdout.write(f"Deleted {deleted} mood tombstone(s)")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from base.mood_rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily mood rollups from every mood entry (after deploying them, or to repair drift)'
+
+    def handle(self, *args, **options):
+        written = rebuild_rollups()
+        self.stdout.write(f"Wrote {written} daily mood rollup row(s)")
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("base", "0002_moodentry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="institution",
+            name="chat_institution_rate_per_minute",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="institution",
+            name="chat_user_rate_per_minute",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:36
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("base", "0004_crisisalert"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="institution",
+            name="transcript_retention_days",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name="ChatTranscriptTurn",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("conversation_id", models.CharField(max_length=64)),
+                (
+                    "sender",
+                    models.CharField(
+                        choices=[("user", "User"), ("ai", "AI")], max_length=4
+                    ),
+                ),
+                ("content", models.TextField()),
+                ("model", models.CharField(blank=True, default="", max_length=50)),
+                ("safety_flags", models.JSONField(blank=True, default=list)),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "institution",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="chat_turns",
+                        to="base.institution",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="chat_turns",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["created_at", "id"],
+                "indexes": [
+                    models.Index(
+                        fields=["conversation_id", "created_at"],
+                        name="base_chattr_convers_8d5007_idx",
+                    ),
+                    models.Index(
+                        fields=["institution", "created_at"],
+                        name="base_chattr_institu_d30849_idx",
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("base", "0005_chattranscriptturn"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="moodentry",
+            index=models.Index(
+                fields=["user", "-created_at", "-id"], name="mood_user_created_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Case-insensitive email lookups (base/identity.py) filter on LOWER(email);
+# auth_user has no index on email at all, so index that expression.
+
+from django.db import migrations
+
+INDEX_NAME = "auth_user_email_lower_idx"
+
+
+def create_email_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor not in ("postgresql", "sqlite"):
+        return
+    table = connection.ops.quote_name(apps.get_model("auth", "User")._meta.db_table)
+    # CONCURRENTLY keeps signups and logins working while a large table is indexed
+    concurrently = "CONCURRENTLY " if connection.vendor == "postgresql" else ""
+    schema_editor.execute(
+        f"CREATE INDEX {concurrently}IF NOT EXISTS {INDEX_NAME} ON {table} (LOWER(email))"
+    )
+
+
+def drop_email_index(apps, schema_editor):
+    if schema_editor.connection.vendor not in ("postgresql", "sqlite"):
+        return
+    schema_editor.execute(f"DROP INDEX IF EXISTS {INDEX_NAME}")
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("base", "0006_moodentry_user_created_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_email_index, drop_email_index),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("base", "0008_moodentry_client_id"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MoodDailyAggregate",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("count", models.PositiveIntegerField(default=0)),
+                ("total", models.PositiveIntegerField(default=0)),
+                ("min_value", models.PositiveSmallIntegerField()),
+                ("max_value", models.PositiveSmallIntegerField()),
+                ("value_1", models.PositiveIntegerField(default=0)),
+                ("value_2", models.PositiveIntegerField(default=0)),
+                ("value_3", models.PositiveIntegerField(default=0)),
+                ("value_4", models.PositiveIntegerField(default=0)),
+                ("value_5", models.PositiveIntegerField(default=0)),
+                ("value_6", models.PositiveIntegerField(default=0)),
+                ("value_7", models.PositiveIntegerField(default=0)),
+                (
+                    "institution",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="mood_days",
+                        to="base.institution",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="mood_days",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["day"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        condition=models.Q(("user__isnull", False)),
+                        fields=("user", "day"),
+                        name="mood_day_user_unique",
+                    ),
+                    models.UniqueConstraint(
+                        condition=models.Q(("user__isnull", True)),
+                        fields=("institution", "day"),
+                        name="mood_day_institution_unique",
+                    ),
+                ],
+            },
+        ),
+    ]
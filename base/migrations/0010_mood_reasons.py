@@ -0,0 +1,109 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("base", "0009_mooddailyaggregate"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MoodReason",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("slug", models.SlugField(unique=True)),
+                ("label", models.CharField(max_length=100)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "ordering": ["label"],
+            },
+        ),
+        migrations.AddField(
+            model_name="moodentry",
+            name="custom_reason",
+            field=models.TextField(blank=True, default=""),
+        ),
+        migrations.CreateModel(
+            name="MoodEntryReason",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("mood_value", models.PositiveSmallIntegerField()),
+                ("created_at", models.DateTimeField()),
+                (
+                    "entry",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="reason_links",
+                        to="base.moodentry",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="mood_reason_links",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "reason",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="entry_links",
+                        to="base.moodreason",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="moodentry",
+            name="reasons",
+            field=models.ManyToManyField(
+                blank=True,
+                related_name="mood_entries",
+                through="base.MoodEntryReason",
+                to="base.moodreason",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="moodentryreason",
+            index=models.Index(
+                fields=["reason", "mood_value"], name="mood_reason_value_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="moodentryreason",
+            index=models.Index(
+                fields=["user", "reason", "mood_value"], name="mood_reason_user_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="moodentryreason",
+            constraint=models.UniqueConstraint(
+                fields=("entry", "reason"), name="mood_entry_reason_unique"
+            ),
+        ),
+    ]
@@ -0,0 +1,119 @@
+# Seed the reason vocabulary with the mood tracker's tags and split existing
+# MoodEntry.reason strings ("deadlines, sleep | Custom: ...") into reason
+# links and custom_reason. The parsing is copied here, not imported from
+# base/mood_reasons.py, so later changes there can't alter this migration.
+
+from django.db import migrations
+from django.utils.text import slugify
+
+BATCH_SIZE = 2000
+
+TRACKER_REASONS = [
+    ("work-stress", "Work Stress"),
+    ("academic-pressure", "Academic Pressure"),
+    ("deadlines", "Deadlines"),
+    ("work-success", "Work Success"),
+    ("study-progress", "Study Progress"),
+    ("family", "Family"),
+    ("friends", "Friends"),
+    ("romantic", "Romantic"),
+    ("social-isolation", "Social Isolation"),
+    ("conflict", "Conflict"),
+    ("sleep", "Sleep"),
+    ("exercise", "Exercise"),
+    ("diet", "Diet"),
+    ("illness", "Illness"),
+    ("medication", "Medication"),
+    ("weather", "Weather"),
+    ("hobbies", "Hobbies"),
+    ("travel", "Travel"),
+    ("news", "News"),
+    ("achievement", "Achievement"),
+]
+
+
+def split_reason_text(text):
+    """(tag slugs, custom reason) from a reason string save_mood_api built"""
+    text = text or ""
+    if text.startswith("Custom: "):
+        return [], text[len("Custom: ") :]
+    tags, _, custom = text.partition(" | Custom: ")
+    slugs = [slugify(tag)[:50] for tag in tags.split(", ")]
+    return [slug for slug in dict.fromkeys(slugs) if slug], custom
+
+
+def backfill(apps, schema_editor):
+    MoodReason = apps.get_model("base", "MoodReason")
+    MoodEntry = apps.get_model("base", "MoodEntry")
+    MoodEntryReason = apps.get_model("base", "MoodEntryReason")
+
+    MoodReason.objects.bulk_create(
+        [MoodReason(slug=slug, label=label) for slug, label in TRACKER_REASONS],
+        ignore_conflicts=True,
+    )
+    reason_ids = dict(MoodReason.objects.values_list("slug", "id"))
+
+    entries = (
+        MoodEntry.objects.exclude(reason__isnull=True).exclude(reason="").order_by("id")
+    )
+    last_id = 0
+    while True:
+        batch = list(
+            entries.filter(id__gt=last_id).only(
+                "id", "user_id", "mood_value", "created_at", "reason"
+            )[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        last_id = batch[-1].id
+
+        parsed = [(entry, *split_reason_text(entry.reason)) for entry in batch]
+        new_slugs = {slug for _, slugs, _ in parsed for slug in slugs} - set(reason_ids)
+        if new_slugs:
+            MoodReason.objects.bulk_create(
+                [
+                    MoodReason(slug=slug, label=slug.replace("-", " ").title())
+                    for slug in new_slugs
+                ],
+                ignore_conflicts=True,
+            )
+            reason_ids = dict(MoodReason.objects.values_list("slug", "id"))
+
+        MoodEntryReason.objects.bulk_create(
+            [
+                MoodEntryReason(
+                    entry_id=entry.id,
+                    reason_id=reason_ids[slug],
+                    user_id=entry.user_id,
+                    mood_value=entry.mood_value,
+                    created_at=entry.created_at,
+                )
+                for entry, slugs, _ in parsed
+                for slug in slugs
+            ],
+            ignore_conflicts=True,
+        )
+        customs = []
+        for entry, _, custom in parsed:
+            if custom:
+                entry.custom_reason = custom
+                customs.append(entry)
+        MoodEntry.objects.bulk_update(customs, ["custom_reason"])
+
+
+def clear(apps, schema_editor):
+    apps.get_model("base", "MoodEntryReason").objects.all().delete()
+    apps.get_model("base", "MoodEntry").objects.exclude(custom_reason="").update(
+        custom_reason=""
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("base", "0010_mood_reasons"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, clear),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("base", "0011_backfill_mood_reasons"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="moodentry",
+            index=models.Index(
+                fields=["user", "updated_at"], name="mood_user_updated_idx"
+            ),
+        ),
+    ]
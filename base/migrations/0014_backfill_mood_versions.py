@@ -0,0 +1,38 @@
+# Give existing mood entries a version and every user with entries a
+# MoodSyncState. Versions only need to be unique and increasing per user,
+# so the entry id serves, and each counter starts at the user's highest id.
+
+from django.db import migrations
+from django.db.models import F, Max
+
+BATCH_SIZE = 2000
+
+
+def backfill(apps, schema_editor):
+    MoodEntry = apps.get_model("base", "MoodEntry")
+    MoodSyncState = apps.get_model("base", "MoodSyncState")
+
+    MoodEntry.objects.update(version=F("id"))
+    latest = MoodEntry.objects.values("user_id").annotate(latest=Max("id")).order_by()
+    states = [
+        MoodSyncState(user_id=row["user_id"], version=row["latest"]) for row in latest
+    ]
+    MoodSyncState.objects.bulk_create(
+        states, batch_size=BATCH_SIZE, ignore_conflicts=True
+    )
+
+
+def clear(apps, schema_editor):
+    apps.get_model("base", "MoodSyncState").objects.all().delete()
+    apps.get_model("base", "MoodEntry").objects.update(version=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("base", "0013_mood_delta_sync"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, clear),
+    ]
@@ -0,0 +1,20 @@
+# Without REDIS_URL the default cache is a DatabaseCache (see project/settings.py).
+# Create its table here so every deploy that runs migrate has it.
+
+from django.core.management import call_command
+from django.db import migrations
+
+
+def create_cache_table(apps, schema_editor):
+    call_command("createcachetable", database=schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("base", "0014_backfill_mood_versions"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_table, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,18 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 # Create your models here.
 
 class Institution(models.Model):
     name = models.CharField(max_length=200, unique=True)
+    # AI chat limits; blank uses the CHAT_*_RATE_PER_MINUTE settings
+    chat_user_rate_per_minute = models.PositiveIntegerField(null=True, blank=True)
+    chat_institution_rate_per_minute = models.PositiveIntegerField(null=True, blank=True)
+    # Comma-separated counsellor addresses for crisis alerts; blank uses CRISIS_ALERT_EMAILS
+    crisis_alert_emails = models.TextField(blank=True, default='')
+    # Days AI chat transcripts are kept; blank uses CHAT_TRANSCRIPT_RETENTION_DAYS, 0 stores none
+    transcript_retention_days = models.PositiveIntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
@@ -26,6 +34,18 @@ class UserProfile(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.role} at {self.institution.name}"
 
+class MoodReason(models.Model):
+    """A reason tag students can give for a mood, e.g. 'deadlines'"""
+    slug = models.SlugField(max_length=50, unique=True)
+    label = models.CharField(max_length=100)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['label']
+
+    def __str__(self):
+        return self.label
+
 class MoodEntry(models.Model):
     MOOD_CHOICES = [
         (1, 'Very Unpleasant'),
@@ -40,15 +60,205 @@ class MoodEntry(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='mood_entries')
     mood_value = models.IntegerField(choices=MOOD_CHOICES)
     mood_label = models.CharField(max_length=50)
+    # Display text of the tags and custom reason; the tags themselves are in `reasons`
     reason = models.TextField(blank=True, null=True)
+    reasons = models.ManyToManyField(MoodReason, through='MoodEntryReason', related_name='mood_entries', blank=True)
+    custom_reason = models.TextField(blank=True, default='')
     notes = models.TextField(blank=True, null=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Idempotency key from the client, so a retried offline sync can't duplicate an entry
+    client_id = models.CharField(max_length=64, blank=True, null=True)
+    # When the mood was recorded; synced offline entries keep their client time
+    created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
+    # Per-user change number, raised on every save; /api/mood-changes/ returns entries past a client's version
+    version = models.PositiveBigIntegerField(default=0)
     
     class Meta:
         ordering = ['-created_at']
         verbose_name = 'Mood Entry'
         verbose_name_plural = 'Mood Entries'
+        indexes = [
+            # Serves the paginated history (base/mood_history.py) without a sort
+            models.Index(fields=['user', '-created_at', '-id'], name='mood_user_created_idx'),
+            # Answers the history's ETag aggregate (count, latest updated_at) from the index alone
+            models.Index(fields=['user', 'updated_at'], name='mood_user_updated_idx'),
+            models.Index(fields=['user', 'version'], name='mood_user_version_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'client_id'], condition=models.Q(client_id__isnull=False),
+                                    name='mood_user_client_id_unique'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.mood_label} ({self.created_at.strftime('%Y-%m-%d %H:%M')})"
+
+class MoodSyncState(models.Model):
+    """
+    A user's mood change counter
+
+    Every created, edited or deleted mood entry takes the next version. The
+    row is locked while a user's moods are written, which also puts each
+    user's writes in order (see base/mood_sync.py).
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='mood_sync_state')
+    version = models.PositiveBigIntegerField(default=0)
+    # Tombstones up to this version have been purged; older cursors must sync from scratch
+    purged_version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user_id} at version {self.version}"
+
+class MoodTombstone(models.Model):
+    """A deleted mood entry, kept so delta syncs can tell clients to drop it"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='mood_tombstones')
+    entry_id = models.BigIntegerField()
+    client_id = models.CharField(max_length=64, blank=True, null=True)
+    version = models.PositiveBigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'version'], name='mood_tombstone_version_idx'),
+            models.Index(fields=['deleted_at'], name='mood_tombstone_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} deleted {self.entry_id} at version {self.version}"
+
+class MoodEntryReason(models.Model):
+    """
+    A reason tag on a mood entry
+
+    Carries copies of the entry's user, mood value and time so reason
+    queries ("which reasons go with low moods") are answered from this
+    table's indexes without joining MoodEntry (see base/mood_reasons.py).
+    """
+    entry = models.ForeignKey(MoodEntry, on_delete=models.CASCADE, related_name='reason_links')
+    reason = models.ForeignKey(MoodReason, on_delete=models.PROTECT, related_name='entry_links')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='mood_reason_links')
+    mood_value = models.PositiveSmallIntegerField()
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['entry', 'reason'], name='mood_entry_reason_unique')]
+        indexes = [
+            models.Index(fields=['reason', 'mood_value'], name='mood_reason_value_idx'),
+            models.Index(fields=['user', 'reason', 'mood_value'], name='mood_reason_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.entry_id} - {self.reason_id}"
+
+class MoodDailyAggregate(models.Model):
+    """
+    One day of mood entries, rolled up for one student or one institution
+
+    Student rows have user set; institution rows have institution set and no
+    user. Kept current in the same transaction as every save (see
+    base/mood_rollups.py) and rebuilt from MoodEntry by rebuild_mood_rollups.
+    Days are in TIME_ZONE.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='mood_days')
+    institution = models.ForeignKey(Institution, on_delete=models.CASCADE, null=True, blank=True, related_name='mood_days')
+    day = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    min_value = models.PositiveSmallIntegerField()
+    max_value = models.PositiveSmallIntegerField()
+    # Histogram of mood_value, one column per MOOD_CHOICES value so saves can increment it in SQL
+    value_1 = models.PositiveIntegerField(default=0)
+    value_2 = models.PositiveIntegerField(default=0)
+    value_3 = models.PositiveIntegerField(default=0)
+    value_4 = models.PositiveIntegerField(default=0)
+    value_5 = models.PositiveIntegerField(default=0)
+    value_6 = models.PositiveIntegerField(default=0)
+    value_7 = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['day']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], condition=models.Q(user__isnull=False),
+                                    name='mood_day_user_unique'),
+            models.UniqueConstraint(fields=['institution', 'day'], condition=models.Q(user__isnull=True),
+                                    name='mood_day_institution_unique'),
+        ]
+
+    @property
+    def average(self):
+        return self.total / self.count if self.count else None
+
+    @property
+    def histogram(self):
+        return [getattr(self, f'value_{value}') for value, _ in MoodEntry.MOOD_CHOICES]
+
+    def __str__(self):
+        owner = self.user.username if self.user_id else self.institution.name
+        return f"{owner} - {self.day}: {self.count} entries"
+
+class CrisisAlert(models.Model):
+    """
+    A crisis detected in the AI chat, queued for counsellors
+
+    Rows are written while the chat request is answered and delivered by the
+    process_crisis_alerts worker (see base/crisis_alerts.py).
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='crisis_alerts')
+    institution = models.ForeignKey(Institution, on_delete=models.SET_NULL, null=True, blank=True, related_name='crisis_alerts')
+    conversation_id = models.CharField(max_length=64, blank=True)
+    message = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    recipients = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(default=timezone.now)
+    notified_at = models.DateTimeField(null=True, blank=True)
+    # Milliseconds from detection in the chat to the notification being sent
+    latency_ms = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+
+    def __str__(self):
+        who = self.user.username if self.user else 'anonymous'
+        return f"Crisis alert for {who} ({self.status}, {self.created_at.strftime('%Y-%m-%d %H:%M')})"
+
+class ChatTranscriptTurn(models.Model):
+    """
+    One message of an AI chat conversation
+
+    Written in batches by base/transcripts.py when CHAT_TRANSCRIPTS_ENABLED
+    is on, and removed by purge_chat_transcripts after the institution's
+    retention period.
+    """
+    SENDER_CHOICES = [
+        ('user', 'User'),
+        ('ai', 'AI'),
+    ]
+
+    conversation_id = models.CharField(max_length=64)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='chat_turns')
+    institution = models.ForeignKey(Institution, on_delete=models.CASCADE, null=True, blank=True, related_name='chat_turns')
+    sender = models.CharField(max_length=4, choices=SENDER_CHOICES)
+    content = models.TextField()
+    model = models.CharField(max_length=50, blank=True, default='')
+    safety_flags = models.JSONField(default=list, blank=True)
+    # When the message was sent, not when its batch was written
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+        indexes = [
+            models.Index(fields=['conversation_id', 'created_at']),
+            models.Index(fields=['institution', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.conversation_id} {self.sender}: {self.content[:40]}"
@@ -0,0 +1,215 @@
+"""
+Paginated reads of a user's mood history
+
+Pages are ordered newest first and cut with keyset pagination on
+(created_at, id): the cursor handed to the client is the position of the
+last entry it received, and the next page is "everything strictly older",
+which the (user, created_at, id) index answers without counting or skipping
+rows - page 500 costs the same as page 1. Rows are read with .values(), so
+no MoodEntry instances are built.
+
+Pages carry an ETag from history_validator, so a client whose copy is
+current gets 304 Not Modified without any rows being read.
+
+Clients that keep a full local copy use changes_since instead: every write
+gives the entry (or, for deletes, its tombstone) the user's next version
+number, so "what changed since version N" is a range read on the
+(user, version) indexes and costs only as much as the changes themselves.
+"""
+
+import base64
+import binascii
+import hashlib
+from datetime import datetime, time
+
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import quote_etag
+
+from .models import MoodEntry, MoodSyncState, MoodTombstone
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+DEFAULT_CHANGES_LIMIT = 200
+MAX_CHANGES_LIMIT = 1000
+
+MOOD_HISTORY_FIELDS = ('id', 'mood_value', 'mood_label', 'reason', 'notes', 'created_at', 'updated_at')
+
+
+def encode_cursor(created_at, entry_id):
+    """Opaque cursor for the position of one entry"""
+    return base64.urlsafe_b64encode(f'{created_at.isoformat()}|{entry_id}'.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Return the (created_at, id) position a cursor points at
+
+    Raises:
+        ValueError: The cursor was not made by encode_cursor
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, entry_id = raw.split('|')
+        position = parse_datetime(created_at), int(entry_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+    if position[0] is None:
+        raise ValueError('Invalid cursor')
+    return position
+
+
+def parse_bound(value):
+    """
+    Parse a since/until value: an ISO 8601 datetime, or a date meaning its midnight
+
+    Naive values are in the server's time zone. Raises ValueError when the
+    value is neither.
+    """
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Invalid date: {value}')
+        moment = datetime.combine(day, time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def parse_limit(value, maximum=MAX_PAGE_SIZE):
+    """Parse a page size, capped at `maximum`; raises ValueError when it isn't a positive number"""
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        limit = 0
+    if limit < 1:
+        raise ValueError(f'Invalid limit: {value}')
+    return min(limit, maximum)
+
+
+def parse_version(value):
+    """Parse a ?since= version; raises ValueError when it isn't a whole number >= 0"""
+    try:
+        version = int(value)
+    except (TypeError, ValueError):
+        version = -1
+    if version < 0:
+        raise ValueError(f'Invalid version: {value}')
+    return version
+
+
+def mood_history_page(user, cursor=None, since=None, until=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    One page of a user's mood entries, newest first
+
+    Args:
+        user: Whose entries to read
+        cursor (str): next_cursor from the previous page, or None for the first
+        since (datetime): Only entries created at or after this moment
+        until (datetime): Only entries created before this moment
+        limit (int): Page size, capped at MAX_PAGE_SIZE
+
+    Returns:
+        tuple: (entries as JSON-ready dicts, next_cursor or None on the last page)
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    entries = MoodEntry.objects.filter(user=user)
+    if since is not None:
+        entries = entries.filter(created_at__gte=since)
+    if until is not None:
+        entries = entries.filter(created_at__lt=until)
+    if cursor:
+        created_at, entry_id = decode_cursor(cursor)
+        entries = entries.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=entry_id))
+
+    # One extra row tells us whether another page follows
+    rows = list(entries.order_by('-created_at', '-id').values(*MOOD_HISTORY_FIELDS)[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
+
+    for row in rows:
+        row['created_at'] = row['created_at'].isoformat()
+        row['updated_at'] = row['updated_at'].isoformat()
+    return rows, next_cursor
+
+
+def history_validator(user, params=()):
+    """
+    ETag for a page of a user's history
+
+    It comes from one aggregate over the (user, updated_at) index: the
+    number of entries and the latest updated_at. Saving or editing an entry
+    moves the latest updated_at and deleting one changes the count, so the
+    ETag changes whenever any page could. (The latest updated_at alone
+    can't see deletes of older entries, so it is not offered as
+    Last-Modified.)
+
+    Args:
+        params: The request's query parameters, which pick the page
+    """
+    state = MoodEntry.objects.filter(user=user).aggregate(count=Count('id'), latest=Max('updated_at'))
+    latest = state['latest']
+    page = '&'.join(f'{key}={value}' for key, value in sorted(params))
+    version = f"{user.pk}|{state['count']}|{latest.isoformat() if latest else ''}|{page}"
+    return quote_etag(hashlib.blake2b(version.encode(), digest_size=12).hexdigest())
+
+
+def changes_since(user, since=0, limit=DEFAULT_CHANGES_LIMIT):
+    """
+    Entries saved and entries deleted after version `since`, oldest change first
+
+    Args:
+        user: Whose entries to read
+        since (int): The version the client holds; 0 for everything
+        limit (int): Most changes to return, capped at MAX_CHANGES_LIMIT
+
+    Returns:
+        dict: 'changes' (entries as JSON-ready dicts, with version and
+        client_id), 'deleted' ({'id', 'client_id', 'version'} per deleted
+        entry), 'version' (the cursor to send as since next time), 'has_more'
+        and 'reset'. When reset is true the tombstones the client needed were
+        purged: it must drop its copy and sync again from version 0.
+    """
+    limit = max(1, min(limit, MAX_CHANGES_LIMIT))
+    state = MoodSyncState.objects.filter(user=user).values('version', 'purged_version').first()
+    current, purged = (state['version'], state['purged_version']) if state else (0, 0)
+    # A client starting from 0 holds nothing the purged tombstones could have removed
+    if 0 < since < purged:
+        return {'changes': [], 'deleted': [], 'version': 0, 'has_more': False, 'reset': True}
+
+    # limit + 1 of each is enough to fill the page and tell whether more follow
+    rows = list(
+        MoodEntry.objects.filter(user=user, version__gt=since)
+        .order_by('version').values(*MOOD_HISTORY_FIELDS, 'version', 'client_id')[:limit + 1]
+    )
+    tombstones = list(
+        MoodTombstone.objects.filter(user=user, version__gt=since)
+        .order_by('version').values('entry_id', 'client_id', 'version')[:limit + 1]
+    )
+    merged = sorted([(row['version'], row, None) for row in rows] +
+                    [(tombstone['version'], None, tombstone) for tombstone in tombstones],
+                    key=lambda change: change[0])
+    has_more = len(merged) > limit
+    merged = merged[:limit]
+
+    changes, deleted = [], []
+    for _, row, tombstone in merged:
+        if row is not None:
+            row['created_at'] = row['created_at'].isoformat()
+            row['updated_at'] = row['updated_at'].isoformat()
+            changes.append(row)
+        else:
+            deleted.append({'id': tombstone['entry_id'], 'client_id': tombstone['client_id'],
+                            'version': tombstone['version']})
+    return {
+        'changes': changes,
+        'deleted': deleted,
+        # A write committed after the counter was read may already be in merged
+        'version': merged[-1][0] if has_more else max(current, since, merged[-1][0] if merged else 0),
+        'has_more': has_more,
+        'reset': False,
+    }
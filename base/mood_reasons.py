@@ -0,0 +1,111 @@
+"""
+Normalized mood reasons
+
+The tags a student picks for a mood ('deadlines', 'sleep', ...) are stored
+as MoodEntryReason rows pointing at the MoodReason vocabulary; the custom
+reason goes to MoodEntry.custom_reason. MoodEntry.reason keeps the combined
+display text for the history views.
+
+Each link row carries the entry's user, mood value and time, so questions
+like "which reasons go with low moods" are a GROUP BY over the link table's
+(reason, mood_value) or (user, reason, mood_value) index - no LIKE scans of
+reason text and no join to MoodEntry. Tags the vocabulary doesn't know yet
+are added on first use, up to MAX_VOCABULARY; past that, unknown tags are
+kept only in the display text.
+"""
+
+import logging
+
+from django.db.models import Avg, Count, Q
+from django.utils.text import slugify
+
+from .models import MoodEntryReason, MoodReason
+
+logger = logging.getLogger(__name__)
+
+# Mood values at or below this count as low in reason summaries
+LOW_MOOD_VALUE = 3
+# The tracker offers a few dozen tags; this only stops clients growing the
+# vocabulary (and the institution charts) without bound
+MAX_VOCABULARY = 500
+
+
+def reason_slugs(reasons):
+    """Vocabulary slugs for the reasons a client sent, deduplicated, in order"""
+    slugs = [slugify(str(reason))[:50] for reason in reasons or []]
+    return [slug for slug in dict.fromkeys(slugs) if slug]
+
+
+def reason_ids(slugs):
+    """Map slugs to MoodReason ids, adding any the vocabulary lacks while it has room"""
+    slugs = set(slugs)
+    if not slugs:
+        return {}
+    ids = dict(MoodReason.objects.filter(slug__in=slugs).values_list('slug', 'id'))
+    missing = slugs - set(ids)
+    if missing:
+        added = sorted(missing)[:max(MAX_VOCABULARY - MoodReason.objects.count(), 0)]
+        if len(added) < len(missing):
+            logger.warning(f"Mood reason vocabulary is full; not adding {len(missing) - len(added)} tag(s)")
+        if added:
+            MoodReason.objects.bulk_create(
+                [MoodReason(slug=slug, label=slug.replace('-', ' ').title()) for slug in added],
+                ignore_conflicts=True,
+            )
+            ids = dict(MoodReason.objects.filter(slug__in=slugs).values_list('slug', 'id'))
+    return ids
+
+
+def link_reasons(entry_reasons):
+    """
+    Store the reason tags of saved entries in one INSERT
+
+    Args:
+        entry_reasons: (MoodEntry with pk set, list of slugs) pairs
+    """
+    ids = reason_ids(slug for _, slugs in entry_reasons for slug in slugs)
+    MoodEntryReason.objects.bulk_create([
+        MoodEntryReason(entry_id=entry.pk, reason_id=ids[slug], user_id=entry.user_id,
+                        mood_value=entry.mood_value, created_at=entry.created_at)
+        for entry, slugs in entry_reasons
+        for slug in slugs
+        if slug in ids
+    ], ignore_conflicts=True)
+
+
+def reason_summary(user=None, institution=None, since=None):
+    """
+    How often each reason was given and how moods went with it, most used first
+
+    Pass a user for one student, or an institution for all its students.
+    Returns a list of {'reason', 'label', 'entries', 'average_mood',
+    'low_entries', 'low_share'} dicts; low means mood value <= LOW_MOOD_VALUE.
+    """
+    links = MoodEntryReason.objects.all()
+    if user is not None:
+        links = links.filter(user=user)
+    elif institution is not None:
+        links = links.filter(user__userprofile__institution=institution)
+    if since is not None:
+        links = links.filter(created_at__gte=since)
+
+    rows = list(
+        links.values('reason_id')
+        .annotate(entries=Count('id'), average_mood=Avg('mood_value'),
+                  low_entries=Count('id', filter=Q(mood_value__lte=LOW_MOOD_VALUE)))
+        .order_by('-entries', 'reason_id')
+    )
+    # The vocabulary is small; name the reasons after grouping rather than grouping on a join
+    names = {pk: (slug, label) for pk, slug, label in
+             MoodReason.objects.filter(pk__in=[row['reason_id'] for row in rows]).values_list('pk', 'slug', 'label')}
+    return [
+        {
+            'reason': names[row['reason_id']][0],
+            'label': names[row['reason_id']][1],
+            'entries': row['entries'],
+            'average_mood': round(row['average_mood'], 2),
+            'low_entries': row['low_entries'],
+            'low_share': round(row['low_entries'] / row['entries'], 3),
+        }
+        for row in rows
+    ]
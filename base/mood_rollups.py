@@ -0,0 +1,185 @@
+"""
+Daily mood rollups, kept current as moods are saved
+
+Every save adds its entries to MoodDailyAggregate inside the same
+transaction: one row per student per day, and one per institution per day,
+each holding count, sum, min, max and a histogram of mood values. Trend
+charts read those rows - one per day - instead of every MoodEntry.
+
+Updates are single UPDATE statements with F()/Least/Greatest expressions, so
+concurrent saves to the same day add up instead of overwriting each other;
+the first save of a day inserts the row (and falls back to the UPDATE if
+another save inserted it first). Deletes subtract the same way and work out
+the new min and max from the histogram in the same statement. Institution
+rows follow the student's institution at save time; rebuild_mood_rollups
+recomputes everything from MoodEntry with the current profiles.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, Max, Min, PositiveSmallIntegerField, Q, Sum, Value, When
+from django.db.models.functions import Greatest, Least, TruncDate
+from django.db.models.lookups import GreaterThan
+from django.utils import timezone
+
+from .models import MoodDailyAggregate, MoodEntry, UserProfile
+
+MOOD_VALUES = [value for value, _ in MoodEntry.MOOD_CHOICES]
+ROLLUP_FIELDS = ('day', 'count', 'total', 'min_value', 'max_value', *(f'value_{value}' for value in MOOD_VALUES))
+DEFAULT_TREND_DAYS = 90
+MAX_TREND_DAYS = 730
+REBUILD_BATCH_SIZE = 1000
+
+
+def _new_delta():
+    return {'count': 0, 'total': 0, 'min_value': max(MOOD_VALUES), 'max_value': min(MOOD_VALUES),
+            **{f'value_{value}': 0 for value in MOOD_VALUES}}
+
+
+def _apply(scope, day, delta):
+    """Add one day's delta to a rollup row, creating the row if needed"""
+    rows = MoodDailyAggregate.objects.filter(day=day, **scope)
+    updates = {
+        'count': F('count') + delta['count'],
+        'total': F('total') + delta['total'],
+        'min_value': Least('min_value', delta['min_value']),
+        'max_value': Greatest('max_value', delta['max_value']),
+    }
+    for value in MOOD_VALUES:
+        if delta[f'value_{value}']:
+            updates[f'value_{value}'] = F(f'value_{value}') + delta[f'value_{value}']
+
+    if rows.update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            MoodDailyAggregate.objects.create(day=day, **scope, **delta)
+    except IntegrityError:
+        # Another save created the row between our UPDATE and INSERT
+        rows.update(**updates)
+
+
+def _deltas(user, entries):
+    """(scope, day, delta) for the user's and their institution's rows the entries fall in"""
+    if not entries:
+        return []
+    institution_id = UserProfile.objects.filter(user=user).values_list('institution_id', flat=True).first()
+    scopes = [{'user_id': user.pk}]
+    if institution_id:
+        scopes.append({'user_id': None, 'institution_id': institution_id})
+
+    deltas = defaultdict(_new_delta)
+    for entry in entries:
+        delta = deltas[timezone.localdate(entry.created_at)]
+        delta['count'] += 1
+        delta['total'] += entry.mood_value
+        delta['min_value'] = min(delta['min_value'], entry.mood_value)
+        delta['max_value'] = max(delta['max_value'], entry.mood_value)
+        delta[f'value_{entry.mood_value}'] += 1
+    return [(scope, day, delta) for day, delta in sorted(deltas.items()) for scope in scopes]
+
+
+def add_entries(user, entries):
+    """
+    Add newly saved entries to the user's and their institution's rollups
+
+    Call inside the transaction that saved the entries, so the rollups
+    commit or roll back with them.
+    """
+    for scope, day, delta in _deltas(user, entries):
+        _apply(scope, day, delta)
+
+
+def remove_entries(user, entries):
+    """
+    Take entries that are about to be deleted (or changed) out of the rollups
+
+    Call inside the transaction that deletes them. Days left without entries
+    lose their row.
+    """
+    for scope, day, delta in _deltas(user, entries):
+        rows = MoodDailyAggregate.objects.filter(day=day, **scope)
+        remaining = {value: F(f'value_{value}') - delta[f'value_{value}'] for value in MOOD_VALUES}
+        # Every expression reads the row as it was before this UPDATE
+        rows.update(
+            count=F('count') - delta['count'],
+            total=F('total') - delta['total'],
+            min_value=Case(*[When(GreaterThan(remaining[value], 0), then=Value(value)) for value in MOOD_VALUES],
+                           default=F('min_value'), output_field=PositiveSmallIntegerField()),
+            max_value=Case(*[When(GreaterThan(remaining[value], 0), then=Value(value))
+                             for value in reversed(MOOD_VALUES)],
+                           default=F('max_value'), output_field=PositiveSmallIntegerField()),
+            **{f'value_{value}': remaining[value] for value in MOOD_VALUES if delta[f'value_{value}']},
+        )
+        rows.filter(count=0).delete()
+
+
+def _daily_totals(entries, group_by):
+    return (
+        entries.annotate(day=TruncDate('created_at'))
+        .values(group_by, 'day')
+        .annotate(
+            count=Count('id'),
+            total=Sum('mood_value'),
+            min_value=Min('mood_value'),
+            max_value=Max('mood_value'),
+            **{f'value_{value}': Count('id', filter=Q(mood_value=value)) for value in MOOD_VALUES},
+        )
+        .order_by()
+    )
+
+
+def rebuild_rollups():
+    """
+    Recompute every rollup from MoodEntry, grouping in the database
+
+    Returns the number of rollup rows written.
+    """
+    written = 0
+    with transaction.atomic():
+        MoodDailyAggregate.objects.all().delete()
+        groups = [
+            ('user_id', _daily_totals(MoodEntry.objects.all(), 'user_id'), lambda key: {'user_id': key}),
+            ('user__userprofile__institution_id',
+             _daily_totals(MoodEntry.objects.filter(user__userprofile__isnull=False), 'user__userprofile__institution_id'),
+             lambda key: {'institution_id': key}),
+        ]
+        for group_by, totals, scope in groups:
+            batch = []
+            for row in totals.iterator(chunk_size=REBUILD_BATCH_SIZE):
+                key = row.pop(group_by)
+                batch.append(MoodDailyAggregate(**scope(key), **row))
+                if len(batch) >= REBUILD_BATCH_SIZE:
+                    written += len(MoodDailyAggregate.objects.bulk_create(batch))
+                    batch = []
+            written += len(MoodDailyAggregate.objects.bulk_create(batch))
+    return written
+
+
+def daily_trend(user=None, institution=None, days=DEFAULT_TREND_DAYS):
+    """
+    The last `days` days of rollups for a student or an institution, oldest first
+
+    Days without entries are left out. Each row is a JSON-ready dict with the
+    rollup columns plus average and histogram.
+    """
+    days = max(1, min(days, MAX_TREND_DAYS))
+    start = timezone.localdate() - timedelta(days=days - 1)
+    if user is not None:
+        rows = MoodDailyAggregate.objects.filter(user=user)
+    else:
+        rows = MoodDailyAggregate.objects.filter(user__isnull=True, institution=institution)
+
+    trend = []
+    for row in rows.filter(day__gte=start).order_by('day').values(*ROLLUP_FIELDS):
+        trend.append({
+            'day': row['day'].isoformat(),
+            'count': row['count'],
+            'average': round(row['total'] / row['count'], 2),
+            'min_value': row['min_value'],
+            'max_value': row['max_value'],
+            'histogram': [row[f'value_{value}'] for value in MOOD_VALUES],
+        })
+    return trend
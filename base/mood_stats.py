@@ -0,0 +1,260 @@
+"""
+Mood statistics computed with NumPy
+
+A student's (or a whole institution's) entries are read once with
+values_list into three arrays - local day, time and mood value - and every
+statistic is computed from those with array operations: no MoodEntry
+instances and no per-entry Python loops. The institution variant keeps a
+student index per entry and computes each student's figures for all
+students at once with bincount/maximum.at, so a thousand students cost a
+handful of array passes, not a thousand queries.
+
+Statistics:
+    average, volatility (standard deviation) and mean_abs_change (mean
+    absolute change between consecutive entries)
+    slope_per_week: least-squares trend of mood value over time, per week
+    current_streak / longest_streak: consecutive days with at least one entry;
+        the current streak is still alive if the last entry was today or yesterday
+    current_low_streak / longest_low_streak: consecutive logged days whose
+        average is at or below LOW_MOOD_THRESHOLD
+    day_of_week: average and count per weekday, Monday first
+    moving_average: trailing MOVING_AVERAGE_DAYS-day average per calendar day
+        (single student, or the institution as a whole)
+"""
+
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .models import MoodEntry
+
+DEFAULT_STATS_DAYS = 90
+MAX_STATS_DAYS = 730
+MOVING_AVERAGE_DAYS = 7
+LOW_MOOD_THRESHOLD = 3
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+_EPOCH = date(1970, 1, 1)
+
+
+def load_entries(entries):
+    """
+    Read (group, day, time, value) arrays from a MoodEntry queryset
+
+    group is the user id, day the local date as days since 1970-01-01, time
+    the creation time in days since 1970-01-01 (fractional).
+    """
+    rows = entries.order_by().values_list('user_id', 'created_at', 'mood_value')
+    user_ids, created, values = zip(*rows) if rows else ((), (), ())
+    count = len(values)
+    seconds = np.fromiter((moment.timestamp() for moment in created), np.float64, count)
+
+    # UTC offsets change on the hour, so look them up once per distinct hour, not per entry
+    hours, hour_of_entry = np.unique(seconds // 3600, return_inverse=True)
+    zone = timezone.get_current_timezone()
+    offsets = np.fromiter(
+        (datetime.fromtimestamp(hour * 3600, zone).utcoffset().total_seconds() for hour in hours.tolist()),
+        np.float64, len(hours),
+    )
+    return (
+        np.fromiter(user_ids, np.int64, count),
+        ((seconds + offsets[hour_of_entry]) // 86400).astype(np.int64),
+        seconds / 86400,
+        np.fromiter(values, np.float64, count),
+    )
+
+
+def _last_of_each_group(groups):
+    """Index of the last element of each group in a group-sorted array"""
+    return np.append(np.flatnonzero(groups[1:] != groups[:-1]), len(groups) - 1)
+
+
+def grouped_stats(groups, days, times, values, today):
+    """
+    Per-group statistics for every group at once
+
+    Args:
+        groups, days, times, values: Arrays from load_entries (any order)
+        today (int): Today as days since 1970-01-01
+
+    Returns:
+        dict: 'group' (the sorted group ids) and one array per statistic,
+        aligned with it; day_of_week_average/count have shape (groups, 7)
+    """
+    order = np.lexsort((times, groups))
+    groups, days, times, values = groups[order], days[order], times[order], values[order]
+    group_ids, g = np.unique(groups, return_inverse=True)
+    n_groups = len(group_ids)
+
+    counts = np.bincount(g, minlength=n_groups).astype(np.float64)
+    sums = np.bincount(g, weights=values, minlength=n_groups)
+    average = sums / counts
+    squares = np.bincount(g, weights=values * values, minlength=n_groups)
+    volatility = np.sqrt(np.maximum(squares / counts - average ** 2, 0))
+
+    # Consecutive entries of the same student
+    same = g[1:] == g[:-1]
+    change = np.abs(np.diff(values))[same]
+    changes = np.bincount(g[1:][same], minlength=n_groups)
+    change_sums = np.bincount(g[1:][same], weights=change, minlength=n_groups)
+    mean_abs_change = np.divide(change_sums, changes, out=np.zeros(n_groups), where=changes > 0)
+
+    # Least-squares slope from per-group sums, relative to each group's first entry
+    x = times - times[np.searchsorted(g, g)]
+    sx = np.bincount(g, weights=x, minlength=n_groups)
+    sxx = np.bincount(g, weights=x * x, minlength=n_groups)
+    sxy = np.bincount(g, weights=x * values, minlength=n_groups)
+    variance = sxx / counts - (sx / counts) ** 2
+    covariance = sxy / counts - sx * sums / counts ** 2
+    slope = np.divide(covariance, variance, out=np.zeros(n_groups), where=variance > 1e-9)
+
+    # Monday is 0; 1970-01-01 was a Thursday
+    weekday = (days + 3) % 7
+    cells = g * 7 + weekday
+    weekday_counts = np.bincount(cells, minlength=n_groups * 7).reshape(n_groups, 7)
+    weekday_sums = np.bincount(cells, weights=values, minlength=n_groups * 7).reshape(n_groups, 7)
+    weekday_average = np.divide(weekday_sums, weekday_counts, out=np.full((n_groups, 7), np.nan),
+                                where=weekday_counts > 0)
+
+    # One element per (group, logged day), in order
+    span = int(days.max() - days.min()) + 1
+    keys, day_of_entry = np.unique(g * span + (days - days.min()), return_inverse=True)
+    day_group, day = keys // span, keys % span + days.min()
+    day_average = np.bincount(day_of_entry, weights=values) / np.bincount(day_of_entry)
+    last = _last_of_each_group(day_group)
+    new_group = np.ones(len(keys), dtype=bool)
+    new_group[1:] = day_group[1:] != day_group[:-1]
+
+    # Runs of calendar-consecutive logged days
+    starts = new_group.copy()
+    starts[1:] |= np.diff(day) != 1
+    run = np.cumsum(starts) - 1
+    lengths = np.bincount(run)
+    longest_streak = np.zeros(n_groups, dtype=np.int64)
+    np.maximum.at(longest_streak, day_group[starts], lengths)
+    current_streak = np.where(day[last] >= today - 1, lengths[run[last]], 0)
+
+    # Runs of consecutive logged days at or below the low-mood threshold
+    low = day_average <= LOW_MOOD_THRESHOLD
+    starts = new_group.copy()
+    starts[1:] |= low[1:] != low[:-1]
+    run = np.cumsum(starts) - 1
+    lengths = np.bincount(run) * low[starts]
+    longest_low_streak = np.zeros(n_groups, dtype=np.int64)
+    np.maximum.at(longest_low_streak, day_group[starts], lengths)
+    current_low_streak = lengths[run[last]]
+
+    return {
+        'group': group_ids,
+        'count': counts.astype(np.int64),
+        'average': average,
+        'volatility': volatility,
+        'mean_abs_change': mean_abs_change,
+        'slope_per_week': slope * 7,
+        'current_streak': current_streak,
+        'longest_streak': longest_streak,
+        'current_low_streak': current_low_streak,
+        'longest_low_streak': longest_low_streak,
+        'last_day': day[last],
+        'day_of_week_average': weekday_average,
+        'day_of_week_count': weekday_counts,
+    }
+
+
+def moving_average(days, values, first_day, today, window=MOVING_AVERAGE_DAYS):
+    """
+    Trailing `window`-day average for each calendar day from first_day to today
+
+    Days with no entries in their window are left out. Returns a list of
+    {'day', 'average', 'count'} dicts.
+    """
+    length = today - first_day + 1
+    index = days - first_day
+    sums = np.concatenate(([0.0], np.cumsum(np.bincount(index, weights=values, minlength=length))))
+    counts = np.concatenate(([0], np.cumsum(np.bincount(index, minlength=length))))
+    end = np.arange(1, length + 1)
+    start = np.maximum(end - window, 0)
+    window_sums, window_counts = sums[end] - sums[start], counts[end] - counts[start]
+
+    return [
+        {
+            'day': (_EPOCH + timedelta(days=int(first_day + i))).isoformat(),
+            'average': round(float(window_sums[i] / window_counts[i]), 2),
+            'count': int(window_counts[i]),
+        }
+        for i in np.flatnonzero(window_counts)
+    ]
+
+
+def _summary(stats, i):
+    """JSON-ready statistics of group i"""
+    return {
+        'entries': int(stats['count'][i]),
+        'average': round(float(stats['average'][i]), 2),
+        'volatility': round(float(stats['volatility'][i]), 2),
+        'mean_abs_change': round(float(stats['mean_abs_change'][i]), 2),
+        'slope_per_week': round(float(stats['slope_per_week'][i]), 3),
+        'current_streak': int(stats['current_streak'][i]),
+        'longest_streak': int(stats['longest_streak'][i]),
+        'current_low_streak': int(stats['current_low_streak'][i]),
+        'longest_low_streak': int(stats['longest_low_streak'][i]),
+        'last_entry_day': (_EPOCH + timedelta(days=int(stats['last_day'][i]))).isoformat(),
+        'day_of_week': [
+            {
+                'day': name,
+                'average': None if np.isnan(average) else round(float(average), 2),
+                'count': int(count),
+            }
+            for name, average, count in zip(WEEKDAYS, stats['day_of_week_average'][i], stats['day_of_week_count'][i])
+        ],
+    }
+
+
+def _window(days):
+    days = max(1, min(days, MAX_STATS_DAYS))
+    today = timezone.localdate()
+    first = today - timedelta(days=days - 1)
+    since = timezone.make_aware(datetime.combine(first, time.min))
+    return (today - _EPOCH).days, (first - _EPOCH).days, since
+
+
+def user_mood_stats(user, days=DEFAULT_STATS_DAYS):
+    """
+    Statistics over one student's last `days` days, or None without entries
+    """
+    today, first_day, since = _window(days)
+    groups, entry_days, times, values = load_entries(MoodEntry.objects.filter(user=user, created_at__gte=since))
+    if not len(values):
+        return None
+    stats = grouped_stats(groups, entry_days, times, values, today)
+    return {**_summary(stats, 0), 'moving_average': moving_average(entry_days, values, first_day, today)}
+
+
+def institution_mood_stats(institution, days=DEFAULT_STATS_DAYS):
+    """
+    Statistics for a whole institution over its last `days` days
+
+    Returns None without entries, else {'overall': the institution's entries
+    taken together (with moving_average), 'students': [per-student
+    statistics with user_id and username]}.
+    """
+    today, first_day, since = _window(days)
+    entries = MoodEntry.objects.filter(user__userprofile__institution=institution, created_at__gte=since)
+    groups, entry_days, times, values = load_entries(entries)
+    if not len(values):
+        return None
+
+    per_student = grouped_stats(groups, entry_days, times, values, today)
+    overall = grouped_stats(np.zeros_like(groups), entry_days, times, values, today)
+    usernames = dict(
+        User.objects.filter(pk__in=per_student['group'].tolist()).values_list('pk', 'username')
+    )
+    return {
+        'overall': {**_summary(overall, 0), 'moving_average': moving_average(entry_days, values, first_day, today)},
+        'students': [
+            {'user_id': int(user_id), 'username': usernames.get(int(user_id), ''), **_summary(per_student, i)}
+            for i, user_id in enumerate(per_student['group'])
+        ],
+    }
@@ -0,0 +1,284 @@
+"""
+Saving and deleting mood entries, one at a time or in offline-queued batches
+
+The mood tracker keeps entries it could not save in a local queue and sends
+the whole backlog to /api/sync-moods/ in one request. Every queued entry
+carries a client_id (a UUID made when the mood was recorded) and its
+original timestamp. The batch is inserted with one bulk_create in one
+transaction; client_ids the user already synced are skipped, so a retry
+after a lost response never duplicates entries. The (user, client_id) unique
+constraint backs this up.
+
+Every write locks the user's MoodSyncState row, so a user's writes run one
+at a time: the daily rollups (base/mood_rollups.py) count each new entry
+exactly once, in the same transaction, and each created, edited or deleted
+entry takes the next number from the row's version counter. Deletes leave a
+MoodTombstone with that version. /api/mood-changes/ (changes_since in
+base/mood_history.py) hands clients everything past the version they hold.
+"""
+
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import mood_reasons, mood_rollups
+from .models import MoodEntry, MoodEntryReason, MoodSyncState, MoodTombstone
+
+MAX_SYNC_ENTRIES = 500
+# Reason tags per entry; the tracker offers 20
+MAX_REASONS = 50
+# Client clocks may run a little ahead of ours; later timestamps are refused
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+
+# How long tombstones are kept; clients that stay away longer resync from scratch
+DEFAULT_TOMBSTONE_DAYS = 90
+
+MOOD_LABELS = dict(MoodEntry.MOOD_CHOICES)
+
+
+def reason_text(reasons, custom_reason):
+    """Combine the selected reason tags and the custom reason into MoodEntry.reason"""
+    text = ''
+    if reasons:
+        text += ', '.join(reasons)
+    if custom_reason:
+        if text:
+            text += f' | Custom: {custom_reason}'
+        else:
+            text = f'Custom: {custom_reason}'
+    return text
+
+
+def _lock_versions(user):
+    """Lock (creating it if needed) the user's version counter until the transaction ends"""
+    state, _ = MoodSyncState.objects.select_for_update().get_or_create(user_id=user.pk)
+    return state
+
+
+def _claim_versions(state, count):
+    """Reserve `count` versions; returns the first"""
+    state.version += count
+    MoodSyncState.objects.filter(pk=state.pk).update(version=state.version)
+    return state.version - count + 1
+
+
+def save_entry(user, fields, client_id=None, reasons=()):
+    """
+    Save one mood entry with its reason tags (slugs) and add it to the rollups
+
+    A client_id the user already saved (a resend after a lost response)
+    returns the first save instead. Returns (entry, created).
+    """
+    with transaction.atomic():
+        state = _lock_versions(user)
+        if client_id:
+            entry = MoodEntry.objects.filter(user=user, client_id=client_id).first()
+            if entry is not None:
+                return entry, False
+        entry = MoodEntry.objects.create(user=user, client_id=client_id, version=_claim_versions(state, 1), **fields)
+        mood_reasons.link_reasons([(entry, reasons)])
+        mood_rollups.add_entries(user, [entry])
+    return entry, True
+
+
+def parse_mood(mood):
+    """
+    Validate a {'value', 'label'} mood object and return (value, label)
+
+    Raises:
+        ValueError: The value isn't one of the 1-7 choices or the label is missing
+    """
+    mood_value = mood.get('value') if isinstance(mood, dict) else None
+    mood_label = mood.get('label') if isinstance(mood, dict) else None
+    # bool and float compare equal to valid choices but aren't mood values
+    if type(mood_value) is not int or mood_value not in MOOD_LABELS or not isinstance(mood_label, str) or not mood_label:
+        raise ValueError('Mood value (1-7) and label are required')
+    return mood_value, mood_label
+
+
+def parse_reasons(reasons):
+    """
+    Validate the reason tags sent with an entry and return them as a list
+
+    Raises:
+        ValueError: They aren't a list of strings, or there are too many
+    """
+    if reasons is None:
+        return []
+    if not isinstance(reasons, list) or not all(isinstance(reason, str) for reason in reasons):
+        raise ValueError('reasons must be a list of strings')
+    if len(reasons) > MAX_REASONS:
+        raise ValueError(f'At most {MAX_REASONS} reasons per entry')
+    return reasons
+
+
+def parse_entry(item, now):
+    """
+    Validate one queued entry and return (its MoodEntry fields, its reason slugs)
+
+    Raises:
+        ValueError: The entry is malformed; the message says why
+    """
+    if not isinstance(item, dict):
+        raise ValueError('Entry must be an object')
+
+    client_id = item.get('client_id')
+    if not isinstance(client_id, str) or not 0 < len(client_id) <= 64:
+        raise ValueError('client_id must be a string of 1-64 characters')
+
+    mood_value, mood_label = parse_mood(item.get('mood'))
+
+    timestamp = item.get('timestamp')
+    created_at = parse_datetime(timestamp) if isinstance(timestamp, str) else None
+    if created_at is None:
+        raise ValueError('timestamp must be an ISO 8601 datetime')
+    if timezone.is_naive(created_at):
+        created_at = timezone.make_aware(created_at)
+    if created_at > now + MAX_CLOCK_SKEW:
+        raise ValueError('timestamp is in the future')
+
+    reasons = parse_reasons(item.get('reasons'))
+    custom_reason = str(item.get('customReason') or '')
+    return {
+        'client_id': client_id,
+        'mood_value': mood_value,
+        'mood_label': mood_label[:50],
+        'reason': reason_text(reasons, custom_reason),
+        'custom_reason': custom_reason,
+        'created_at': min(created_at, now),
+    }, mood_reasons.reason_slugs(reasons)
+
+
+def sync_entries(user, items):
+    """
+    Save a batch of queued entries for a user
+
+    Returns:
+        tuple: (results, errors). results has one
+        {'client_id', 'mood_id', 'status'} per valid entry, in order, with
+        status 'created' or 'duplicate'; errors has one
+        {'index', 'client_id', 'error'} per invalid entry. Clients can drop
+        both from their queue - invalid entries won't succeed on retry.
+    """
+    now = timezone.now()
+    valid, errors = [], []
+    for index, item in enumerate(items):
+        try:
+            valid.append(parse_entry(item, now))
+        except ValueError as e:
+            client_id = item.get('client_id') if isinstance(item, dict) else None
+            errors.append({'index': index, 'client_id': client_id, 'error': str(e)})
+
+    # The first copy of a client_id repeated within the batch wins
+    unique = {}
+    for fields, slugs in valid:
+        unique.setdefault(fields['client_id'], (fields, slugs))
+
+    with transaction.atomic():
+        state = _lock_versions(user)
+        synced = MoodEntry.objects.filter(user=user, client_id__in=list(unique)).order_by()
+        existing = set(synced.values_list('client_id', flat=True))
+        new_entries = [
+            (MoodEntry(user=user, **fields), slugs)
+            for client_id, (fields, slugs) in unique.items() if client_id not in existing
+        ]
+        first_version = _claim_versions(state, len(new_entries))
+        for offset, (entry, _) in enumerate(new_entries):
+            entry.version = first_version + offset
+        MoodEntry.objects.bulk_create([entry for entry, _ in new_entries], ignore_conflicts=True)
+        # ignore_conflicts leaves primary keys unset, so read them back
+        mood_ids = dict(synced.values_list('client_id', 'id'))
+        for entry, _ in new_entries:
+            entry.pk = mood_ids[entry.client_id]
+        mood_reasons.link_reasons(new_entries)
+        mood_rollups.add_entries(user, [entry for entry, _ in new_entries])
+
+    results = []
+    created = set()
+    for fields, _ in valid:
+        client_id = fields['client_id']
+        is_new = client_id not in existing and client_id not in created
+        created.add(client_id)
+        results.append({
+            'client_id': client_id,
+            'mood_id': mood_ids.get(client_id),
+            'status': 'created' if is_new else 'duplicate',
+        })
+    return results, errors
+
+
+def delete_entries(entries):
+    """
+    Delete mood entries, leaving tombstones and taking them out of the rollups
+
+    Entries may belong to several users; each user's are deleted under their
+    version lock. Returns the number deleted.
+    """
+    by_user = {}
+    for entry in entries:
+        by_user.setdefault(entry.user_id, []).append(entry)
+
+    deleted = 0
+    with transaction.atomic():
+        for user_entries in by_user.values():
+            user = user_entries[0].user
+            state = _lock_versions(user)
+            # Re-read under the lock: another request may have deleted some already
+            current = list(MoodEntry.objects.filter(pk__in=[entry.pk for entry in user_entries]))
+            if not current:
+                continue
+            first_version = _claim_versions(state, len(current))
+            MoodTombstone.objects.bulk_create([
+                MoodTombstone(user_id=user.pk, entry_id=entry.pk, client_id=entry.client_id,
+                              version=first_version + offset)
+                for offset, entry in enumerate(current)
+            ])
+            mood_rollups.remove_entries(user, current)
+            MoodEntry.objects.filter(pk__in=[entry.pk for entry in current]).delete()
+            deleted += len(current)
+    return deleted
+
+
+def save_edited_entry(entry):
+    """
+    Save an entry added or changed outside the mood APIs (the admin)
+
+    Gives it a new version and moves it in the rollups and reason links. If
+    it moved to another user, the old user gets a tombstone for it.
+    """
+    with transaction.atomic():
+        if entry.pk:
+            old = MoodEntry.objects.select_related('user').filter(pk=entry.pk).first()
+            if old is not None:
+                old_state = _lock_versions(old.user)
+                mood_rollups.remove_entries(old.user, [old])
+                if old.user_id != entry.user_id:
+                    MoodTombstone.objects.create(user_id=old.user_id, entry_id=old.pk, client_id=old.client_id,
+                                                 version=_claim_versions(old_state, 1))
+        state = _lock_versions(entry.user)
+        entry.version = _claim_versions(state, 1)
+        entry.save()
+        MoodEntryReason.objects.filter(entry=entry).update(
+            user=entry.user, mood_value=entry.mood_value, created_at=entry.created_at
+        )
+        mood_rollups.add_entries(entry.user, [entry])
+
+
+def purge_tombstones(days=DEFAULT_TOMBSTONE_DAYS):
+    """
+    Delete tombstones older than `days` days
+
+    Each affected user's purged_version is raised to their newest purged
+    tombstone, so clients holding an older version are told to resync.
+    Returns the number of tombstones deleted.
+    """
+    old = MoodTombstone.objects.filter(deleted_at__lt=timezone.now() - timedelta(days=days))
+    with transaction.atomic():
+        purged = dict(old.order_by().values('user_id').annotate(last=Max('version')).values_list('user_id', 'last'))
+        for user_id, version in purged.items():
+            MoodSyncState.objects.filter(user_id=user_id, purged_version__lt=version).update(purged_version=version)
+        deleted, _ = old.filter(user_id__in=list(purged)).delete()
+    return deleted
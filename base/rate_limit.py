@@ -0,0 +1,116 @@
+"""
+Token-bucket rate limiting for the AI chat
+
+Each chat that would call Gemini takes a token from two buckets: one for the
+user and one for their institution, so a single scripted client can't spend
+the quota every other institution relies on. Buckets refill continuously at
+the configured rate per minute and hold at most one minute's worth of tokens.
+Limits come from the institution (Institution.chat_user_rate_per_minute and
+chat_institution_rate_per_minute) or the CHAT_*_RATE_PER_MINUTE settings.
+
+Over-limit chats are still answered, by the local fallback engine, so a
+student never gets an error at a moment they reached out for support.
+
+Bucket state lives in the Django cache (Redis when configured, so every
+worker shares it) as one "theoretical arrival time" per bucket (GCRA). The
+read and write are not atomic; concurrent requests racing on one bucket can
+let a few extra through, which is fine for protecting a quota.
+"""
+
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+import gemini_fallback
+from .models import UserProfile
+
+KEY_PREFIX = 'chat-rate'
+
+logger = logging.getLogger(__name__)
+
+
+def client_ip(request):
+    """
+    The client address anonymous chats are limited by
+
+    REMOTE_ADDR, unless CHAT_TRUSTED_PROXY_COUNT says how many reverse
+    proxies sit in front of the app. Each of them appends the address it
+    received the request from to X-Forwarded-For, so the entry that many
+    places from the end was written by our outermost proxy; entries before
+    it come from the client and are ignored, as is the whole header when no
+    proxy is trusted.
+    """
+    proxies = settings.CHAT_TRUSTED_PROXY_COUNT
+    if proxies > 0:
+        forwarded = [address.strip() for address in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')]
+        forwarded = [address for address in forwarded if address]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def chat_buckets(request):
+    """The (cache key, rate per minute) buckets a chat from this request draws on"""
+    user = request.user
+    if not user.is_authenticated:
+        return [(f'{KEY_PREFIX}:ip:{client_ip(request)}', settings.CHAT_USER_RATE_PER_MINUTE)]
+
+    profile = UserProfile.objects.select_related('institution').filter(user=user).first()
+    if profile is None:
+        return [(f'{KEY_PREFIX}:user:{user.pk}', settings.CHAT_USER_RATE_PER_MINUTE)]
+
+    institution = profile.institution
+    return [
+        (f'{KEY_PREFIX}:user:{user.pk}',
+         institution.chat_user_rate_per_minute or settings.CHAT_USER_RATE_PER_MINUTE),
+        (f'{KEY_PREFIX}:institution:{institution.pk}',
+         institution.chat_institution_rate_per_minute or settings.CHAT_INSTITUTION_RATE_PER_MINUTE),
+    ]
+
+
+def _take_tokens(buckets, now):
+    """Take one token from every bucket, or from none if any is empty"""
+    keys = [key for key, _ in buckets]
+    arrivals = cache.get_many(keys)
+
+    updates = {}
+    for key, rate in buckets:
+        interval = 60.0 / rate
+        arrival = max(arrivals.get(key, now), now)
+        # A full bucket holds one minute of tokens: `rate` requests back to back
+        if arrival - now > 60.0 - interval:
+            return False
+        updates[key] = arrival + interval
+
+    cache.set_many(updates, timeout=60)
+    return True
+
+
+def allow_chat_request(request):
+    """Whether this chat may call Gemini; consumes a token from each bucket when it may"""
+    if not settings.CHAT_RATE_LIMIT_ENABLED:
+        return True
+
+    # A cache outage must never break chat - let the request through
+    try:
+        buckets = chat_buckets(request)
+        allowed = _take_tokens(buckets, time.time())
+    except Exception as e:
+        logger.warning(f"Chat rate limiter unavailable: {e}")
+        return True
+
+    if not allowed:
+        logger.info(f"Chat rate limit reached for {buckets[0][0]}")
+    return allowed
+
+
+aallow_chat_request = sync_to_async(allow_chat_request)
+
+
+def over_limit_response(user_message, conversation_history):
+    """Reply for an over-limit chat, from the local fallback engine"""
+    response = gemini_fallback.generate_mental_health_response(user_message, conversation_history)
+    return {**response, 'safety_flags': response.get('safety_flags', []) + ['rate_limited']}
@@ -0,0 +1,250 @@
+"""
+Write-behind storage of AI chat transcripts
+
+With CHAT_TRANSCRIPTS_ENABLED on, every answered chat adds its two turns to
+an in-memory buffer in the worker process; nothing touches the database on
+the chat path. A background thread writes the buffer with one bulk_create
+when CHAT_TRANSCRIPT_BATCH_SIZE turns are waiting or every
+CHAT_TRANSCRIPT_FLUSH_SECONDS, whichever comes first, and once more when the
+worker shuts down (gunicorn's worker_exit hook, or atexit).
+
+Turns are tagged with the student's institution when the batch is written,
+so the request doesn't pay for the lookup either. Institutions with
+transcript_retention_days = 0 get no transcripts stored; the
+purge_chat_transcripts command deletes turns older than each institution's
+retention period.
+
+The buffer is per process and bounded: if the database is unreachable for
+long, the oldest turns are dropped (and counted) rather than growing the
+worker's memory without limit. A batch that fails while the database is
+reachable holds a row the database refuses (say, a turn whose user was
+deleted since); its turns are then written one at a time and the ones that
+still fail are dropped and counted as rejected, so one bad row can't hold up
+every later transcript. A hard kill loses at most one batch.
+"""
+
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .models import ChatTranscriptTurn, Institution, UserProfile
+
+# Turns held while the database is unreachable, in batches
+MAX_PENDING_BATCHES = 20
+
+logger = logging.getLogger(__name__)
+
+
+class TranscriptBuffer:
+    """
+    Buffers transcript turns and writes them in batches
+
+    Args:
+        batch_size (int): Turns that trigger a write
+        flush_seconds (float): Longest a turn waits before it is written
+        background (bool): Write from a background thread; when False, call
+            flush() yourself (tests, management commands)
+    """
+
+    def __init__(self, batch_size=100, flush_seconds=5.0, background=True):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.background = background
+        self.max_pending = batch_size * MAX_PENDING_BATCHES
+        self._turns = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = threading.Event()
+        self._thread = None
+        self.written = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.flushes = 0
+        self.last_flush_ms = None
+
+    def add(self, turns):
+        """Queue turns for writing; never touches the database"""
+        with self._lock:
+            self._turns.extend(turns)
+            self._trim()
+            full = len(self._turns) >= self.batch_size
+        if self.background:
+            self._ensure_thread()
+            if full:
+                self._wake.set()
+
+    def flush(self):
+        """Write every buffered turn; returns the number written"""
+        with self._flush_lock:
+            with self._lock:
+                turns = list(self._turns)
+                self._turns.clear()
+            if not turns:
+                return 0
+
+            started = time.monotonic()
+            try:
+                written = _write_turns(turns)
+            except Exception:
+                if not _database_available():
+                    logger.exception(f"Could not write {len(turns)} transcript turn(s); will retry")
+                    self._requeue(turns)
+                    return 0
+                logger.exception(f"Could not write a batch of {len(turns)} transcript turn(s); writing them one at a time")
+                written = self._write_one_at_a_time(turns)
+
+            self.written += written
+            self.flushes += 1
+            self.last_flush_ms = round((time.monotonic() - started) * 1000, 1)
+            return written
+
+    def _trim(self):
+        """Drop the oldest turns beyond max_pending; call with self._lock held"""
+        overflow = len(self._turns) - self.max_pending
+        if overflow > 0:
+            for _ in range(overflow):
+                self._turns.popleft()
+            self.dropped += overflow
+            logger.warning(f"Transcript buffer full, dropped the {overflow} oldest turn(s)")
+
+    def _requeue(self, turns):
+        """Put unwritten turns back ahead of anything added meanwhile"""
+        with self._lock:
+            self._turns.extendleft(reversed(turns))
+            self._trim()
+
+    def _write_one_at_a_time(self, turns):
+        """Write turns singly, rejecting those the database refuses; returns the number written"""
+        written = 0
+        for index, turn in enumerate(turns):
+            try:
+                with transaction.atomic():
+                    written += _write_turns([turn])
+            except Exception:
+                if not _database_available():
+                    # The database went away, not just this row; retry the rest later
+                    self._requeue(turns[index:])
+                    break
+                self.rejected += 1
+                logger.exception("Transcript turn rejected by the database; dropping it")
+        return written
+
+    def close(self):
+        """Stop the background thread and write what is left"""
+        self._closed.set()
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.flush_seconds + 5)
+        return self.flush()
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._turns)
+        return {
+            'pending': pending,
+            'written': self.written,
+            'dropped': self.dropped,
+            'rejected': self.rejected,
+            'flushes': self.flushes,
+            'last_flush_ms': self.last_flush_ms,
+        }
+
+    def _ensure_thread(self):
+        if self._thread is not None or self._closed.is_set():
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='transcript-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._closed.is_set():
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            # This thread keeps its own connection; drop it if it went stale
+            close_old_connections()
+            self.flush()
+
+
+def _database_available():
+    """Whether the database answers at all, as opposed to refusing particular rows"""
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        return True
+    except Exception:
+        return False
+
+
+def _write_turns(turns):
+    """Tag turns with their institution, skip opted-out institutions, and bulk insert"""
+    user_ids = {turn.user_id for turn in turns if turn.user_id}
+    institutions = dict(
+        UserProfile.objects.filter(user_id__in=user_ids).values_list('user_id', 'institution_id')
+    ) if user_ids else {}
+    not_stored = set(
+        Institution.objects.filter(pk__in=set(institutions.values()), transcript_retention_days=0)
+        .values_list('pk', flat=True)
+    ) if institutions else set()
+
+    kept = []
+    for turn in turns:
+        turn.institution_id = institutions.get(turn.user_id)
+        if turn.institution_id not in not_stored:
+            kept.append(turn)
+    ChatTranscriptTurn.objects.bulk_create(kept, batch_size=500)
+    return len(kept)
+
+
+TRANSCRIPT_BUFFER = TranscriptBuffer(
+    batch_size=settings.CHAT_TRANSCRIPT_BATCH_SIZE,
+    flush_seconds=settings.CHAT_TRANSCRIPT_FLUSH_SECONDS,
+)
+atexit.register(TRANSCRIPT_BUFFER.close)
+
+
+def record_exchange(user, conversation_id, user_message, reply):
+    """Buffer one chat exchange, if transcripts are enabled"""
+    if not settings.CHAT_TRANSCRIPTS_ENABLED:
+        return
+    user_id = user.pk if user is not None and user.is_authenticated else None
+    now = timezone.now()
+    TRANSCRIPT_BUFFER.add([
+        ChatTranscriptTurn(conversation_id=conversation_id, user_id=user_id, sender='user',
+                           content=user_message, created_at=now),
+        ChatTranscriptTurn(conversation_id=conversation_id, user_id=user_id, sender='ai',
+                           content=reply['text'], model=reply.get('model', ''),
+                           safety_flags=reply.get('safety_flags', []), created_at=now),
+    ])
+
+
+def purge_expired_turns(now=None):
+    """
+    Delete turns older than their institution's retention period
+
+    Turns without an institution (anonymous chats) follow
+    CHAT_TRANSCRIPT_RETENTION_DAYS. Returns the number of turns deleted.
+    """
+    now = now or timezone.now()
+    default_days = settings.CHAT_TRANSCRIPT_RETENTION_DAYS
+    overrides = dict(
+        Institution.objects.filter(transcript_retention_days__isnull=False)
+        .values_list('pk', 'transcript_retention_days')
+    )
+
+    deleted, _ = ChatTranscriptTurn.objects.exclude(institution_id__in=list(overrides)) \
+        .filter(created_at__lt=now - timedelta(days=default_days)).delete()
+    for institution_id, days in overrides.items():
+        count, _ = ChatTranscriptTurn.objects.filter(
+            institution_id=institution_id, created_at__lt=now - timedelta(days=days)
+        ).delete()
+        deleted += count
+    return deleted
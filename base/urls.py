@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
@@ -19,6 +20,7 @@ urlpatterns = [
     # Health check endpoint
     path('healthz/', views.healthz, name='healthz'),
     path('env-debug/', views.env_debug, name='env_debug'),
+    path('chat-metrics/', views.chat_metrics, name='chat_metrics'),
     
     # Legacy debug endpoints
     path('test-env/', views.test_env_vars, name='test_env_vars'),
@@ -29,8 +31,20 @@ urlpatterns = [
     # API endpoints
     path('api/save-mood/', views.save_mood_api, name='save_mood_api'),
     path('api/mood-history/', views.get_mood_history_api, name='get_mood_history_api'),
+    path('api/sync-moods/', views.sync_moods_api, name='sync_moods_api'),
+    path('api/device-token/', views.device_token_api, name='device_token_api'),
+    path('api/mood-trends/', views.get_mood_trends_api, name='get_mood_trends_api'),
+    path('api/mood-stats/', views.get_mood_stats_api, name='get_mood_stats_api'),
+    path('api/mood-reasons/', views.get_mood_reasons_api, name='get_mood_reasons_api'),
+    path('api/mood-changes/', views.get_mood_changes_api, name='get_mood_changes_api'),
+    path('api/mood-entries/<int:entry_id>/', views.delete_mood_entry_api, name='delete_mood_entry_api'),
     path('api/signup/', views.signup_api, name='signup_api'),
     path('api/login/', views.login_api, name='login_api'),
     path('api/logout/', views.logout_api, name='logout_api'),
-    path('api/gemini-chat/', views.gemini_chat_api, name='gemini_chat_api'),
+    path('api/gemini-chat/', views.gemini_chat_api_async if settings.ASGI_MODE else views.gemini_chat_api, name='gemini_chat_api'),
 ]
+
+# The async view needs a long-lived event loop; under WSGI every call would fail
+# and count against the Gemini breaker the sync view shares
+if settings.ASGI_MODE:
+    urlpatterns.append(path('api/gemini-chat-async/', views.gemini_chat_api_async, name='gemini_chat_api_async'))
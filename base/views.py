@@ -2,14 +2,21 @@ from django.shortcuts import render, redirect
 from django.http import JsonResponse, HttpResponse
 from django.contrib.auth import login as django_login, authenticate
 from django.contrib.auth.models import User
-from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
 from django.views.decorators.http import require_http_methods
 from django.contrib import messages
 from django.db import connection
 from django.conf import settings
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from asgiref.sync import sync_to_async
+from datetime import timedelta
 import json
 import logging
-from .models import Institution, UserProfile
+from .models import Institution, MoodEntry, UserProfile
+from . import (chat_cache, crisis_alerts, identity, mood_history, mood_reasons, mood_rollups, mood_stats, mood_sync,
+               rate_limit, transcripts)
+from .chat import ChatRequest, chat_engine, chat_error_reply, empty_message_reply
 
 logger = logging.getLogger(__name__)
 try:
@@ -37,7 +44,9 @@ def signup_view(request):
 def mindcare_home(request):
     return render(request, 'mindcare_home.html')
 
+@ensure_csrf_cookie
 def ai_support(request):
+    # The chat posts to /api/gemini-chat/ with the csrftoken cookie set here
     return render(request, 'ai_support.html')
 
 def book_session(request):
@@ -67,36 +76,22 @@ def save_mood_api(request):
         data = json.loads(request.body)
         
         # Extract mood data
-        mood_value = data.get('mood', {}).get('value')
-        mood_label = data.get('mood', {}).get('label')
-        reasons = data.get('reasons', [])
         custom_reason = data.get('customReason', '')
         timestamp = data.get('timestamp')
         
-        if not mood_value or not mood_label:
+        # Same checks as queued entries get, so the rollups only ever see 1-7 ints
+        # and the reason vocabulary only whole tags
+        try:
+            mood_value, mood_label = mood_sync.parse_mood(data.get('mood'))
+            reasons = mood_sync.parse_reasons(data.get('reasons'))
+        except ValueError as e:
             return JsonResponse({
                 'success': False,
-                'error': 'Mood value and label are required'
+                'error': str(e)
             }, status=400)
         
-        # Get user from request (if authenticated) or create anonymous entry
-        user = None
-        if request.user.is_authenticated:
-            user = request.user
-        else:
-            # For anonymous users, try to get user from localStorage data
-            user_data = data.get('user_data')
-            if user_data and user_data.get('email'):
-                try:
-                    user = User.objects.get(email=user_data['email'])
-                except User.DoesNotExist:
-                    # Create a temporary user for anonymous mood tracking
-                    user = User.objects.create_user(
-                        username=f"anonymous_{user_data['email']}",
-                        email=user_data['email'],
-                        first_name=user_data.get('username', 'Anonymous'),
-                        is_active=False  # Mark as inactive since it's anonymous
-                    )
+        # Authenticated user, the device token's user, or the account for the email the tracker sends
+        user = identity.mood_api_user(request, data.get('user_data'))
         
         if not user:
             return JsonResponse({
@@ -104,25 +99,18 @@ def save_mood_api(request):
                 'error': 'User authentication required'
             }, status=401)
         
-        # Combine reasons and custom reason
-        reason_text = ''
-        if reasons:
-            reason_text += ', '.join(reasons)
-        if custom_reason:
-            if reason_text:
-                reason_text += f' | Custom: {custom_reason}'
-            else:
-                reason_text = f'Custom: {custom_reason}'
+        reason_text = mood_sync.reason_text(reasons, custom_reason)
         
         # Save mood entry to database
-        from .models import MoodEntry
-        mood_entry = MoodEntry.objects.create(
-            user=user,
-            mood_value=mood_value,
-            mood_label=mood_label,
-            reason=reason_text,
-            notes=f"Timestamp: {timestamp}" if timestamp else None
-        )
+        fields = {
+            'mood_value': mood_value,
+            'mood_label': mood_label,
+            'reason': reason_text,
+            'custom_reason': custom_reason or '',
+            'notes': f"Timestamp: {timestamp}" if timestamp else None,
+        }
+        client_id = str(data.get('client_id') or '')[:64] or None
+        mood_entry, _ = mood_sync.save_entry(user, fields, client_id, mood_reasons.reason_slugs(reasons))
         
         return JsonResponse({
             'success': True,
@@ -143,53 +131,401 @@ def save_mood_api(request):
         }, status=500)
 
 @csrf_exempt
-@require_http_methods(["GET"])
-def get_mood_history_api(request):
-    """Get mood history for the current user"""
+@require_http_methods(["POST"])
+def sync_moods_api(request):
+    """
+    Save mood entries the tracker queued while offline, in one round trip
+    
+    Body: {"entries": [{"client_id", "mood": {"value", "label"}, "reasons",
+    "customReason", "timestamp"}, ...], "user_data": {...}}. Entries whose
+    client_id was already synced are reported as duplicates, not saved twice.
+    """
+    try:
+        data = json.loads(request.body)
+        entries = data.get('entries')
+        
+        if not isinstance(entries, list) or not entries:
+            return JsonResponse({
+                'success': False,
+                'error': 'entries must be a non-empty list'
+            }, status=400)
+        if len(entries) > mood_sync.MAX_SYNC_ENTRIES:
+            return JsonResponse({
+                'success': False,
+                'error': f'At most {mood_sync.MAX_SYNC_ENTRIES} entries per request'
+            }, status=400)
+        
+        user = identity.mood_api_user(request, data.get('user_data'))
+        if not user:
+            return JsonResponse({
+                'success': False,
+                'error': 'User authentication required'
+            }, status=401)
+        
+        results, errors = mood_sync.sync_entries(user, entries)
+        
+        return JsonResponse({
+            'success': True,
+            'created': sum(1 for result in results if result['status'] == 'created'),
+            'duplicates': sum(1 for result in results if result['status'] == 'duplicate'),
+            'results': results,
+            'errors': errors
+        })
+        
+    except json.JSONDecodeError:
+        return JsonResponse({
+            'success': False,
+            'error': 'Invalid JSON data'
+        }, status=400)
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def device_token_api(request):
+    """
+    Issue a device token for the mood APIs
+    
+    Only for a signed-in user, or a client with a valid token, which gets a
+    fresh one; an email address alone proves nothing. Send it as
+    "Authorization: Device <token>" and the mood APIs identify the student
+    without looking them up by email.
+    """
     try:
-        # Get user from request (if authenticated)
-        user = None
         if request.user.is_authenticated:
             user = request.user
         else:
-            # For anonymous users, try to get user from query parameters
-            email = request.GET.get('email')
-            if email:
-                try:
-                    user = User.objects.get(email=email)
-                except User.DoesNotExist:
-                    return JsonResponse({
-                        'success': False,
-                        'error': 'User not found'
-                    }, status=404)
-        
+            token = identity.request_device_token(request)
+            user = identity.device_token_user(token) if token else None
         if not user:
             return JsonResponse({
                 'success': False,
                 'error': 'User authentication required'
             }, status=401)
         
-        # Get mood entries for the user
-        from .models import MoodEntry
-        mood_entries = MoodEntry.objects.filter(user=user).order_by('-created_at')
-        
-        # Convert to JSON format
-        mood_history = []
-        for entry in mood_entries:
-            mood_history.append({
-                'id': entry.id,
-                'mood_value': entry.mood_value,
-                'mood_label': entry.mood_label,
-                'reason': entry.reason,
-                'notes': entry.notes,
-                'created_at': entry.created_at.isoformat(),
-                'updated_at': entry.updated_at.isoformat()
+        return JsonResponse({
+            'success': True,
+            'device_token': identity.issue_device_token(user),
+            'expires_in': identity.device_token_max_age()
+        })
+        
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+def _mood_reader(request, allow_email=False):
+    """
+    The user whose moods a read API returns, as (user, None), or (None, error response)
+    
+    The signed-in user, else the device token's user. With allow_email, else
+    the account for the ?email= query parameter; only /api/mood-history/ still
+    accepts that, for mood tracker copies from before device tokens, and it
+    is to be removed there too. An address proves nothing, so no new reader
+    may use it.
+    """
+    if request.user.is_authenticated:
+        return request.user, None
+    
+    token = identity.request_device_token(request)
+    if token:
+        user = identity.device_token_user(token)
+        if user is None:
+            return None, JsonResponse({
+                'success': False,
+                'error': 'Invalid or expired device token'
+            }, status=401)
+        return user, None
+    
+    # For anonymous users, try to get user from query parameters
+    email = request.GET.get('email') if allow_email else None
+    if email:
+        user = identity.user_by_email(email)
+        if user is None:
+            return None, JsonResponse({
+                'success': False,
+                'error': 'User not found'
+            }, status=404)
+        return user, None
+    
+    return None, JsonResponse({
+        'success': False,
+        'error': 'User authentication required'
+    }, status=401)
+
+def _with_validators(response, etag):
+    """Add the ETag header; private, and always revalidated"""
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def _admin_institution(request):
+    """The signed-in admin's institution, as (institution, None), or (None, 403 response)"""
+    profile = UserProfile.objects.filter(user_id=request.user.pk).select_related('institution').first()
+    if not request.user.is_authenticated or not profile or profile.role != 'admin':
+        return None, JsonResponse({
+            'success': False,
+            'error': 'Admin privileges required'
+        }, status=403)
+    return profile.institution, None
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def get_mood_trends_api(request):
+    """
+    Daily mood averages, ranges and histograms, oldest day first
+    
+    Reads the daily rollups (MoodDailyAggregate), one row per day with
+    entries. Query parameters: days (default 90, at most 730) and
+    scope=institution, which admins use for their whole institution.
+    """
+    try:
+        try:
+            days = int(request.GET.get('days', mood_rollups.DEFAULT_TREND_DAYS))
+            if days < 1:
+                raise ValueError
+        except ValueError:
+            return JsonResponse({
+                'success': False,
+                'error': f"Invalid days: {request.GET.get('days')}"
+            }, status=400)
+        
+        if request.GET.get('scope') == 'institution':
+            institution, error_response = _admin_institution(request)
+            if error_response:
+                return error_response
+            trend = mood_rollups.daily_trend(institution=institution, days=days)
+            scope = {'institution': institution.name}
+        else:
+            user, error_response = _mood_reader(request)
+            if error_response:
+                return error_response
+            trend = mood_rollups.daily_trend(user=user, days=days)
+            scope = {'user': user.username}
+        
+        return JsonResponse({
+            'success': True,
+            **scope,
+            'days': trend
+        })
+        
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def get_mood_stats_api(request):
+    """
+    Mood statistics over recent history: averages, volatility, trend slope,
+    streaks, day-of-week pattern and a 7-day moving average
+    
+    Query parameters: days (default 90, at most 730) and scope=institution,
+    which admins use for per-student statistics across their institution.
+    See base/mood_stats.py for the definitions.
+    """
+    try:
+        try:
+            days = int(request.GET.get('days', mood_stats.DEFAULT_STATS_DAYS))
+            if days < 1:
+                raise ValueError
+        except ValueError:
+            return JsonResponse({
+                'success': False,
+                'error': f"Invalid days: {request.GET.get('days')}"
+            }, status=400)
+        
+        if request.GET.get('scope') == 'institution':
+            institution, error_response = _admin_institution(request)
+            if error_response:
+                return error_response
+            return JsonResponse({
+                'success': True,
+                'institution': institution.name,
+                'stats': mood_stats.institution_mood_stats(institution, days=days)
+            })
+        
+        user, error_response = _mood_reader(request)
+        if error_response:
+            return error_response
+        return JsonResponse({
+            'success': True,
+            'user': user.username,
+            'stats': mood_stats.user_mood_stats(user, days=days)
+        })
+        
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def get_mood_reasons_api(request):
+    """
+    How often each mood reason was given and how moods went with it
+    
+    Query parameters: days (only the last N days; default all history) and
+    scope=institution, which admins use for their whole institution.
+    """
+    try:
+        since = None
+        if request.GET.get('days'):
+            try:
+                days = int(request.GET['days'])
+                if days < 1:
+                    raise ValueError
+            except ValueError:
+                return JsonResponse({
+                    'success': False,
+                    'error': f"Invalid days: {request.GET['days']}"
+                }, status=400)
+            since = timezone.now() - timedelta(days=days)
+        
+        if request.GET.get('scope') == 'institution':
+            institution, error_response = _admin_institution(request)
+            if error_response:
+                return error_response
+            return JsonResponse({
+                'success': True,
+                'institution': institution.name,
+                'reasons': mood_reasons.reason_summary(institution=institution, since=since)
             })
         
+        user, error_response = _mood_reader(request)
+        if error_response:
+            return error_response
+        return JsonResponse({
+            'success': True,
+            'user': user.username,
+            'reasons': mood_reasons.reason_summary(user=user, since=since)
+        })
+        
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def get_mood_history_api(request):
+    """
+    Get mood history for the current user, newest first, one page at a time
+    
+    Query parameters: limit (default 50, at most 200), since/until (ISO date
+    or datetime; since inclusive, until exclusive) and cursor - the
+    next_cursor of the previous page. next_cursor is null on the last page.
+    
+    Responses carry an ETag; a request whose If-None-Match still matches gets
+    304 Not Modified after one aggregate query, without reading or
+    serializing any entries. There is no Last-Modified: no timestamp moves
+    when an older entry is deleted, so If-Modified-Since would go stale.
+    """
+    try:
+        user, error_response = _mood_reader(request, allow_email=True)
+        if error_response:
+            return error_response
+        
+        etag = mood_history.history_validator(user, request.GET.items())
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return _with_validators(not_modified, etag)
+        
+        try:
+            limit = mood_history.parse_limit(request.GET.get('limit', mood_history.DEFAULT_PAGE_SIZE))
+            since = mood_history.parse_bound(request.GET['since']) if request.GET.get('since') else None
+            until = mood_history.parse_bound(request.GET['until']) if request.GET.get('until') else None
+            entries, next_cursor = mood_history.mood_history_page(
+                user, cursor=request.GET.get('cursor'), since=since, until=until, limit=limit
+            )
+        except ValueError as e:
+            return JsonResponse({
+                'success': False,
+                'error': str(e)
+            }, status=400)
+        
+        return _with_validators(JsonResponse({
+            'success': True,
+            'mood_history': entries,
+            'total_entries': len(entries),
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None
+        }), etag)
+        
+    except Exception as e:
         return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def get_mood_changes_api(request):
+    """
+    Mood entries saved or deleted since the version a client holds
+    
+    Query parameters: since (the version returned by the previous call; 0
+    or missing for everything) and limit (default 200, at most 1000). Keep
+    calling with the returned version while has_more is true. deleted lists
+    entries to drop; reset means the client's version is too old to bring up
+    to date, so it should drop its copy and start again from 0.
+    """
+    try:
+        user, error_response = _mood_reader(request)
+        if error_response:
+            return error_response
+        
+        try:
+            since = mood_history.parse_version(request.GET.get('since') or 0)
+            limit = mood_history.parse_limit(request.GET.get('limit', mood_history.DEFAULT_CHANGES_LIMIT),
+                                             maximum=mood_history.MAX_CHANGES_LIMIT)
+        except ValueError as e:
+            return JsonResponse({
+                'success': False,
+                'error': str(e)
+            }, status=400)
+        
+        response = JsonResponse({
             'success': True,
-            'mood_history': mood_history,
-            'total_entries': len(mood_history)
+            **mood_history.changes_since(user, since=since, limit=limit)
+        })
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+        
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+@csrf_exempt
+@require_http_methods(["DELETE"])
+def delete_mood_entry_api(request, entry_id):
+    """Delete one of the signed-in user's mood entries; delta syncs report it as deleted"""
+    try:
+        if not request.user.is_authenticated:
+            return JsonResponse({
+                'success': False,
+                'error': 'User authentication required'
+            }, status=401)
+        
+        entry = MoodEntry.objects.filter(pk=entry_id, user=request.user).first()
+        if entry is None or not mood_sync.delete_entries([entry]):
+            return JsonResponse({
+                'success': False,
+                'error': 'Mood entry not found'
+            }, status=404)
+        return JsonResponse({
+            'success': True,
+            'deleted': entry_id
         })
         
     except Exception as e:
@@ -249,9 +585,8 @@ def login_api(request):
         if not all([email, password]):
             return JsonResponse({'error': 'Email and password required'}, status=400)
 
-        try:
-            user = User.objects.get(email=email)
-        except User.DoesNotExist:
+        user = identity.user_by_email(email)
+        if user is None:
             return JsonResponse({'error': 'User not found'}, status=404)
 
         user_auth = authenticate(username=user.username, password=password)
@@ -267,6 +602,7 @@ def login_api(request):
                     'role': profile.role,
                     'institution': profile.institution.name
                 },
+                'device_token': identity.issue_device_token(user_auth),
                 'redirect_url': '/mindcare-home/'
             })
         else:
@@ -492,72 +828,100 @@ def env_debug(request):
         'has_database_url': bool(settings.DATABASES['default'].get('NAME') != 'db.sqlite3')
     }, status=200)
 
+def chat_metrics(request):
+    """Chat pipeline counters - staff only, or anyone in DEBUG mode"""
+    if not (settings.DEBUG or request.user.is_staff):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    
+    metrics = {}
+    try:
+        from gemini_config import GEMINI_BREAKER, get_model_registry_stats
+        metrics['model_registry'] = get_model_registry_stats()
+        metrics['gemini_breaker'] = GEMINI_BREAKER.stats()
+    except ImportError:
+        metrics['model_registry'] = None
+        metrics['gemini_breaker'] = None
+    metrics['response_cache'] = chat_cache.get_response_cache_stats()
+    metrics['crisis_alerts'] = crisis_alerts.get_crisis_alert_stats()
+    metrics['transcripts'] = transcripts.TRANSCRIPT_BUFFER.stats()
+    
+    return JsonResponse(metrics, status=200)
+
 @require_http_methods(["POST"])
 def gemini_chat_api(request):
-    """Handle AI chat requests using Gemini API"""
+    """
+    Handle AI chat requests using Gemini API
+    
+    Send "stream": true to receive the reply as newline-delimited JSON events
+    ({"type": "chunk"} ... {"type": "done"}) instead of a single JSON body.
+    Send the conversation_id from the previous reply to continue a conversation;
+    the history is kept on the server. If the server has lost it, the reply is
+    a 409 with "history_missing" and the client resends with its recent turns.
+    """
     try:
-        # Import functions locally to avoid import issues
-        try:
-            from gemini_config import generate_mental_health_response, is_mental_health_related, get_off_topic_response
-        except ImportError as e:
-            # Use fallback implementation when Google module is not available
-            from gemini_fallback import generate_mental_health_response, is_mental_health_related, get_off_topic_response
+        engine = chat_engine()
+        chat = ChatRequest(request)
         
-        data = json.loads(request.body)
-        user_message = data.get('message', '').strip()
-        conversation_history = data.get('conversation_history', [])
+        if not chat.user_message:
+            return empty_message_reply()
+        if chat.history_missing:
+            return chat.history_missing_reply()
         
-        # Debug: Log conversation history length
-        print(f"Received message: '{user_message}' with {len(conversation_history)} previous messages")
-        print(f"Conversation history: {conversation_history}")
+        # Crisis triage, off-topic filter, then identical prompts answered before
+        reply = chat.early_reply(engine) or chat_cache.get_cached_response(chat.user_message, chat.history)
+        if reply:
+            return chat.reply(reply)
         
-        if not user_message:
-            return JsonResponse({
-                'success': False,
-                'error': 'Message cannot be empty'
-            }, status=400)
+        if not rate_limit.allow_chat_request(request):
+            return chat.reply(rate_limit.over_limit_response(chat.user_message, chat.history))
         
-        # Check if message is mental health related
-        if not is_mental_health_related(user_message):
-            response_data = get_off_topic_response()
-            return JsonResponse({
-                'success': True,
-                'response': response_data['text'],
-                'safety_flags': response_data.get('safety_flags', []),
-                'redirect': response_data.get('redirect', False),
-                'model': 'gemini-mental-health-filter'
-            })
+        if chat.stream:
+            return chat.stream_reply(engine.stream_mental_health_response(chat.user_message, chat.history))
         
         # Generate response using Gemini
-        gemini_response = generate_mental_health_response(user_message, conversation_history)
+        gemini_response = engine.generate_mental_health_response(chat.user_message, chat.history)
+        chat_cache.store_response(chat.user_message, chat.history, gemini_response)
+        return chat.reply(gemini_response)
         
-        if gemini_response.get('error'):
-            return JsonResponse({
-                'success': False,
-                'error': gemini_response['error'],
-                'fallback_response': "I'm here to listen and support you. Could you tell me more about what's on your mind?"
-            }, status=500)
+    except Exception as e:
+        return chat_error_reply(e)
+
+@require_http_methods(["POST"])
+async def gemini_chat_api_async(request):
+    """
+    Async version of gemini_chat_api for ASGI deployments
+    
+    The Gemini call is awaited instead of holding a worker thread, so a single
+    uvicorn worker can serve many chats while they wait on the model. Served at
+    /api/gemini-chat/ when ASGI_MODE is on; see DEPLOYMENT_GUIDE.md.
+    """
+    try:
+        engine = chat_engine()
+        chat = await sync_to_async(ChatRequest)(request)
         
-        return JsonResponse({
-            'success': True,
-            'response': gemini_response['text'],
-            'safety_flags': gemini_response.get('safety_flags', []),
-            'model': gemini_response.get('model', 'gemini-1.5-flash'),
-            'timestamp': gemini_response.get('timestamp', ''),
-            'crisis_detected': 'crisis_detected' in gemini_response.get('safety_flags', [])
-        })
+        if not chat.user_message:
+            return empty_message_reply()
+        if chat.history_missing:
+            return chat.history_missing_reply()
+        
+        # Crisis triage, off-topic filter, then identical prompts answered before
+        reply = chat.early_reply(engine) or await chat_cache.aget_cached_response(chat.user_message, chat.history)
+        if reply:
+            return await chat.areply(reply)
+        
+        if not await rate_limit.aallow_chat_request(request):
+            return await chat.areply(rate_limit.over_limit_response(chat.user_message, chat.history))
+        
+        if chat.stream:
+            return chat.astream_reply(engine.astream_mental_health_response(chat.user_message, chat.history))
+        
+        # Generate response using Gemini
+        gemini_response = await engine.agenerate_mental_health_response(chat.user_message, chat.history)
+        await chat_cache.astore_response(chat.user_message, chat.history, gemini_response)
+        return await chat.areply(gemini_response)
         
-    except json.JSONDecodeError:
-        return JsonResponse({
-            'success': False,
-            'error': 'Invalid JSON data'
-        }, status=400)
     except Exception as e:
-        return JsonResponse({
-            'success': False,
-            'error': str(e),
-            'fallback_response': "I'm experiencing technical difficulties. Please contact campus counseling for immediate support."
-        }, status=500)
+        return chat_error_reply(e)
 
 def dashboard(request):
     """Dashboard view after successful login"""
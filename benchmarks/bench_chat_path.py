@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Time each stage of the chat hot path in isolation over a corpus of student
+messages, and optionally compare against a saved baseline.
+
+Stages: topic filter (is_mental_health_related), crisis triage, feature
+recommendations, prompt assembly, fallback reply generation, and encoding
+the chat API's JSON and NDJSON replies. The keyword-scan cache is cleared
+before every pass, so each message pays for its own scan as it would in
+production.
+
+Usage:
+    python benchmarks/bench_chat_path.py [--repeat 5] [--messages 2000]
+    python benchmarks/bench_chat_path.py --save benchmarks/baseline.json
+    python benchmarks/bench_chat_path.py --baseline benchmarks/baseline.json [--threshold 0.10]
+
+Results are printed as a table; --json writes them machine-readable. With
+--baseline the exit status is 1 when any stage is slower than the baseline
+by more than the threshold.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.test import RequestFactory  # noqa: E402
+
+import gemini_config  # noqa: E402
+import gemini_fallback  # noqa: E402
+from base import chat  # noqa: E402
+from benchmarks.corpus import conversation_histories, student_messages  # noqa: E402
+from keyword_classifier import classify_message  # noqa: E402
+
+
+def build_stages(messages, histories):
+    """Return {stage name: (function run once per item, items)}"""
+    request = RequestFactory().post('/api/gemini-chat/', json.dumps({'message': 'hi'}), content_type='application/json')
+    chat_request = chat.ChatRequest(request)
+    replies = [gemini_fallback.generate_mental_health_response(message) for message in messages]
+    done_events = [
+        {'type': 'done', 'safety_flags': reply['safety_flags'], 'model': reply['model'],
+         'timestamp': reply['timestamp'], 'conversation_id': chat_request.conversation_id}
+        for reply in replies
+    ]
+    conversations = [(messages[i % len(messages)], history) for i, history in enumerate(histories)]
+
+    return {
+        'is_mental_health_related': (gemini_config.is_mental_health_related, messages),
+        'crisis_triage': (gemini_config.triage_message, messages),
+        'feature_recommendations': (gemini_config.get_feature_recommendations, messages),
+        'prompt_assembly': (lambda item: gemini_config.build_conversation_prompt(*item), conversations),
+        'fallback_generation': (gemini_fallback.generate_mental_health_response, messages),
+        'json_reply': (chat_request._json_reply, replies),
+        'ndjson_done_event': (chat._stream_event_line, done_events),
+    }
+
+
+def time_stage(function, items, repeat):
+    """Mean nanoseconds per call for each of `repeat` passes over the items"""
+    passes = []
+    for _ in range(repeat):
+        classify_message.cache_clear()
+        started = time.perf_counter_ns()
+        for item in items:
+            function(item)
+        passes.append((time.perf_counter_ns() - started) / len(items))
+    return passes
+
+
+def run(args):
+    logging_level = gemini_config.logger.level
+    # Prompt assembly and crisis triage log every call; time the work, not the logging
+    gemini_config.logger.setLevel('ERROR')
+    try:
+        messages = student_messages(args.messages)
+        stages = build_stages(messages, conversation_histories(messages))
+        results = {}
+        for name, (function, items) in stages.items():
+            for item in items[:50]:
+                function(item)  # warm-up
+            passes = time_stage(function, items, args.repeat)
+            results[name] = {
+                'ns_per_op': round(statistics.median(passes), 1),
+                'min_ns_per_op': round(min(passes), 1),
+                'stdev_ns': round(statistics.stdev(passes), 1) if len(passes) > 1 else 0.0,
+                'ops_per_second': round(1e9 / statistics.median(passes)),
+                'items': len(items),
+            }
+    finally:
+        gemini_config.logger.setLevel(logging_level)
+
+    return {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'repeat': args.repeat,
+        'messages': args.messages,
+        'stages': results,
+    }
+
+
+def compare(report, baseline, threshold):
+    """Print the change against the baseline and return the regressed stages"""
+    regressions = []
+    print(f"\n{'stage':26} {'baseline':>12} {'now':>12} {'change':>9}")
+    for name, result in report['stages'].items():
+        before = baseline['stages'].get(name)
+        if before is None:
+            print(f"{name:26} {'-':>12} {result['ns_per_op']:>10.0f}ns {'new':>9}")
+            continue
+        change = result['ns_per_op'] / before['ns_per_op'] - 1
+        marker = ''
+        if change > threshold:
+            regressions.append(name)
+            marker = ' ❌'
+        print(f"{name:26} {before['ns_per_op']:>10.0f}ns {result['ns_per_op']:>10.0f}ns {change:>+8.1%}{marker}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='timed passes over the corpus per stage')
+    parser.add_argument('--messages', type=int, default=2000, help='corpus size')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--save', help='save the results as a baseline file')
+    parser.add_argument('--baseline', help='compare against a saved baseline')
+    parser.add_argument('--threshold', type=float, default=0.10, help='allowed slowdown before failing (0.10 = 10%%)')
+    args = parser.parse_args()
+
+    report = run(args)
+
+    print(f"{'stage':26} {'ns/op':>10} {'min':>10} {'ops/s':>12}")
+    for name, result in report['stages'].items():
+        print(f"{name:26} {result['ns_per_op']:>10.0f} {result['min_ns_per_op']:>10.0f} {result['ops_per_second']:>12,}")
+
+    for path in (args.json, args.save):
+        if path:
+            Path(path).write_text(json.dumps(report, indent=2) + '\n')
+            print(f"\nResults written to {path}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ Slower than baseline by more than {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print(f"\n✅ No stage slower than baseline by more than {args.threshold:.0%}")
+
+
+if __name__ == '__main__':
+    main()
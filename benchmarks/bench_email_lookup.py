@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Compare the old unindexed User.objects.get(email=...) lookup with the
+indexed, case-insensitive lookup in base/identity.py at a realistic table size.
+
+Builds a throwaway test database (SQLite in memory, or a test_ database on
+the configured Postgres), runs the migrations, fills auth_user with --users
+synthetic students, then times both lookups for random existing addresses
+and prints each one's query plan.
+
+Usage:
+    python benchmarks/bench_email_lookup.py [--users 1000000] [--lookups 200]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import connection  # noqa: E402
+
+from base import identity  # noqa: E402
+
+BATCH_SIZE = 10000
+
+
+def fill_users(count):
+    """Insert `count` users quickly; every 20th has a mixed-case address"""
+    started = time.perf_counter()
+    for start in range(0, count, BATCH_SIZE):
+        User.objects.bulk_create([
+            User(username=f'student{n}', password='!',
+                 email=f'Student{n}@Uni{n % 50}.edu' if n % 20 == 0 else f'student{n}@uni{n % 50}.edu')
+            for n in range(start, min(start + BATCH_SIZE, count))
+        ])
+    print(f"Inserted {count:,} users in {time.perf_counter() - started:.1f}s")
+
+
+def time_lookups(function, emails):
+    timings = []
+    for email in emails:
+        started = time.perf_counter_ns()
+        function(email)
+        timings.append((time.perf_counter_ns() - started) / 1e6)
+    return timings
+
+
+def query_plan(queryset):
+    plan = queryset.explain()
+    return ' / '.join(line.strip() for line in plan.splitlines() if line.strip())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1_000_000)
+    parser.add_argument('--lookups', type=int, default=200)
+    args = parser.parse_args()
+
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        fill_users(args.users)
+        rng = random.Random(42)
+        emails = [f'student{n}@uni{n % 50}.edu' for n in (rng.randrange(args.users) for _ in range(args.lookups))]
+
+        lookups = {
+            'User.objects.get(email=...)': lambda email: User.objects.filter(email=email).first(),
+            'identity.user_by_email': identity.user_by_email,
+        }
+        print(f"\n{'lookup':30} {'p50 ms':>9} {'p95 ms':>9}")
+        for name, function in lookups.items():
+            timings = sorted(time_lookups(function, emails))
+            print(f"{name:30} {statistics.median(timings):>9.3f} {timings[int(len(timings) * 0.95)]:>9.3f}")
+
+        print("\nQuery plans:")
+        print(f"  email=:         {query_plan(User.objects.filter(email=emails[0]))}")
+        print(f"  user_by_email:  {query_plan(identity.users_with_email(emails[0]))}")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark the single-pass keyword classifier against the per-list keyword loops
+it replaced, and check that both label every message the same way.
+
+Usage:
+    python benchmarks/bench_keyword_classifier.py [--repeat 2000]
+"""
+
+import argparse
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from keyword_classifier import (  # noqa: E402
+    CRISIS_KEYWORDS,
+    CRISIS_PHRASES,
+    DEFAULT_CLASSIFIER,
+    FEATURE_KEYWORDS,
+    INTENT_KEYWORDS,
+    ON_TOPIC_KEYWORDS,
+)
+
+MESSAGES = [
+    "I'm really stressed about my exams next week and can't sleep",
+    "I feel so lonely since my friends moved away",
+    "What is the capital of France?",
+    "Help me with my python project",
+    "I don't want to live anymore",
+    "My parents keep pressuring me about my grades and career choice",
+    "Can you give me some coping strategies for panic attacks?",
+    "I've been feeling down and empty for weeks, nothing makes me happy",
+    "How do I download the lecture slides?",
+    "I had a breakup and I keep thinking about it at night",
+    "I'm exhausted, tired all the time and my appetite is gone",
+    "Is it normal to feel nervous before a job interview?",
+    "Tell me a joke",
+    "I think I need to talk to a counselor or therapist, this is serious",
+    "Our group presentation is tomorrow and nobody has done their part " * 4,
+]
+
+
+def legacy_labels(message):
+    """The original any(keyword in message.lower() ...) loops, one per list"""
+    labels = set()
+    if any(keyword in message.lower() for keyword in ON_TOPIC_KEYWORDS):
+        labels.add('on_topic')
+    if any(keyword in message.lower() for keyword in CRISIS_KEYWORDS):
+        labels.add('crisis')
+    if any(keyword in message.lower() for keyword in CRISIS_PHRASES):
+        labels.add('crisis_phrase')
+    for name, keywords in FEATURE_KEYWORDS.items():
+        if any(keyword in message.lower() for keyword in keywords):
+            labels.add(f'feature:{name}')
+    for name, keywords in INTENT_KEYWORDS.items():
+        if any(keyword in message.lower() for keyword in keywords):
+            labels.add(f'intent:{name}')
+    return frozenset(labels)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=2000, help='passes over the message set per timing')
+    args = parser.parse_args()
+
+    mismatches = [m for m in MESSAGES if legacy_labels(m) != DEFAULT_CLASSIFIER.classify(m)]
+    if mismatches:
+        print("❌ Classifier disagrees with the keyword loops on:")
+        for message in mismatches:
+            print(f"   {message!r}")
+        sys.exit(1)
+    print(f"✅ Same labels as the keyword loops on all {len(MESSAGES)} messages")
+
+    def run_legacy():
+        for message in MESSAGES:
+            legacy_labels(message)
+
+    def run_classifier():
+        for message in MESSAGES:
+            DEFAULT_CLASSIFIER.classify(message)
+
+    calls = args.repeat * len(MESSAGES)
+    legacy = min(timeit.repeat(run_legacy, number=args.repeat, repeat=5)) / calls
+    compiled = min(timeit.repeat(run_classifier, number=args.repeat, repeat=5)) / calls
+
+    print(f"Keyword loops:      {legacy * 1e6:8.2f} µs/message")
+    print(f"Single-pass regex:  {compiled * 1e6:8.2f} µs/message")
+    print(f"Speedup:            {legacy / compiled:8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Compare per-student mood statistics computed by looping over MoodEntry
+objects with the vectorized institution batch in base/mood_stats.py.
+
+Builds a throwaway test database, fills one institution with --students
+students and --entries mood entries each over the last 90 days, then times
+both ways of computing every student's average, volatility, trend slope and
+logging streak.
+
+Usage:
+    python benchmarks/bench_mood_stats.py [--students 1000] [--entries 90]
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, time as day_start, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from base import mood_stats  # noqa: E402
+from base.models import Institution, MoodEntry, UserProfile  # noqa: E402
+
+BATCH_SIZE = 10000
+
+
+def fill(students, entries_each):
+    started = time.perf_counter()
+    institution = Institution.objects.create(name='Benchmark University')
+    users = User.objects.bulk_create([
+        User(username=f'student{n}', email=f'student{n}@uni.edu', password='!') for n in range(students)
+    ])
+    UserProfile.objects.bulk_create([
+        UserProfile(user=user, institution=institution, role='student') for user in users
+    ])
+    rng = random.Random(42)
+    now = timezone.now()
+    batch = []
+    for user in users:
+        for _ in range(entries_each):
+            batch.append(MoodEntry(user=user, mood_value=rng.randint(1, 7), mood_label='Mood',
+                                   created_at=now - timedelta(minutes=rng.randrange(90 * 24 * 60))))
+            if len(batch) >= BATCH_SIZE:
+                MoodEntry.objects.bulk_create(batch)
+                batch = []
+    MoodEntry.objects.bulk_create(batch)
+    print(f"Inserted {students:,} students and {students * entries_each:,} entries "
+          f"in {time.perf_counter() - started:.1f}s")
+    return institution
+
+
+def looped_stats(institution):
+    """The straightforward way: one query and a Python loop per student"""
+    since = timezone.make_aware(datetime.combine(timezone.localdate() - timedelta(days=89), day_start.min))
+    results = {}
+    for profile in UserProfile.objects.filter(institution=institution).select_related('user'):
+        entries = list(MoodEntry.objects.filter(user=profile.user, created_at__gte=since).order_by('created_at'))
+        if not entries:
+            continue
+        values = [entry.mood_value for entry in entries]
+        times = [entry.created_at.timestamp() / 86400 for entry in entries]
+        average = sum(values) / len(values)
+        volatility = math.sqrt(sum((value - average) ** 2 for value in values) / len(values))
+        mean_time = sum(times) / len(times)
+        variance = sum((t - mean_time) ** 2 for t in times)
+        slope = sum((t - mean_time) * (v - average) for t, v in zip(times, values)) / variance if variance else 0
+        days = sorted({timezone.localdate(entry.created_at) for entry in entries})
+        longest = run = 1
+        for previous, day in zip(days, days[1:]):
+            run = run + 1 if (day - previous).days == 1 else 1
+            longest = max(longest, run)
+        results[profile.user_id] = (average, volatility, slope * 7, longest)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=1000)
+    parser.add_argument('--entries', type=int, default=90)
+    args = parser.parse_args()
+
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        institution = fill(args.students, args.entries)
+
+        started = time.perf_counter()
+        looped = looped_stats(institution)
+        looped_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        batch = mood_stats.institution_mood_stats(institution)
+        batch_seconds = time.perf_counter() - started
+
+        mismatches = sum(
+            1 for student in batch['students']
+            if abs(looped[student['user_id']][0] - student['average']) > 0.01
+            or student['longest_streak'] != looped[student['user_id']][3]
+        )
+        print(f"\n{'method':28} {'seconds':>9}")
+        print(f"{'loop over MoodEntry':28} {looped_seconds:>9.2f}")
+        print(f"{'mood_stats (NumPy batch)':28} {batch_seconds:>9.2f}")
+        print(f"\nStudents whose figures differ: {mismatches}")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Synthetic corpus of student chat messages for the benchmarks
+
+Messages are built from templates covering what students actually bring to
+the AI support page - exams, sleep, loneliness, family, career worries,
+crisis statements - plus off-topic questions, in the mix of lengths and
+casing seen in chat. Generation is seeded, so every run times the same
+messages.
+"""
+
+import random
+
+OPENERS = [
+    "", "hi, ", "hey ", "so ", "honestly ", "I don't know, ", "ok so ", "Hello. ",
+]
+
+STATEMENTS = [
+    "I'm really stressed about my {course} exam next week",
+    "I can't sleep before my {course} finals and I'm exhausted all the time",
+    "I feel so lonely since my friends moved away",
+    "my family keeps pressuring me about my grades and career choice",
+    "I had a breakup and I keep thinking about it at night",
+    "I've been feeling down and empty for weeks, nothing makes me happy",
+    "I get panic attacks before every presentation",
+    "I'm overwhelmed by assignments and the deadline for {course} is tomorrow",
+    "I'm nervous about my job interview on {day}",
+    "my roommate and I keep having conflict and I feel isolated",
+    "I feel like a failure compared to everyone in my {course} class",
+    "I'm worried about my future after graduation",
+    "I think I need to talk to a counselor or therapist",
+    "can you give me some coping strategies for anxiety",
+    "I lost my appetite and I'm tired of everything",
+    "I feel hopeless and worthless lately",
+    "sometimes I don't want to live anymore",
+    "I keep having nightmares and wake up anxious",
+    "my parents are getting divorced and I can't focus on studying",
+    "our group project is a mess and nobody is doing their part",
+]
+
+FOLLOW_UPS = [
+    "", "", ".", "!", "...", " and I don't know what to do.",
+    " Any tips?", " It's been like this since {day}.",
+    " I tried exercise but it didn't help much.",
+    " My {course} professor doesn't seem to care either.",
+]
+
+OFF_TOPIC = [
+    "What is the capital of France?",
+    "Help me with my python homework",
+    "Tell me a joke",
+    "How do I download the lecture slides for {course}?",
+    "What's the weather like on {day}?",
+    "Can you write my essay on {course}?",
+]
+
+COURSES = ["calculus", "organic chemistry", "data structures", "physics", "economics", "history", "statistics"]
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "the weekend"]
+
+
+def _fill(template, rng):
+    return template.format(course=rng.choice(COURSES), day=rng.choice(DAYS))
+
+
+def student_messages(count=2000, seed=42):
+    """Return `count` distinct-ish chat messages; about one in eight is off-topic"""
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(count):
+        if rng.random() < 0.125:
+            message = _fill(rng.choice(OFF_TOPIC), rng)
+        else:
+            message = rng.choice(OPENERS) + _fill(rng.choice(STATEMENTS), rng) + _fill(rng.choice(FOLLOW_UPS), rng)
+            # Some students write several sentences at once
+            if rng.random() < 0.2:
+                message += " Also " + _fill(rng.choice(STATEMENTS), rng) + "."
+        if rng.random() < 0.1:
+            message = message.upper()
+        elif rng.random() < 0.5:
+            message = message[:1].upper() + message[1:]
+        messages.append(message)
+    return messages
+
+
+def conversation_histories(messages, count=200, seed=42):
+    """Return `count` conversation histories of 0-30 turns built from the messages"""
+    rng = random.Random(seed)
+    histories = []
+    for _ in range(count):
+        turns = rng.randint(0, 30)
+        histories.append([
+            {'sender': 'user' if i % 2 == 0 else 'ai', 'content': rng.choice(messages) * (1 if i % 2 == 0 else 3)}
+            for i in range(turns)
+        ])
+    return histories
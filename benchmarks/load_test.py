@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Load driver for the chat and mood APIs, meant to run fully offline against a
+local server that uses the fake Gemini backend.
+
+Start the server the way production does, with the fake backend:
+    GEMINI_BACKEND=fake FAKE_GEMINI_LATENCY_MS=800 FAKE_GEMINI_LATENCY_P95_MS=2500 \\
+        gunicorn project.wsgi:application --workers 2 --bind 127.0.0.1:8000
+    (or ASGI_MODE=true ... project.asgi:application -k uvicorn_worker.UvicornWorker)
+
+Then drive it:
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --users 20 --duration 60 [--stream]
+
+Each virtual user is one student with their own session and address. It
+loops over a weighted mix of /api/gemini-chat/ (continuing its
+conversation), /api/save-mood/ and /api/mood-history/. The report gives
+throughput and p50/p95/p99 latency per endpoint; --json writes it
+machine-readable.
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.corpus import student_messages  # noqa: E402
+
+MOODS = [
+    (1, 'Very Unpleasant'), (2, 'Unpleasant'), (3, 'Slightly Unpleasant'), (4, 'Neutral'),
+    (5, 'Slightly Pleasant'), (6, 'Pleasant'), (7, 'Very Pleasant'),
+]
+REASONS = ['Exams', 'Sleep', 'Friends', 'Family', 'Health', 'Work', 'Weather']
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+class Recorder:
+    """Thread-safe collection of request timings per endpoint"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.first_byte = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.errors = defaultdict(int)
+
+    def record(self, endpoint, status, seconds, first_byte=None, ok=True):
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            self.statuses[endpoint][str(status)] += 1
+            if first_byte is not None:
+                self.first_byte[endpoint].append(first_byte)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def report(self, elapsed):
+        endpoints = {}
+        for endpoint, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            stats = {
+                'requests': len(values),
+                'errors': self.errors[endpoint],
+                'throughput_rps': round(len(values) / elapsed, 2),
+                'statuses': dict(self.statuses[endpoint]),
+            }
+            for name, fraction in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99)):
+                stats[f'{name}_ms'] = round(percentile(values, fraction) * 1000, 1)
+            first_byte = sorted(self.first_byte[endpoint])
+            if first_byte:
+                stats['first_chunk_p50_ms'] = round(percentile(first_byte, 0.50) * 1000, 1)
+                stats['first_chunk_p95_ms'] = round(percentile(first_byte, 0.95) * 1000, 1)
+            endpoints[endpoint] = stats
+        total = sum(stats['requests'] for stats in endpoints.values())
+        return {
+            'duration_s': round(elapsed, 2),
+            'requests': total,
+            'throughput_rps': round(total / elapsed, 2),
+            'endpoints': endpoints,
+        }
+
+
+class VirtualStudent:
+    """One simulated student: a session, an address, a conversation and a mood log"""
+
+    def __init__(self, args, number, run_id, messages, recorder):
+        self.args = args
+        self.rng = random.Random(f'{run_id}-{number}')
+        self.messages = messages
+        self.recorder = recorder
+        self.email = f'loadtest-{run_id}-{number}@example.com'
+        self.conversation_id = None
+        self.session = requests.Session()
+        # Every student gets their own address, so per-address rate limits apply per
+        # student (the server must run with CHAT_TRUSTED_PROXY_COUNT=1 to read it)
+        self.session.headers['X-Forwarded-For'] = f'10.{number // 65536 % 256}.{number // 256 % 256}.{number % 256}'
+
+    def url(self, path):
+        return self.args.url.rstrip('/') + path
+
+    def start(self):
+        # The AI support page sets the csrftoken cookie the chat API needs
+        self.session.get(self.url('/ai-support/'), timeout=self.args.timeout)
+        self.session.headers['X-CSRFToken'] = self.session.cookies.get('csrftoken', '')
+
+    def chat(self):
+        payload = {'message': self.rng.choice(self.messages), 'stream': self.args.stream}
+        if self.conversation_id:
+            payload['conversation_id'] = self.conversation_id
+
+        started = time.perf_counter()
+        first_byte = None
+        response = self.session.post(self.url('/api/gemini-chat/'), json=payload,
+                                     timeout=self.args.timeout, stream=self.args.stream)
+        if self.args.stream and response.ok:
+            data = {}
+            for line in response.iter_lines():
+                if first_byte is None:
+                    first_byte = time.perf_counter() - started
+                if line:
+                    data = json.loads(line)
+        else:
+            data = response.json() if response.headers.get('Content-Type', '').startswith('application/json') else {}
+        elapsed = time.perf_counter() - started
+
+        self.conversation_id = data.get('conversation_id') or self.conversation_id
+        self.recorder.record('chat', response.status_code, elapsed, first_byte, ok=bool(data.get('success')))
+
+    def save_mood(self):
+        mood_value, mood_label = self.rng.choice(MOODS)
+        payload = {
+            'mood': {'value': mood_value, 'label': mood_label},
+            'reasons': self.rng.sample(REASONS, self.rng.randint(0, 3)),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'user_data': {'email': self.email, 'username': self.email.split('@')[0]},
+        }
+        started = time.perf_counter()
+        response = self.session.post(self.url('/api/save-mood/'), json=payload, timeout=self.args.timeout)
+        self.recorder.record('save_mood', response.status_code, time.perf_counter() - started, ok=response.ok)
+
+    def mood_history(self):
+        started = time.perf_counter()
+        response = self.session.get(self.url('/api/mood-history/'), params={'email': self.email},
+                                    timeout=self.args.timeout)
+        # Until this student's first save the history is a 404, which is expected
+        self.recorder.record('mood_history', response.status_code, time.perf_counter() - started,
+                             ok=response.status_code in (200, 404))
+
+    def run(self, deadline):
+        actions = [self.chat, self.save_mood, self.mood_history]
+        weights = [self.args.chat_weight, self.args.save_weight, self.args.history_weight]
+        try:
+            self.start()
+        except requests.RequestException as e:
+            self.recorder.record('setup', 'error', 0.0, ok=False)
+            print(f"Virtual student could not start: {e}", file=sys.stderr)
+            return
+        while time.monotonic() < deadline:
+            action = self.rng.choices(actions, weights)[0]
+            try:
+                action()
+            except requests.RequestException:
+                self.recorder.record(action.__name__, 'error', self.args.timeout, ok=False)
+            if self.args.think_ms:
+                time.sleep(self.rng.expovariate(1000 / self.args.think_ms))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help='server to drive')
+    parser.add_argument('--users', type=int, default=10, help='concurrent virtual students')
+    parser.add_argument('--duration', type=float, default=30, help='seconds to run')
+    parser.add_argument('--stream', action='store_true', help='request streamed chat replies')
+    parser.add_argument('--think-ms', type=float, default=0, help='mean pause between a student\'s requests')
+    parser.add_argument('--timeout', type=float, default=130, help='per-request timeout in seconds')
+    parser.add_argument('--chat-weight', type=float, default=6)
+    parser.add_argument('--save-weight', type=float, default=2)
+    parser.add_argument('--history-weight', type=float, default=2)
+    parser.add_argument('--json', help='write the report to this file')
+    args = parser.parse_args()
+
+    run_id = uuid.uuid4().hex[:8]
+    recorder = Recorder()
+    messages = student_messages()
+    students = [VirtualStudent(args, n, run_id, messages, recorder) for n in range(args.users)]
+
+    print(f"Driving {args.url} with {args.users} students for {args.duration:.0f}s...")
+    started = time.monotonic()
+    deadline = started + args.duration
+    threads = [threading.Thread(target=student.run, args=(deadline,), daemon=True) for student in students]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report = recorder.report(time.monotonic() - started)
+    report['config'] = {key: value for key, value in vars(args).items() if key != 'json'}
+
+    print(f"\n{'endpoint':14} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for endpoint, stats in report['endpoints'].items():
+        print(f"{endpoint:14} {stats['requests']:>9} {stats['errors']:>7} {stats['throughput_rps']:>8} "
+              f"{stats['p50_ms']:>9} {stats['p95_ms']:>9} {stats['p99_ms']:>9}")
+        if 'first_chunk_p50_ms' in stats:
+            print(f"{'':14} first chunk p50 {stats['first_chunk_p50_ms']} ms, p95 {stats['first_chunk_p95_ms']} ms")
+    print(f"\nTotal: {report['requests']} requests, {report['throughput_rps']} req/s")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2) + '\n')
+        print(f"Report written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
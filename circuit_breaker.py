@@ -0,0 +1,123 @@
+"""
+Circuit breaker for calls to an external service
+
+After repeated failures - errors, timeouts or calls slower than the slow-call
+threshold - the breaker opens and callers skip the service entirely, serving
+their fallback at once instead of holding a worker on a dead provider. After
+reset_timeout one probe call is let through (half-open): success closes the
+breaker, failure opens it again.
+
+State is per process, so each gunicorn worker detects an outage on its own
+within a handful of requests.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Recent call durations kept for the latency percentiles
+LATENCY_WINDOW = 200
+
+
+class CircuitBreaker:
+    """
+    Tracks the health of one external service
+
+    Args:
+        name (str): Used in log messages
+        failure_threshold (int): Consecutive failed or slow calls that open the breaker
+        slow_call_seconds (float): Successful calls slower than this count as failures
+        reset_timeout (float): Seconds to stay open before probing again
+    """
+
+    def __init__(self, name, failure_threshold=5, slow_call_seconds=10.0, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_timeout = reset_timeout
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._counts = {'successes': 0, 'failures': 0, 'slow_calls': 0, 'rejected': 0, 'opened': 0}
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def allow_request(self):
+        """
+        Whether a call may go to the service now
+
+        While open, returns False until reset_timeout has passed; then lets a
+        single probe through. Every call that is allowed must be followed by
+        record_success or record_failure.
+        """
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._set_state(HALF_OPEN)
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self._counts['rejected'] += 1
+            return False
+
+    def record_success(self, seconds):
+        """Record a completed call; a slow one counts as a failure"""
+        if seconds > self.slow_call_seconds:
+            with self._lock:
+                self._counts['slow_calls'] += 1
+            self.record_failure(seconds)
+            return
+
+        with self._lock:
+            self._latencies.append(seconds)
+            self._counts['successes'] += 1
+            self._consecutive_failures = 0
+            self._probe_in_flight = False
+            if self._state != CLOSED:
+                self._set_state(CLOSED)
+
+    def record_failure(self, seconds):
+        """Record a failed, timed-out or slow call"""
+        with self._lock:
+            self._latencies.append(seconds)
+            self._counts['failures'] += 1
+            self._consecutive_failures += 1
+            self._probe_in_flight = False
+            if self._state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                if self._state != OPEN:
+                    self._counts['opened'] += 1
+                    self._set_state(OPEN)
+
+    def _set_state(self, state):
+        logger.warning(f"Circuit breaker '{self.name}': {self._state} -> {state}")
+        self._state = state
+
+    def stats(self):
+        """State, call counters and latency percentiles over the recent calls"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = {
+                'state': self._state,
+                'consecutive_failures': self._consecutive_failures,
+                **self._counts,
+            }
+        for name, fraction in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99)):
+            index = min(int(len(latencies) * fraction), len(latencies) - 1)
+            stats[f'latency_{name}_ms'] = round(latencies[index] * 1000, 1) if latencies else None
+        return stats
@@ -0,0 +1,171 @@
+"""
+Local stand-in for genai.GenerativeModel, for load tests and offline work
+
+Set GEMINI_BACKEND=fake and gemini_config builds FakeGenerativeModel instead
+of the Google model: no API key, no network, no quota. Replies take a random
+time drawn from a log-normal distribution, fail at a configurable rate and
+stream in chunks like the real thing, so worker counts and timeouts can be
+sized against realistic provider behaviour.
+
+Tuning (environment variables):
+    FAKE_GEMINI_LATENCY_MS      median reply time (default 800)
+    FAKE_GEMINI_LATENCY_P95_MS  95th percentile reply time (default 2500)
+    FAKE_GEMINI_ERROR_RATE      fraction of calls that raise (default 0.0)
+    FAKE_GEMINI_CHUNKS          chunks per streamed reply (default 8)
+    FAKE_GEMINI_SEED            seed for repeatable runs (default: random)
+
+A call whose sampled latency exceeds request_options['timeout'] waits for
+the timeout and raises TimeoutError, as a deadline-exceeded call would.
+"""
+
+import asyncio
+import math
+import os
+import random
+import time
+from types import SimpleNamespace
+
+# z-score of the 95th percentile of a standard normal distribution
+_Z95 = 1.6449
+
+REPLY_TEXT = (
+    "It sounds like you have a lot on your plate right now, and it makes sense "
+    "to feel this way. Try breaking the next few days into small steps, and "
+    "take a few slow breaths when the pressure builds. Would it help to talk "
+    "through what feels most urgent?"
+)
+
+
+class FakeGeminiError(Exception):
+    """Raised for the configured fraction of calls, like a provider 5xx"""
+
+
+class FakeLatency:
+    """
+    Log-normal reply times, parameterized by median and 95th percentile
+
+    Args:
+        median_ms (float): Median reply time
+        p95_ms (float): 95th percentile reply time; must be >= median_ms
+        rng (random.Random): Source of randomness
+    """
+
+    def __init__(self, median_ms, p95_ms, rng):
+        self.mu = math.log(max(median_ms, 0.001) / 1000)
+        self.sigma = max(math.log(max(p95_ms, median_ms, 0.001) / max(median_ms, 0.001)), 0.0) / _Z95
+        self.rng = rng
+
+    def sample(self):
+        """One reply time in seconds"""
+        if self.sigma == 0:
+            return math.exp(self.mu)
+        return self.rng.lognormvariate(self.mu, self.sigma)
+
+
+def _env_float(name, default):
+    return float(os.getenv(name, default))
+
+
+class FakeGenerativeModel:
+    """
+    Drop-in for genai.GenerativeModel as gemini_config uses it
+
+    Accepts the same constructor arguments and supports generate_content,
+    generate_content_async (both with stream=True) and count_tokens.
+    """
+
+    def __init__(self, model_name=None, generation_config=None, safety_settings=None,
+                 system_instruction=None, latency=None, error_rate=None, chunks=None, rng=None):
+        self.model_name = model_name
+        seed = os.getenv('FAKE_GEMINI_SEED')
+        self.rng = rng or random.Random(int(seed) if seed else None)
+        self.latency = latency or FakeLatency(
+            _env_float('FAKE_GEMINI_LATENCY_MS', 800),
+            _env_float('FAKE_GEMINI_LATENCY_P95_MS', 2500),
+            self.rng,
+        )
+        self.error_rate = _env_float('FAKE_GEMINI_ERROR_RATE', 0.0) if error_rate is None else error_rate
+        self.chunks = int(_env_float('FAKE_GEMINI_CHUNKS', 8)) if chunks is None else chunks
+
+    def _plan(self, request_options):
+        """Decide how long this call takes and whether it fails"""
+        delay = self.latency.sample()
+        timeout = (request_options or {}).get('timeout')
+        if timeout is not None and delay > timeout:
+            return timeout, TimeoutError(f"Fake Gemini call exceeded its {timeout}s deadline")
+        if self.rng.random() < self.error_rate:
+            return delay, FakeGeminiError("Fake Gemini error")
+        return delay, None
+
+    def _response(self, contents, text):
+        prompt_chars = sum(len(part) for content in contents for part in content['parts']) \
+            if isinstance(contents, list) else len(str(contents))
+        return SimpleNamespace(
+            text=text,
+            prompt_feedback=SimpleNamespace(block_reason=None),
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=math.ceil(prompt_chars / 4),
+                candidates_token_count=math.ceil(len(text) / 4),
+            ),
+        )
+
+    def _pieces(self):
+        size = math.ceil(len(REPLY_TEXT) / max(self.chunks, 1))
+        return [REPLY_TEXT[i:i + size] for i in range(0, len(REPLY_TEXT), size)]
+
+    def generate_content(self, contents, safety_settings=None, stream=False, request_options=None, **kwargs):
+        delay, error = self._plan(request_options)
+        if not stream:
+            time.sleep(delay)
+            if error:
+                raise error
+            return self._response(contents, REPLY_TEXT)
+        return _FakeStream(self._response(contents, REPLY_TEXT), self._pieces(), delay, error)
+
+    async def generate_content_async(self, contents, safety_settings=None, stream=False, request_options=None, **kwargs):
+        delay, error = self._plan(request_options)
+        if not stream:
+            await asyncio.sleep(delay)
+            if error:
+                raise error
+            return self._response(contents, REPLY_TEXT)
+        return _FakeStream(self._response(contents, REPLY_TEXT), self._pieces(), delay, error)
+
+    def count_tokens(self, contents, **kwargs):
+        return SimpleNamespace(total_tokens=math.ceil(len(str(contents)) / 4))
+
+
+class _FakeStream:
+    """
+    A streamed reply: the first chunk arrives after a third of the call's
+    latency, the rest are spread over the remainder. A failing call raises
+    before its first chunk.
+    """
+
+    def __init__(self, response, pieces, delay, error):
+        self.prompt_feedback = response.prompt_feedback
+        self.usage_metadata = response.usage_metadata
+        self.text = response.text
+        self._pieces = pieces
+        self._error = error
+        self._first_delay = delay if error else delay / 3
+        self._gap = 0 if error else (delay - self._first_delay) / max(len(pieces) - 1, 1)
+
+    def _delays(self):
+        yield self._first_delay
+        while True:
+            yield self._gap
+
+    def __iter__(self):
+        for piece, delay in zip(self._pieces, self._delays()):
+            time.sleep(delay)
+            if self._error:
+                raise self._error
+            yield SimpleNamespace(text=piece)
+
+    async def __aiter__(self):
+        for piece, delay in zip(self._pieces, self._delays()):
+            await asyncio.sleep(delay)
+            if self._error:
+                raise self._error
+            yield SimpleNamespace(text=piece)
@@ -1,5 +1,13 @@
 import os
+import json
+import threading
+import time
 import google.generativeai as genai
+import gemini_fallback
+from circuit_breaker import CircuitBreaker
+from keyword_classifier import classify_message, is_crisis_message
+from prompt_builder import build_prompt
+from topic_classifier import is_mental_health_related  # noqa: F401 - part of the chat engine interface
 from datetime import datetime
 import logging
 
@@ -9,14 +17,44 @@ logger = logging.getLogger(__name__)
 try:
     from django.conf import settings
     GEMINI_API_KEY = settings.GEMINI_API_KEY
+    GEMINI_BACKEND = settings.GEMINI_BACKEND
 except ImportError:
     # Fallback for when Django settings are not available
     GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
+    GEMINI_BACKEND = os.getenv('GEMINI_BACKEND', 'google')
 except Exception as e:
     # Additional fallback
     GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
+    GEMINI_BACKEND = os.getenv('GEMINI_BACKEND', 'google')
 
-if GEMINI_API_KEY:
+def _chat_setting(name, default):
+    """Read an integer chat setting from Django settings, or the environment outside Django"""
+    try:
+        from django.conf import settings
+        return getattr(settings, name)
+    except Exception:
+        return int(os.getenv(name, default))
+
+PROMPT_TOKEN_BUDGET = _chat_setting('CHAT_PROMPT_TOKEN_BUDGET', 2000)
+
+# Hard deadline for every Gemini call, well inside the gunicorn worker timeout
+GEMINI_TIMEOUT_SECONDS = _chat_setting('CHAT_GEMINI_TIMEOUT', 15)
+REQUEST_OPTIONS = {"timeout": GEMINI_TIMEOUT_SECONDS}
+
+# Opens after repeated failed or slow calls; while open, chats are answered by
+# gemini_fallback without waiting on the provider
+GEMINI_BREAKER = CircuitBreaker(
+    'gemini',
+    failure_threshold=_chat_setting('CHAT_BREAKER_FAILURES', 5),
+    slow_call_seconds=_chat_setting('CHAT_BREAKER_SLOW_SECONDS', 10),
+    reset_timeout=_chat_setting('CHAT_BREAKER_RESET_SECONDS', 30),
+)
+
+if GEMINI_BACKEND == 'fake':
+    # Local stand-in for load tests - no key, never calls Google (see fake_gemini.py)
+    logger.warning("GEMINI_BACKEND=fake: chat replies come from fake_gemini")
+    GEMINI_AVAILABLE = True
+elif GEMINI_API_KEY:
     genai.configure(api_key=GEMINI_API_KEY)
     GEMINI_AVAILABLE = True
 else:
@@ -94,17 +132,35 @@ RESPONSE STRUCTURE:
 Remember: You are here to support, not to diagnose or treat. Always encourage professional help for serious concerns and actively promote the use of MindCare platform features.
 """
 
+SAFETY_SETTINGS = [
+    {
+        "category": "HARM_CATEGORY_HARASSMENT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_HATE_SPEECH",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    }
+]
+
 def get_feature_recommendations(user_message):
     """
     Get specific MindCare feature recommendations based on user's message
     Returns a list of relevant features with explanations
     """
-    message_lower = user_message.lower()
+    labels = classify_message(user_message)
     recommendations = []
     
     # Mood-related keywords
-    mood_keywords = ['mood', 'feeling', 'sad', 'happy', 'depressed', 'anxious', 'worried', 'stressed', 'overwhelmed']
-    if any(keyword in message_lower for keyword in mood_keywords):
+    if 'feature:mood' in labels:
         recommendations.append({
             'feature': 'Mood Tracker',
             'description': 'Track your daily mood patterns and identify triggers',
@@ -117,8 +173,7 @@ def get_feature_recommendations(user_message):
         })
     
     # Stress and anxiety keywords
-    stress_keywords = ['stress', 'anxiety', 'panic', 'worried', 'overwhelmed', 'pressure', 'deadline', 'exam']
-    if any(keyword in message_lower for keyword in stress_keywords):
+    if 'feature:stress' in labels:
         recommendations.append({
             'feature': 'Self-Assessment',
             'description': 'Take a comprehensive mental health assessment',
@@ -131,8 +186,7 @@ def get_feature_recommendations(user_message):
         })
     
     # Social and relationship keywords
-    social_keywords = ['lonely', 'isolated', 'friends', 'relationship', 'social', 'alone', 'connection']
-    if any(keyword in message_lower for keyword in social_keywords):
+    if 'feature:social' in labels:
         recommendations.append({
             'feature': 'Peer Support',
             'description': 'Connect with other students facing similar challenges',
@@ -140,8 +194,7 @@ def get_feature_recommendations(user_message):
         })
     
     # Professional help keywords
-    help_keywords = ['help', 'counselor', 'therapist', 'professional', 'serious', 'crisis', 'suicide', 'harm']
-    if any(keyword in message_lower for keyword in help_keywords):
+    if 'feature:help' in labels:
         recommendations.append({
             'feature': 'Book Session',
             'description': 'Schedule an appointment with a mental health professional',
@@ -149,8 +202,7 @@ def get_feature_recommendations(user_message):
         })
     
     # Learning and coping keywords
-    learning_keywords = ['learn', 'coping', 'strategies', 'techniques', 'tips', 'advice', 'resources']
-    if any(keyword in message_lower for keyword in learning_keywords):
+    if 'feature:learning' in labels:
         recommendations.append({
             'feature': 'Resources Library',
             'description': 'Access curated mental health resources and articles',
@@ -174,57 +226,182 @@ def get_feature_recommendations(user_message):
     
     return recommendations[:2]  # Return top 2 recommendations
 
-def get_gemini_model():
-    """Get the configured Gemini model for mental health support"""
+GEMINI_MODEL_NAME = "gemini-2.5-flash"
+
+GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "top_p": 0.8,
+    "top_k": 40,
+    "max_output_tokens": 1024,
+}
+
+# Process-wide model registry: one GenerativeModel per configuration, shared by
+# every request handled by this worker
+_model_registry = {}
+_model_registry_lock = threading.Lock()
+_model_registry_stats = {"built": 0, "reused": 0, "warmed": 0}
+
+def _model_registry_key(model_name, generation_config, safety_settings, system_instruction):
+    """Build a hashable key identifying a model configuration"""
+    return json.dumps([model_name, generation_config, safety_settings, system_instruction], sort_keys=True)
+
+def _model_class():
+    """genai.GenerativeModel, or the local stand-in when GEMINI_BACKEND is 'fake'"""
+    if GEMINI_BACKEND == 'fake':
+        from fake_gemini import FakeGenerativeModel
+        return FakeGenerativeModel
+    return genai.GenerativeModel
+
+def get_gemini_model(model_name=GEMINI_MODEL_NAME, generation_config=None, safety_settings=None,
+                     system_instruction=None):
+    """
+    Get the configured Gemini model for mental health support
+    
+    Models are built once per configuration and reused across requests. The
+    mental health system prompt is the model's system instruction, so it is
+    never repeated as chat text.
+    """
     if not GEMINI_AVAILABLE:
         return None
     
-    try:
-        model = genai.GenerativeModel(
-            model_name="gemini-2.5-flash",
-            generation_config={
-                "temperature": 0.7,
-                "top_p": 0.8,
-                "top_k": 40,
-                "max_output_tokens": 1024,
-            },
-            safety_settings=[
-                {
-                    "category": "HARM_CATEGORY_HARASSMENT",
-                    "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-                },
-                {
-                    "category": "HARM_CATEGORY_HATE_SPEECH",
-                    "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-                },
-                {
-                    "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                    "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-                },
-                {
-                    "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                    "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-                }
-            ]
-        )
+    generation_config = generation_config or GENERATION_CONFIG
+    safety_settings = safety_settings or SAFETY_SETTINGS
+    system_instruction = system_instruction or MENTAL_HEALTH_SYSTEM_PROMPT
+    key = _model_registry_key(model_name, generation_config, safety_settings, system_instruction)
+    
+    with _model_registry_lock:
+        model = _model_registry.get(key)
+        if model is not None:
+            _model_registry_stats["reused"] += 1
+            return model
+        
+        try:
+            model = _model_class()(
+                model_name=model_name,
+                generation_config=generation_config,
+                safety_settings=safety_settings,
+                system_instruction=system_instruction
+            )
+        except Exception as e:
+            print(f"Error initializing Gemini model: {e}")
+            return None
+        
+        _model_registry[key] = model
+        _model_registry_stats["built"] += 1
         return model
+
+def warm_gemini_models():
+    """
+    Build the default model and open its API connection ahead of the first chat
+    
+    Called from each gunicorn worker at startup (see gunicorn.conf.py). Uses
+    count_tokens, which does not consume generation quota.
+    """
+    model = get_gemini_model()
+    if model is None:
+        return False
+    
+    try:
+        model.count_tokens("warm-up")
     except Exception as e:
-        print(f"Error initializing Gemini model: {e}")
-        return None
+        logger.warning(f"Gemini warm-up request failed: {e}")
+        return False
+    
+    with _model_registry_lock:
+        _model_registry_stats["warmed"] += 1
+    return True
 
-def generate_mental_health_response(user_message, conversation_history=None):
+def get_model_registry_stats():
+    """Report how many models were built, how often they were reused and warmed"""
+    with _model_registry_lock:
+        return {**_model_registry_stats, "models": len(_model_registry)}
+
+CRISIS_RESPONSE_TEXT = """🚨 I'm really concerned about what you're sharing. Your safety is the most important thing right now. Please reach out to a crisis counselor immediately or call the mental health helpline at 1800-XXX-XXXX (24/7). You don't have to go through this alone - there are people who want to help you. Your life has value and meaning, even when it doesn't feel that way.
+
+🔴 IMMEDIATE SUPPORT:
+• Campus Counsellor: Mon-Fri 9AM-5PM
+• Crisis Helpline: 1800-XXX-XXXX (24/7)
+• Emergency: Call 911 or campus security
+• National Suicide Prevention Lifeline: 988
+
+💡 MINDCARE FEATURES TO HELP:
+• **Book Session**: Schedule immediate appointment with campus counselor
+• **Resources Library**: Access crisis support resources and coping strategies"""
+
+DEFAULT_EMPTY_RESPONSE = "I understand you're reaching out for support. Could you please share more about what's on your mind?"
+
+def triage_message(user_message):
     """
-    Generate a mental health focused response using Gemini API
+    Answer crisis messages before any model call
     
-    Args:
-        user_message (str): The user's message
-        conversation_history (list): Previous conversation context
+    Returns the crisis response, or None when the message should go on to Gemini.
+    The most urgent messages get an instant reply and spend no API quota.
+    """
+    if not is_crisis_message(user_message):
+        return None
     
-    Returns:
-        dict: Response with text, safety_flags, and metadata
+    logger.warning("Crisis message detected - replying with crisis resources")
+    return {
+        "text": CRISIS_RESPONSE_TEXT,
+        "safety_flags": ["crisis_detected"],
+        "model": "crisis-triage",
+        "timestamp": str(datetime.now())
+    }
+
+def build_conversation_prompt(user_message, conversation_history=None):
     """
+    Build the role-tagged contents sent to Gemini from the recent conversation
+    history and the current user message, within PROMPT_TOKEN_BUDGET
+    
+    The system prompt is not included - it is the model's system instruction
+    (see get_gemini_model) - but it is counted against the budget.
+    """
+    history = [
+        {'sender': msg.get('sender'), 'content': _strip_feature_section(msg.get('content', ''))}
+        if msg.get('sender') == 'ai' else msg
+        for msg in (conversation_history or [])
+    ]
+    
+    # Legacy clients send the current message as the last history entry
+    if history and history[-1].get('sender') == 'user' and history[-1].get('content') == user_message:
+        history.pop()
+    
+    prompt = build_prompt(user_message, history, PROMPT_TOKEN_BUDGET, MENTAL_HEALTH_SYSTEM_PROMPT)
+    logger.info(
+        f"Gemini prompt: ~{prompt.estimated_tokens} input tokens, "
+        f"{prompt.kept_turns} turns kept, {prompt.summarized_turns} summarized"
+    )
+    return prompt.contents
+
+def _log_usage(response):
+    """Log the input and output tokens Gemini billed for a call"""
+    usage = getattr(response, 'usage_metadata', None)
+    if usage:
+        logger.info(
+            f"Gemini usage: {usage.prompt_token_count} input tokens, "
+            f"{usage.candidates_token_count} output tokens"
+        )
+
+FEATURE_SECTION_HEADER = "\n\n💡 MINDCARE FEATURES THAT CAN HELP:\n"
+
+def _strip_feature_section(text):
+    """Drop the feature footer from an earlier reply - the model never wrote it"""
+    return text.split(FEATURE_SECTION_HEADER, 1)[0]
+
+def format_feature_section(user_message):
+    """Build the feature recommendation footer appended to non-crisis replies"""
+    recommendations = get_feature_recommendations(user_message)
+    if not recommendations:
+        return ""
+    feature_section = FEATURE_SECTION_HEADER
+    for rec in recommendations:
+        feature_section += f"• **{rec['feature']}**: {rec['description']} - {rec['benefit']}\n"
+    return feature_section
+
+def _model_or_error():
+    """Return (model, None), or (None, error response) when Gemini can't be used"""
     if not GEMINI_AVAILABLE:
-        return {
+        return None, {
             "text": "I'm currently unavailable. Please try again later or contact campus counseling directly.",
             "safety_flags": [],
             "error": "Gemini API not available"
@@ -232,153 +409,256 @@ def generate_mental_health_response(user_message, conversation_history=None):
     
     model = get_gemini_model()
     if not model:
-        return {
+        return None, {
             "text": "I'm experiencing technical difficulties. Please contact campus counseling for immediate support.",
             "safety_flags": [],
             "error": "Model initialization failed"
         }
+    return model, None
+
+def _failover_response(user_message, conversation_history):
+    """Answer with the local fallback engine while Gemini is failing or the breaker is open"""
+    response = gemini_fallback.generate_mental_health_response(user_message, conversation_history)
+    return {**response, "safety_flags": response.get("safety_flags", []) + ["gemini_failover"]}
+
+def _reply_events(response):
+    """Stream events for a reply that was produced in one go"""
+    return [
+        {"type": "chunk", "text": response["text"]},
+        {
+            "type": "done",
+            "safety_flags": response["safety_flags"],
+            "model": response.get("model", ""),
+            "timestamp": response.get("timestamp", str(datetime.now()))
+        }
+    ]
+
+def _build_gemini_response(user_message, response):
+    """Turn a completed Gemini response into the reply dict returned to the view"""
+    _log_usage(response)
+    
+    # Check for safety issues
+    safety_flags = []
+    if response.prompt_feedback and response.prompt_feedback.block_reason:
+        safety_flags.append("content_blocked")
+    
+    # Extract response text and add feature recommendations
+    # (crisis messages never reach the model - see triage_message)
+    response_text = response.text if response.text else DEFAULT_EMPTY_RESPONSE
+    response_text += format_feature_section(user_message)
     
+    return {
+        "text": response_text,
+        "safety_flags": safety_flags,
+        "model": "gemini-1.5-flash",
+        "timestamp": str(datetime.now()),
+        "feature_recommendations": get_feature_recommendations(user_message)
+    }
+
+def generate_mental_health_response(user_message, conversation_history=None):
+    """
+    Generate a mental health focused response using Gemini API
+    
+    Args:
+        user_message (str): The user's message
+        conversation_history (list): Previous conversation context
+    
+    Returns:
+        dict: Response with text, safety_flags, and metadata
+    """
+    crisis_response = triage_message(user_message)
+    if crisis_response:
+        return crisis_response
+    
+    model, error_response = _model_or_error()
+    if error_response:
+        return error_response
+    if not GEMINI_BREAKER.allow_request():
+        return _failover_response(user_message, conversation_history)
+    
+    started = time.monotonic()
     try:
-        # Build conversation context
-        conversation_parts = [MENTAL_HEALTH_SYSTEM_PROMPT]
-        
-        # --- FIX: Clean the incoming history array ---
-        clean_history = conversation_history[:] if conversation_history else []
-        
-        # The last message in the list is always the current user_message, 
-        # sent prematurely by the frontend. Remove it so we can append it cleanly later.
-        if clean_history and clean_history[-1].get('sender') == 'user' and clean_history[-1].get('content') == user_message:
-            clean_history.pop()
-        
-        # Add conversation history up to the last AI response (or second to last user message)
-        if clean_history:
-            # Only iterate over the cleaned history
-            for msg in clean_history[-6:]:  # Keep last 6 messages for context [cite: 2]
-                if msg.get('sender') == 'user':
-                    conversation_parts.append(f"User: {msg.get('content', '')}")
-                elif msg.get('sender') == 'ai':
-                    # Add AI response to the history correctly
-                    conversation_parts.append(f"Assistant: {msg.get('content', '')}")
-
-# Add current user message
-        conversation_parts.append(f"User: {user_message}")
-        conversation_parts.append("Assistant:")
-# ...
-        
-        # Generate response
         response = model.generate_content(
-            "\n".join(conversation_parts),
-            safety_settings=[
-                {
-                    "category": "HARM_CATEGORY_HARASSMENT",
-                    "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-                },
-                {
-                    "category": "HARM_CATEGORY_HATE_SPEECH", 
-                    "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-                },
-                {
-                    "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                    "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-                },
-                {
-                    "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                    "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-                }
-            ]
+            build_conversation_prompt(user_message, conversation_history),
+            safety_settings=SAFETY_SETTINGS,
+            request_options=REQUEST_OPTIONS
         )
-        
-        # Check for safety issues
-        safety_flags = []
-        if response.prompt_feedback and response.prompt_feedback.block_reason:
-            safety_flags.append("content_blocked")
-        
-        # Extract response text
-        response_text = response.text if response.text else "I understand you're reaching out for support. Could you please share more about what's on your mind?"
-        
-        # Add crisis resources if certain keywords are detected
-        crisis_keywords = ['suicide', 'kill myself', 'end it all', 'hurt myself', 'die', 'hopeless', 'worthless', 'not want to live', 'don\'t want to live', 'do not want to live', 'end my life']
-        if any(keyword in user_message.lower() for keyword in crisis_keywords):
-            response_text = """🚨 I'm really concerned about what you're sharing. Your safety is the most important thing right now. Please reach out to a crisis counselor immediately or call the mental health helpline at 1800-XXX-XXXX (24/7). You don't have to go through this alone - there are people who want to help you. Your life has value and meaning, even when it doesn't feel that way.
-
-🔴 IMMEDIATE SUPPORT:
-• Campus Counsellor: Mon-Fri 9AM-5PM
-• Crisis Helpline: 1800-XXX-XXXX (24/7)
-• Emergency: Call 911 or campus security
-• National Suicide Prevention Lifeline: 988
+        reply = _build_gemini_response(user_message, response)
+    except Exception as e:
+        GEMINI_BREAKER.record_failure(time.monotonic() - started)
+        print(f"Error generating Gemini response: {e}")
+        return _failover_response(user_message, conversation_history)
+    
+    GEMINI_BREAKER.record_success(time.monotonic() - started)
+    return reply
 
-💡 MINDCARE FEATURES TO HELP:
-• **Book Session**: Schedule immediate appointment with campus counselor
-• **Resources Library**: Access crisis support resources and coping strategies"""
-            safety_flags.append("crisis_detected")
-        else:
-            # Add feature recommendations for non-crisis situations
-            recommendations = get_feature_recommendations(user_message)
-            if recommendations:
-                feature_section = "\n\n💡 MINDCARE FEATURES THAT CAN HELP:\n"
-                for rec in recommendations:
-                    feature_section += f"• **{rec['feature']}**: {rec['description']} - {rec['benefit']}\n"
-                response_text += feature_section
-        
-        return {
-            "text": response_text,
-            "safety_flags": safety_flags,
-            "model": "gemini-1.5-flash",
-            "timestamp": str(datetime.now()),
-            "feature_recommendations": get_feature_recommendations(user_message)
-        }
-        
+async def agenerate_mental_health_response(user_message, conversation_history=None):
+    """
+    Async version of generate_mental_health_response for ASGI views
+    
+    Awaits the Gemini call instead of blocking, so one worker can hold many
+    chats in flight. Only call this from a long-lived event loop (uvicorn):
+    the async client binds to the loop it was first used on.
+    """
+    crisis_response = triage_message(user_message)
+    if crisis_response:
+        return crisis_response
+    
+    model, error_response = _model_or_error()
+    if error_response:
+        return error_response
+    if not GEMINI_BREAKER.allow_request():
+        return _failover_response(user_message, conversation_history)
+    
+    started = time.monotonic()
+    try:
+        response = await model.generate_content_async(
+            build_conversation_prompt(user_message, conversation_history),
+            safety_settings=SAFETY_SETTINGS,
+            request_options=REQUEST_OPTIONS
+        )
+        reply = _build_gemini_response(user_message, response)
     except Exception as e:
+        GEMINI_BREAKER.record_failure(time.monotonic() - started)
         print(f"Error generating Gemini response: {e}")
-        return {
-            "text": "I'm having trouble processing your message right now. Please try again or contact campus counseling for immediate support.",
-            "safety_flags": ["api_error"],
-            "error": str(e)
-        }
+        return _failover_response(user_message, conversation_history)
+    
+    GEMINI_BREAKER.record_success(time.monotonic() - started)
+    return reply
 
-def is_mental_health_related(message):
+def _start_stream(user_message, conversation_history):
+    """
+    Return (model, None) when the reply should be streamed from Gemini, or
+    (None, events) with the complete event list when it should not
     """
-    Check if the message is related to mental health topics
+    crisis_response = triage_message(user_message)
+    if crisis_response:
+        return None, _reply_events(crisis_response)
     
-    Args:
-        message (str): User's message
+    model, error_response = _model_or_error()
+    if error_response:
+        return None, [{"type": "error", "text": error_response["text"], "error": error_response["error"]}]
+    if not GEMINI_BREAKER.allow_request():
+        return None, _reply_events(_failover_response(user_message, conversation_history))
+    return model, None
+
+def _chunk_text(chunk):
+    """Text of a streamed chunk, or '' when it carries no text part"""
+    try:
+        return chunk.text
+    except ValueError:
+        # e.g. the chunk was blocked by safety filters
+        return ""
+
+def _finish_stream(user_message, response, sent_text, safety_flags):
+    """Events closing a streamed reply: empty-reply text, feature footer and done"""
+    events = []
+    if response is not None:
+        _log_usage(response)
+    if response is not None and response.prompt_feedback and response.prompt_feedback.block_reason:
+        safety_flags.append("content_blocked")
+    if not sent_text:
+        events.append({"type": "chunk", "text": DEFAULT_EMPTY_RESPONSE})
     
-    Returns:
-        bool: True if mental health related, False otherwise
+    feature_section = format_feature_section(user_message)
+    if feature_section:
+        events.append({"type": "chunk", "text": feature_section})
+    
+    events.append({
+        "type": "done",
+        "safety_flags": safety_flags,
+        "model": "gemini-1.5-flash",
+        "timestamp": str(datetime.now())
+    })
+    return events
+
+def stream_mental_health_response(user_message, conversation_history=None):
     """
-    mental_health_keywords = [
-        # Emotions and feelings
-        'anxious', 'anxiety', 'worried', 'nervous', 'stressed', 'stress',
-        'depressed', 'depression', 'sad', 'lonely', 'empty', 'hopeless',
-        'angry', 'frustrated', 'overwhelmed', 'tired', 'exhausted',
-        
-        # Mental health conditions
-        'panic', 'panic attack', 'phobia', 'trauma', 'ptsd', 'ocd',
-        'bipolar', 'eating disorder', 'self-harm', 'suicide',
-        
-        # Academic and life stress
-        'exam', 'study', 'grades', 'academic', 'college', 'university',
-        'pressure', 'deadline', 'assignment', 'project', 'presentation',
-        
-        # Relationships and social
-        'relationship', 'breakup', 'friend', 'family', 'social', 'lonely',
-        'isolated', 'rejected', 'bullied', 'conflict',
-        
-        # Sleep and wellness
-        'sleep', 'insomnia', 'nightmare', 'appetite', 'eating', 'exercise',
-        'health', 'wellness', 'self-care', 'coping',
-        
-        # Future and career
-        'future', 'career', 'job', 'interview', 'graduation', 'uncertainty',
-        'decision', 'choice', 'path', 'direction',
-        
-        # General mental health terms
-        'mental health', 'therapy', 'counseling', 'counselling', 'psychologist',
-        'psychiatrist', 'medication', 'treatment', 'support', 'help'
-    ]
+    Stream a mental health focused response from Gemini as it is generated
+    
+    Yields dicts of the form {"type": "chunk", "text": ...} for each piece of
+    the reply, followed by a single {"type": "done", ...} event carrying the
+    safety flags and metadata, or {"type": "error", ...} if generation failed.
+    When Gemini fails before the first chunk, the fallback reply is streamed.
+    """
+    model, events = _start_stream(user_message, conversation_history)
+    if events:
+        yield from events
+        return
+    
+    response = None
+    safety_flags = []
+    sent_text = False
+    failed = False
+    started = time.monotonic()
+    try:
+        response = model.generate_content(
+            build_conversation_prompt(user_message, conversation_history),
+            safety_settings=SAFETY_SETTINGS,
+            stream=True,
+            request_options=REQUEST_OPTIONS
+        )
+        for chunk in response:
+            text = _chunk_text(chunk)
+            if text:
+                sent_text = True
+                yield {"type": "chunk", "text": text}
+    except Exception as e:
+        failed = True
+        GEMINI_BREAKER.record_failure(time.monotonic() - started)
+        print(f"Error streaming Gemini response: {e}")
+        if not sent_text:
+            yield from _reply_events(_failover_response(user_message, conversation_history))
+            return
+        safety_flags.append("api_error")
+    finally:
+        # Also reached when the client disconnects mid-stream
+        if not failed:
+            GEMINI_BREAKER.record_success(time.monotonic() - started)
+    
+    yield from _finish_stream(user_message, response, sent_text, safety_flags)
+
+async def astream_mental_health_response(user_message, conversation_history=None):
+    """Async version of stream_mental_health_response for ASGI views"""
+    model, events = _start_stream(user_message, conversation_history)
+    if events:
+        for event in events:
+            yield event
+        return
+    
+    response = None
+    safety_flags = []
+    sent_text = False
+    failed = False
+    started = time.monotonic()
+    try:
+        response = await model.generate_content_async(
+            build_conversation_prompt(user_message, conversation_history),
+            safety_settings=SAFETY_SETTINGS,
+            stream=True,
+            request_options=REQUEST_OPTIONS
+        )
+        async for chunk in response:
+            text = _chunk_text(chunk)
+            if text:
+                sent_text = True
+                yield {"type": "chunk", "text": text}
+    except Exception as e:
+        failed = True
+        GEMINI_BREAKER.record_failure(time.monotonic() - started)
+        print(f"Error streaming Gemini response: {e}")
+        if not sent_text:
+            for event in _reply_events(_failover_response(user_message, conversation_history)):
+                yield event
+            return
+        safety_flags.append("api_error")
+    finally:
+        # Also reached when the client disconnects mid-stream
+        if not failed:
+            GEMINI_BREAKER.record_success(time.monotonic() - started)
     
-    message_lower = message.lower()
-    return any(keyword in message_lower for keyword in mental_health_keywords)
+    for event in _finish_stream(user_message, response, sent_text, safety_flags):
+        yield event
 
 def get_off_topic_response():
     """Get a response for non-mental health related topics"""
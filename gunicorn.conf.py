@@ -0,0 +1,33 @@
+"""
+Gunicorn configuration for MindCare
+
+Gunicorn loads ./gunicorn.conf.py automatically, so the start commands in
+start.sh, Procfile and railway.json all pick up these hooks.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def post_worker_init(worker):
+    """Warm the Gemini model in every worker so the first chat doesn't pay for setup"""
+    try:
+        from gemini_config import warm_gemini_models, get_model_registry_stats
+    except ImportError:
+        return
+
+    if warm_gemini_models():
+        logger.info(f"Gemini model warmed in worker {worker.pid}: {get_model_registry_stats()}")
+
+
+def worker_exit(server, worker):
+    """Write any chat transcript turns still buffered in the exiting worker"""
+    try:
+        from base.transcripts import TRANSCRIPT_BUFFER
+    except Exception:
+        return
+
+    written = TRANSCRIPT_BUFFER.close()
+    if written:
+        logger.info(f"Wrote {written} buffered transcript turn(s) from worker {worker.pid}")
@@ -0,0 +1,173 @@
+"""
+Single-pass keyword classifier shared by gemini_config and gemini_fallback
+
+Every keyword list used on the chat path is compiled at import time into one
+regular expression. One scan of the lowercased message returns every label
+at once: on-topic, crisis, feature categories and fallback intents (read
+from fallback_rules.json). Matching keeps the old substring semantics (e.g.
+'stress' still matches 'stressed').
+"""
+
+import json
+import os
+import re
+from functools import lru_cache
+
+# On-topic detection (is_mental_health_related)
+ON_TOPIC_KEYWORDS = [
+    # Emotions and feelings
+    'anxious', 'anxiety', 'worried', 'nervous', 'stressed', 'stress',
+    'depressed', 'depression', 'sad', 'lonely', 'empty', 'hopeless',
+    'angry', 'frustrated', 'overwhelmed', 'tired', 'exhausted',
+
+    # Mental health conditions
+    'panic', 'panic attack', 'phobia', 'trauma', 'ptsd', 'ocd',
+    'bipolar', 'eating disorder', 'self-harm', 'suicide',
+
+    # Academic and life stress
+    'exam', 'study', 'grades', 'academic', 'college', 'university',
+    'pressure', 'deadline', 'assignment', 'project', 'presentation',
+
+    # Relationships and social
+    'relationship', 'breakup', 'friend', 'family', 'social', 'lonely',
+    'isolated', 'rejected', 'bullied', 'conflict',
+
+    # Sleep and wellness
+    'sleep', 'insomnia', 'nightmare', 'appetite', 'eating', 'exercise',
+    'health', 'wellness', 'self-care', 'coping',
+
+    # Future and career
+    'future', 'career', 'job', 'interview', 'graduation', 'uncertainty',
+    'decision', 'choice', 'path', 'direction',
+
+    # General mental health terms
+    'mental health', 'therapy', 'counseling', 'counselling', 'psychologist',
+    'psychiatrist', 'medication', 'treatment', 'support', 'help'
+]
+
+# Crisis statements. CRISIS_KEYWORDS adds 'die', which is too broad to count
+# as on-topic on its own (it matches 'diet', 'studied', ...)
+CRISIS_PHRASES = [
+    'suicide', 'kill myself', 'end it all', 'hurt myself', 'hopeless', 'worthless',
+    'not want to live', 'don\'t want to live', 'do not want to live', 'end my life',
+    'want to die'
+]
+CRISIS_KEYWORDS = CRISIS_PHRASES + ['die']
+
+# MindCare feature recommendations (get_feature_recommendations)
+FEATURE_KEYWORDS = {
+    'mood': ['mood', 'feeling', 'sad', 'happy', 'depressed', 'anxious', 'worried', 'stressed', 'overwhelmed'],
+    'stress': ['stress', 'anxiety', 'panic', 'worried', 'overwhelmed', 'pressure', 'deadline', 'exam'],
+    'social': ['lonely', 'isolated', 'friends', 'relationship', 'social', 'alone', 'connection'],
+    'help': ['help', 'counselor', 'therapist', 'professional', 'serious', 'crisis', 'suicide', 'harm'],
+    'learning': ['learn', 'coping', 'strategies', 'techniques', 'tips', 'advice', 'resources'],
+}
+
+# Fallback engine intents, declared with the rules that use them
+FALLBACK_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fallback_rules.json')
+
+def _load_intent_keywords():
+    with open(FALLBACK_RULES_PATH, encoding='utf-8') as rules_file:
+        return json.load(rules_file)['intents']
+
+INTENT_KEYWORDS = _load_intent_keywords()
+
+KEYWORD_GROUPS = {
+    'on_topic': ON_TOPIC_KEYWORDS,
+    'crisis': CRISIS_KEYWORDS,
+    'crisis_phrase': CRISIS_PHRASES,
+    **{f'feature:{name}': keywords for name, keywords in FEATURE_KEYWORDS.items()},
+    **{f'intent:{name}': keywords for name, keywords in INTENT_KEYWORDS.items()},
+}
+
+
+def _trie_pattern(keywords):
+    """
+    Build a regex alternation factored by common prefixes, so the engine
+    follows one branch per character instead of trying every keyword in turn.
+    Longer keywords win over their prefixes ('stressed' over 'stress').
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def build(node):
+        terminal = '' in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if terminal:
+            return '(?:' + body + ')?'
+        return body
+
+    return build(trie)
+
+
+class KeywordClassifier:
+    """
+    Labels a message from named keyword groups in a single regex scan
+
+    Args:
+        groups (dict): label -> list of lowercase keywords
+    """
+
+    def __init__(self, groups):
+        labels_by_keyword = {}
+        for label, keywords in groups.items():
+            for keyword in keywords:
+                labels_by_keyword.setdefault(keyword, set()).add(label)
+
+        # A scan reports the longest keyword starting at each position, so a
+        # keyword also carries the labels of every keyword that is its prefix
+        self._labels = {}
+        for keyword in labels_by_keyword:
+            labels = set()
+            for other, other_labels in labels_by_keyword.items():
+                if keyword.startswith(other):
+                    labels |= other_labels
+            self._labels[keyword] = frozenset(labels)
+
+        # The lookahead makes matches zero-width, so overlapping keywords
+        # ('self-harm' and 'harm') are all found
+        self._pattern = re.compile('(?=(' + _trie_pattern(labels_by_keyword) + '))')
+
+    def classify(self, message):
+        """Return the frozenset of labels whose keywords occur in the message"""
+        found = set()
+        for keyword in set(self._pattern.findall(message.lower())):
+            found |= self._labels[keyword]
+        return frozenset(found)
+
+
+DEFAULT_CLASSIFIER = KeywordClassifier(KEYWORD_GROUPS)
+
+# Whole words only, unlike the substring scan, so neither counsellor alerts
+# (see base/crisis_alerts.py) nor the crisis reply fire on words that merely
+# contain a keyword ('diet', 'studied', 'audience')
+CRISIS_PHRASE_PATTERN = re.compile(r'\b(?:' + '|'.join(map(re.escape, CRISIS_PHRASES)) + r')\b')
+CRISIS_PATTERN = re.compile(r'\b(?:' + '|'.join(map(re.escape, CRISIS_KEYWORDS)) + r')\b')
+
+
+def has_crisis_phrase(message):
+    """Whether the message contains a crisis phrase as whole words"""
+    return CRISIS_PHRASE_PATTERN.search(message.lower()) is not None
+
+
+def is_crisis_message(message):
+    """Whether the message gets the crisis reply: a crisis phrase or 'die', as whole words"""
+    return CRISIS_PATTERN.search(message.lower()) is not None
+
+
+@lru_cache(maxsize=1024)
+def classify_message(message):
+    """
+    Labels for a chat message from the default keyword groups
+
+    Cached, so the topic filter, crisis check and feature recommendations
+    for one message share a single scan.
+    """
+    return DEFAULT_CLASSIFIER.classify(message)
@@ -86,6 +86,11 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "project.wsgi.application"
+ASGI_APPLICATION = "project.asgi.application"
+
+# Set ASGI_MODE when serving project.asgi under uvicorn workers (see start.sh):
+# the chat endpoint then uses the async view instead of blocking a worker
+ASGI_MODE = ENV_CONFIG['ASGI_MODE']
 
 
 # Database
@@ -121,6 +126,30 @@ else:
     logger.info("✅ Using SQLite (no DATABASE_URL found)")
 
 
+# Cache
+# Conversations, the chat reply cache and rate-limit buckets live here and must
+# be shared by every worker. Use Redis in production (set REDIS_URL and
+# configure the server with maxmemory-policy allkeys-lru). Without it, the
+# cache is a table in the database (created by migration 0015), slower but
+# still shared - a per-process memory cache would give each worker its own
+# conversations and its own rate limits.
+if ENV_CONFIG.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": ENV_CONFIG["REDIS_URL"],
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": "mindcare_cache",
+            "OPTIONS": {"MAX_ENTRIES": 5000},
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -171,6 +200,63 @@ SUPABASE_PROJECT_REF = ENV_CONFIG['SUPABASE_PROJECT_REF']
 
 # Gemini API Configuration
 GEMINI_API_KEY = ENV_CONFIG['GEMINI_API_KEY']
+# 'google' (default) or 'fake' for offline load tests (see fake_gemini.py)
+GEMINI_BACKEND = ENV_CONFIG['GEMINI_BACKEND']
+
+# Seconds a chat reply stays cached for identical prompts (0 disables)
+CHAT_RESPONSE_CACHE_TTL = ENV_CONFIG['CHAT_RESPONSE_CACHE_TTL']
+
+# Seconds chat turns stay in the server-side conversation store
+CHAT_CONVERSATION_TTL = ENV_CONFIG['CHAT_CONVERSATION_TTL']
+
+# Input tokens per Gemini call; the oldest history is summarized to fit
+CHAT_PROMPT_TOKEN_BUDGET = ENV_CONFIG['CHAT_PROMPT_TOKEN_BUDGET']
+
+# Seconds before a Gemini call is abandoned; chats fail over to gemini_fallback
+CHAT_GEMINI_TIMEOUT = ENV_CONFIG['CHAT_GEMINI_TIMEOUT']
+# Consecutive failed or slow (> CHAT_BREAKER_SLOW_SECONDS) calls that open the
+# breaker, and seconds it stays open before a probe call
+CHAT_BREAKER_FAILURES = ENV_CONFIG['CHAT_BREAKER_FAILURES']
+CHAT_BREAKER_SLOW_SECONDS = ENV_CONFIG['CHAT_BREAKER_SLOW_SECONDS']
+CHAT_BREAKER_RESET_SECONDS = ENV_CONFIG['CHAT_BREAKER_RESET_SECONDS']
+
+# Gemini calls per minute per user and per institution (see base/rate_limit.py);
+# Institution fields override the defaults. Over-limit chats get local replies
+CHAT_RATE_LIMIT_ENABLED = ENV_CONFIG['CHAT_RATE_LIMIT_ENABLED']
+CHAT_USER_RATE_PER_MINUTE = ENV_CONFIG['CHAT_USER_RATE_PER_MINUTE']
+CHAT_INSTITUTION_RATE_PER_MINUTE = ENV_CONFIG['CHAT_INSTITUTION_RATE_PER_MINUTE']
+# Reverse proxies in front of the app that append to X-Forwarded-For (1 on
+# Render or Railway). Anonymous chats are limited per address; with 0 the
+# header is ignored and REMOTE_ADDR is used, since clients can forge it
+CHAT_TRUSTED_PROXY_COUNT = ENV_CONFIG['CHAT_TRUSTED_PROXY_COUNT']
+
+# Opt-in chat transcripts, buffered per worker and written with bulk_create every
+# CHAT_TRANSCRIPT_BATCH_SIZE turns or CHAT_TRANSCRIPT_FLUSH_SECONDS. Kept for
+# CHAT_TRANSCRIPT_RETENTION_DAYS unless the institution sets its own period
+CHAT_TRANSCRIPTS_ENABLED = ENV_CONFIG['CHAT_TRANSCRIPTS_ENABLED']
+CHAT_TRANSCRIPT_BATCH_SIZE = ENV_CONFIG['CHAT_TRANSCRIPT_BATCH_SIZE']
+CHAT_TRANSCRIPT_FLUSH_SECONDS = ENV_CONFIG['CHAT_TRANSCRIPT_FLUSH_SECONDS']
+CHAT_TRANSCRIPT_RETENTION_DAYS = ENV_CONFIG['CHAT_TRANSCRIPT_RETENTION_DAYS']
+
+# Device tokens let the mood tracker call the mood APIs without a session or a
+# user lookup per request; they expire after this many days
+MOOD_DEVICE_TOKEN_DAYS = ENV_CONFIG['MOOD_DEVICE_TOKEN_DAYS']
+
+# Counsellor addresses for crisis alerts (see base/crisis_alerts.py), used when
+# the student's institution has none of its own
+CRISIS_ALERT_EMAILS = ENV_CONFIG['CRISIS_ALERT_EMAILS']
+
+# Outgoing email; without EMAIL_HOST messages are printed by the console backend
+if ENV_CONFIG['EMAIL_HOST']:
+    EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+    EMAIL_HOST = ENV_CONFIG['EMAIL_HOST']
+    EMAIL_PORT = ENV_CONFIG['EMAIL_PORT']
+    EMAIL_HOST_USER = ENV_CONFIG['EMAIL_HOST_USER']
+    EMAIL_HOST_PASSWORD = ENV_CONFIG['EMAIL_HOST_PASSWORD']
+    EMAIL_USE_TLS = ENV_CONFIG['EMAIL_USE_TLS']
+else:
+    EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+DEFAULT_FROM_EMAIL = ENV_CONFIG['DEFAULT_FROM_EMAIL']
 
 # CSRF Configuration for production
 CSRF_TRUSTED_ORIGINS = [
@@ -16,8 +16,19 @@ def get_env(key, default=""):
 def get_bool(key, default=False):
     """Get boolean environment variable"""
     value = os.getenv(key, "").strip().lower()
+    if not value:
+        return default
     return value in ('true', '1', 'yes', 'on')
 
+def get_int(key, default=0):
+    """Get integer environment variable, falling back to default when unset or invalid"""
+    value = os.getenv(key, "").strip()
+    try:
+        return int(value) if value else default
+    except ValueError:
+        logger.error(f"Invalid integer for {key}, using default {default}")
+        return default
+
 def validate_supabase_url(url):
     """Validate and extract project reference from Supabase URL"""
     if not url:
@@ -66,10 +77,49 @@ def get_environment_config():
     config['SUPABASE_ANON_KEY'] = get_env('SUPABASE_ANON_KEY')
     config['SUPABASE_SERVICE_ROLE_KEY'] = get_env('SUPABASE_SERVICE_ROLE_KEY')
     config['GEMINI_API_KEY'] = get_env('GEMINI_API_KEY')
+    # 'fake' swaps in the local stand-in from fake_gemini.py (load tests only)
+    config['GEMINI_BACKEND'] = get_env('GEMINI_BACKEND', 'google')
     config['DATABASE_URL'] = get_env('DATABASE_URL')
+    config['REDIS_URL'] = get_env('REDIS_URL')
+    
+    # Chat response cache lifetime in seconds (0 disables the cache)
+    config['CHAT_RESPONSE_CACHE_TTL'] = get_int('CHAT_RESPONSE_CACHE_TTL', 3600)
+    # Seconds chat turns are kept on the server for conversation context
+    config['CHAT_CONVERSATION_TTL'] = get_int('CHAT_CONVERSATION_TTL', 6 * 3600)
+    # Input tokens per Gemini call, system prompt included
+    config['CHAT_PROMPT_TOKEN_BUDGET'] = get_int('CHAT_PROMPT_TOKEN_BUDGET', 2000)
+    # Gemini call deadline and circuit breaker (see circuit_breaker.py)
+    config['CHAT_GEMINI_TIMEOUT'] = get_int('CHAT_GEMINI_TIMEOUT', 15)
+    config['CHAT_BREAKER_FAILURES'] = get_int('CHAT_BREAKER_FAILURES', 5)
+    config['CHAT_BREAKER_SLOW_SECONDS'] = get_int('CHAT_BREAKER_SLOW_SECONDS', 10)
+    config['CHAT_BREAKER_RESET_SECONDS'] = get_int('CHAT_BREAKER_RESET_SECONDS', 30)
+    # Default chat rate limits; institutions can override them in the admin
+    config['CHAT_RATE_LIMIT_ENABLED'] = get_bool('CHAT_RATE_LIMIT_ENABLED', True)
+    config['CHAT_USER_RATE_PER_MINUTE'] = get_int('CHAT_USER_RATE_PER_MINUTE', 10)
+    config['CHAT_INSTITUTION_RATE_PER_MINUTE'] = get_int('CHAT_INSTITUTION_RATE_PER_MINUTE', 300)
+    config['CHAT_TRUSTED_PROXY_COUNT'] = get_int('CHAT_TRUSTED_PROXY_COUNT', 0)
+    # Opt-in storage of chat transcripts, written in batches (see base/transcripts.py)
+    config['CHAT_TRANSCRIPTS_ENABLED'] = get_bool('CHAT_TRANSCRIPTS_ENABLED', False)
+    config['CHAT_TRANSCRIPT_BATCH_SIZE'] = get_int('CHAT_TRANSCRIPT_BATCH_SIZE', 100)
+    config['CHAT_TRANSCRIPT_FLUSH_SECONDS'] = get_int('CHAT_TRANSCRIPT_FLUSH_SECONDS', 5)
+    config['CHAT_TRANSCRIPT_RETENTION_DAYS'] = get_int('CHAT_TRANSCRIPT_RETENTION_DAYS', 30)
+    # Lifetime of the mood tracker's signed device tokens (see base/identity.py)
+    config['MOOD_DEVICE_TOKEN_DAYS'] = get_int('MOOD_DEVICE_TOKEN_DAYS', 180)
+    # Counsellors alerted about crisis chats when the student's institution lists none
+    crisis_alert_emails = get_env('CRISIS_ALERT_EMAILS')
+    config['CRISIS_ALERT_EMAILS'] = [email.strip() for email in crisis_alert_emails.split(',') if email.strip()]
+    
+    # Outgoing email (crisis alerts); without EMAIL_HOST mail is written to the console
+    config['EMAIL_HOST'] = get_env('EMAIL_HOST')
+    config['EMAIL_PORT'] = get_int('EMAIL_PORT', 587)
+    config['EMAIL_HOST_USER'] = get_env('EMAIL_HOST_USER')
+    config['EMAIL_HOST_PASSWORD'] = get_env('EMAIL_HOST_PASSWORD')
+    config['EMAIL_USE_TLS'] = get_bool('EMAIL_USE_TLS', True)
+    config['DEFAULT_FROM_EMAIL'] = get_env('DEFAULT_FROM_EMAIL', 'MindCare <noreply@mindcare.local>')
     
     # Boolean settings
     config['DEBUG'] = get_bool('DEBUG', False)
+    config['ASGI_MODE'] = get_bool('ASGI_MODE', False)
     
     # ALLOWED_HOSTS configuration - always include Render domains
     default_hosts = 'localhost,127.0.0.1,testserver,mindcare-platform-1.onrender.com,mindcare-platform.onrender.com'
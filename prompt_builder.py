@@ -0,0 +1,134 @@
+"""
+Token-budgeted prompt assembly for the Gemini chat
+
+The system prompt goes to the model as its system instruction, and the
+conversation is sent as role-tagged contents. History is fitted to an input
+token budget newest-first. Older turns that do not fit are replaced by a short
+extractive summary of what the student said, so every request costs a
+predictable number of input tokens however long the chat gets.
+
+Token counts are estimated locally (about 4 characters per token for Gemini
+on English text). Asking the API with count_tokens would cost a network round
+trip per message; the real count is logged from the response's usage metadata.
+"""
+
+import math
+from collections import namedtuple
+
+CHARS_PER_TOKEN = 4
+
+# No single history turn or incoming message may take more than this
+MAX_TURN_TOKENS = 400
+MAX_MESSAGE_TOKENS = 1000
+
+# Room kept for the summary of turns that no longer fit
+SUMMARY_TOKENS = 120
+
+TRUNCATION_MARK = ' …'
+SUMMARY_HEADER = '(Summary of earlier messages in this conversation) The student said: '
+
+ROLES = {'user': 'user', 'ai': 'model'}
+
+Prompt = namedtuple('Prompt', ['contents', 'estimated_tokens', 'kept_turns', 'summarized_turns'])
+
+
+def estimate_tokens(text):
+    """Estimated Gemini token count of a piece of text"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text to about max_tokens, at a word boundary where possible"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    limit = max(max_tokens * CHARS_PER_TOKEN - len(TRUNCATION_MARK), 0)
+    cut = text[:limit]
+    if ' ' in cut:
+        cut = cut.rsplit(' ', 1)[0]
+    return cut + TRUNCATION_MARK
+
+
+def _first_sentence(text):
+    for mark in '.!?\n':
+        index = text.find(mark)
+        if 0 < index < 160:
+            return text[:index]
+    return truncate_to_tokens(text, 40)
+
+
+def summarize_turns(turns, max_tokens):
+    """
+    One-line extractive summary of turns that were dropped from the prompt
+
+    Keeps the opening sentence of each thing the student said, most recent
+    last, within max_tokens. Assistant turns are left out - the model only
+    needs to know what it was told.
+    """
+    said = [_first_sentence(turn['content']).strip() for turn in turns if turn['sender'] == 'user']
+    said = [f'"{sentence}"' for sentence in said if sentence]
+    if not said:
+        return ''
+    return truncate_to_tokens(SUMMARY_HEADER + '; '.join(said), max_tokens)
+
+
+def _append(contents, role, text):
+    """Add a turn, merging it into the previous content when the role repeats"""
+    if contents and contents[-1]['role'] == role:
+        contents[-1]['parts'].append(text)
+    else:
+        contents.append({'role': role, 'parts': [text]})
+
+
+def build_prompt(user_message, history, budget, system_instruction=''):
+    """
+    Fit a conversation into an input token budget
+
+    Args:
+        user_message (str): The new message
+        history (list): Earlier turns as [{'sender': 'user'|'ai', 'content'}], oldest first
+        budget (int): Input tokens allowed, including the system instruction
+        system_instruction (str): Sent alongside the contents; counted against the budget
+
+    Returns:
+        Prompt: contents for generate_content (alternating roles, starting
+        with 'user'), the estimated input tokens, and how many history turns
+        were kept verbatim or left to the summary
+    """
+    message = truncate_to_tokens(user_message, MAX_MESSAGE_TOKENS)
+    remaining = budget - estimate_tokens(system_instruction) - estimate_tokens(message)
+
+    turns = [
+        {'sender': turn['sender'], 'content': truncate_to_tokens(turn['content'], MAX_TURN_TOKENS)}
+        for turn in history
+        if turn.get('sender') in ROLES and turn.get('content')
+    ]
+    costs = [estimate_tokens(turn['content']) for turn in turns]
+
+    kept = len(turns)
+    if sum(costs) > remaining:
+        # Fill newest-first, leaving room to summarize what is left out
+        room = remaining - SUMMARY_TOKENS
+        kept = 0
+        while kept < len(turns) and costs[-1 - kept] <= room:
+            room -= costs[-1 - kept]
+            kept += 1
+        remaining = room + SUMMARY_TOKENS
+
+    dropped, recent = turns[:len(turns) - kept], turns[len(turns) - kept:]
+    contents = []
+    summary = summarize_turns(dropped, min(SUMMARY_TOKENS, remaining)) if dropped and remaining > 0 else ''
+    if summary:
+        _append(contents, 'user', summary)
+    else:
+        # Gemini contents must open with a user turn; an assistant turn cut
+        # off from the question it answered is left out
+        while recent and recent[0]['sender'] == 'ai':
+            dropped.append(recent.pop(0))
+    for turn in recent:
+        _append(contents, ROLES[turn['sender']], turn['content'])
+    _append(contents, 'user', message)
+
+    estimated = estimate_tokens(system_instruction) + sum(
+        estimate_tokens(part) for content in contents for part in content['parts']
+    )
+    return Prompt(contents, estimated, len(recent), len(dropped))
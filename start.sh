@@ -14,4 +14,14 @@ echo "🗄️ Running database migrations..."
 python manage.py migrate
 
 echo "🌐 Starting server..."
-gunicorn project.wsgi:application --bind 0.0.0.0:$PORT --workers 2 --timeout 120
+# Same spellings as settings_env.get_bool, so Django and the server agree on the mode
+case "$(echo "${ASGI_MODE:-}" | tr -d '[:space:]' | tr '[:upper:]' '[:lower:]')" in
+    true|1|yes|on)
+        # Async mode: uvicorn workers serve project.asgi, so chats waiting on Gemini
+        # don't tie up a worker and block other requests
+        gunicorn project.asgi:application -k uvicorn_worker.UvicornWorker --bind 0.0.0.0:$PORT --workers 2 --timeout 120
+        ;;
+    *)
+        gunicorn project.wsgi:application --bind 0.0.0.0:$PORT --workers 2 --timeout 120
+        ;;
+esac
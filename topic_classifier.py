@@ -0,0 +1,156 @@
+"""
+Local on-topic classifier for the AI chat (is_mental_health_related)
+
+A linear model over hashed n-gram features: word unigrams, word bigrams and
+five-letter word prefixes (so 'stressed' and 'stressful' share a feature)
+are hashed into a fixed-size vector, and the message is on-topic when the
+weighted sum clears a threshold. Unlike the keyword list, context counts -
+'help me with my python project' scores off-topic even though 'help' and
+'project' are mental-health keywords.
+
+The weights live in topic_classifier_weights.npy (one float32 per hashed
+feature plus the bias) and are memory-mapped, so every worker process shares
+one read-only copy. Retrain them with train_topic_classifier.py after editing
+topic_classifier_data.json.
+
+NumPy is optional: without it, or without the weights file, is_on_topic
+falls back to the keyword classifier.
+"""
+
+import logging
+import os
+import re
+import zlib
+from functools import lru_cache
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+from keyword_classifier import classify_message
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 16
+DIMENSIONS = 1 << HASH_BITS
+_MASK = DIMENSIONS - 1
+_BIGRAM_MIX = 0x9E3779B1
+PREFIX_LENGTH = 5
+# Probability above which a message counts as on-topic. Kept below 0.5: an
+# off-topic question answered kindly costs little, a student turned away costs a lot
+ON_TOPIC_THRESHOLD = 0.35
+
+WEIGHTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'topic_classifier_weights.npy')
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+
+@lru_cache(maxsize=65536)
+def _token_features(token):
+    """crc32 of the word, and the index of its prefix feature (None for short words)"""
+    word_hash = zlib.crc32(b'w:' + token.encode('utf-8'))
+    if len(token) <= PREFIX_LENGTH:
+        return word_hash, None
+    return word_hash, zlib.crc32(b'p:' + token[:PREFIX_LENGTH].encode('utf-8')) & _MASK
+
+
+def feature_indices(message):
+    """
+    Return the hashed feature indices of a message, one per occurrence
+
+    Hashing uses crc32 rather than hash(), so indices are stable across
+    processes and match the ones the weights were trained on. Bigram indices
+    are mixed from the two word hashes instead of hashing the pair's text.
+    """
+    tokens = [_token_features(token) for token in _TOKEN_RE.findall(message.lower().replace('’', "'"))]
+    indices = [word_hash & _MASK for word_hash, _ in tokens]
+    indices += [((first * _BIGRAM_MIX) ^ second) >> 8 & _MASK for (first, _), (second, _) in zip(tokens, tokens[1:])]
+    indices += [prefix for _, prefix in tokens if prefix is not None]
+    return indices
+
+
+class TopicClassifier:
+    """
+    Scores messages with a hashed-feature logistic regression model
+
+    Args:
+        weights (numpy.ndarray): DIMENSIONS feature weights followed by the bias
+        threshold (float): On-topic probability cut-off
+    """
+
+    def __init__(self, weights, threshold=ON_TOPIC_THRESHOLD):
+        if weights.shape != (DIMENSIONS + 1,):
+            raise ValueError(f"Expected {DIMENSIONS + 1} weights, got shape {weights.shape}")
+        # A plain ndarray view of the mapping: numpy.memmap adds overhead to every small gather
+        self.weights = np.asarray(weights)
+        self.bias = float(weights[DIMENSIONS])
+        self.threshold = threshold
+        # Compare raw scores against the threshold's logit instead of applying
+        # the sigmoid to every message
+        self._logit_threshold = float(np.log(threshold / (1 - threshold)))
+
+    @classmethod
+    def load(cls, path=WEIGHTS_PATH, **kwargs):
+        """Memory-map the weights file read-only"""
+        return cls(np.load(path, mmap_mode='r'), **kwargs)
+
+    def logit(self, message):
+        """Raw score of one message; > 0 leans on-topic"""
+        indices = feature_indices(message)
+        if not indices:
+            return self.bias
+        return self.bias + float(self.weights.take(indices).sum())
+
+    def score(self, message):
+        """Probability that one message is on-topic"""
+        return float(1 / (1 + np.exp(-self.logit(message))))
+
+    def score_batch(self, messages):
+        """On-topic probabilities for many messages, as one gather and one segmented sum"""
+        rows = [feature_indices(message) for message in messages]
+        lengths = np.fromiter((len(row) for row in rows), dtype=np.intp, count=len(rows))
+        logits = np.full(len(rows), self.bias, dtype=np.float64)
+        if lengths.sum():
+            flat = np.fromiter((index for row in rows for index in row), dtype=np.intp, count=int(lengths.sum()))
+            gathered = self.weights.take(flat).astype(np.float64)
+            nonempty = lengths > 0
+            starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))[nonempty]
+            logits[nonempty] += np.add.reduceat(gathered, starts)
+        return 1 / (1 + np.exp(-logits))
+
+    def is_on_topic(self, message):
+        return self.logit(message) >= self._logit_threshold
+
+
+def _load_default():
+    if not NUMPY_AVAILABLE:
+        logger.warning("NumPy not installed; topic detection uses the keyword list")
+        return None
+    try:
+        return TopicClassifier.load()
+    except (OSError, ValueError) as e:
+        logger.warning(f"Topic classifier weights unavailable ({e}); topic detection uses the keyword list")
+        return None
+
+
+TOPIC_CLASSIFIER = _load_default()
+
+
+def is_on_topic(message):
+    """Check if a message is about mental health, student wellbeing or support"""
+    if TOPIC_CLASSIFIER is None:
+        return 'on_topic' in classify_message(message)
+    return TOPIC_CLASSIFIER.is_on_topic(message)
+
+
+def is_mental_health_related(message):
+    """
+    The chat's topic filter, shared by gemini_config and gemini_fallback
+
+    On-topic messages, plus any crisis statement the classifier might score
+    low - those must never get the off-topic redirect.
+    """
+    return is_on_topic(message) or 'crisis_phrase' in classify_message(message)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Train the on-topic classifier and write topic_classifier_weights.npy
+
+Reads the labelled examples in topic_classifier_data.json ("on_topic" and
+"off_topic" message lists), augments each one with the openers and casing
+students use in chat, and fits an L2-regularized logistic regression over
+the same hashed features topic_classifier uses at runtime. Pure NumPy, runs
+in a few seconds.
+
+Usage:
+    python train_topic_classifier.py [--epochs 300] [--l2 1e-4]
+    python train_topic_classifier.py --folds 5     # cross-validate, write nothing
+
+Add misclassified messages to the data file (hard negatives like
+"help me with my python project" to off_topic) and retrain.
+"""
+
+import argparse
+import json
+import os
+import random
+
+import numpy as np
+
+from topic_classifier import DIMENSIONS, ON_TOPIC_THRESHOLD, WEIGHTS_PATH, feature_indices
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'topic_classifier_data.json')
+
+OPENERS = ["", "hi, ", "hey ", "so ", "honestly ", "ok so ", "Hello. ", "um "]
+ENDINGS = ["", ".", "?", "!", "...", " please", " any advice?", " lol"]
+
+
+def load_examples(path=DATA_PATH):
+    with open(path, encoding='utf-8') as data_file:
+        data = json.load(data_file)
+    return [(message, 1.0) for message in data['on_topic']] + [(message, 0.0) for message in data['off_topic']]
+
+
+def augment(examples, copies, rng):
+    """Each example as written plus `copies` variants with a random opener, ending and casing"""
+    augmented = []
+    for message, label in examples:
+        augmented.append((message, label))
+        for _ in range(copies):
+            variant = rng.choice(OPENERS) + message + rng.choice(ENDINGS)
+            if rng.random() < 0.1:
+                variant = variant.upper()
+            augmented.append((variant, label))
+    return augmented
+
+
+def featurize(examples):
+    """Sparse design matrix as (flat feature indices, row of each index), plus labels"""
+    rows = [feature_indices(message) for message, _ in examples]
+    flat = np.fromiter((index for row in rows for index in row), dtype=np.intp)
+    owners = np.repeat(np.arange(len(rows)), [len(row) for row in rows])
+    labels = np.array([label for _, label in examples])
+    return flat, owners, labels
+
+
+def train(examples, epochs=300, learning_rate=2.0, l2=1e-4):
+    """Full-batch gradient descent on the logistic loss; returns DIMENSIONS + 1 float32 weights"""
+    flat, owners, labels = featurize(examples)
+    count = len(labels)
+    weights = np.zeros(DIMENSIONS + 1)
+    for _ in range(epochs):
+        logits = np.bincount(owners, weights=weights[flat], minlength=count) + weights[DIMENSIONS]
+        errors = 1 / (1 + np.exp(-logits)) - labels
+        gradient = np.bincount(flat, weights=errors[owners], minlength=DIMENSIONS) / count
+        weights[:DIMENSIONS] -= learning_rate * (gradient + l2 * weights[:DIMENSIONS])
+        weights[DIMENSIONS] -= learning_rate * errors.mean()
+    return weights.astype(np.float32)
+
+
+def accuracy(weights, examples):
+    flat, owners, labels = featurize(examples)
+    logits = np.bincount(owners, weights=weights[flat].astype(np.float64), minlength=len(labels)) + weights[DIMENSIONS]
+    predicted = 1 / (1 + np.exp(-logits)) >= ON_TOPIC_THRESHOLD
+    return float((predicted == (labels == 1)).mean())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default=DATA_PATH, help='labelled examples')
+    parser.add_argument('--output', default=WEIGHTS_PATH, help='weights file to write')
+    parser.add_argument('--epochs', type=int, default=300)
+    parser.add_argument('--learning-rate', type=float, default=2.0)
+    parser.add_argument('--l2', type=float, default=1e-4)
+    parser.add_argument('--copies', type=int, default=4, help='augmented variants per example')
+    parser.add_argument('--folds', type=int, default=0, help='cross-validate instead of writing weights')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    examples = load_examples(args.data)
+    options = {'epochs': args.epochs, 'learning_rate': args.learning_rate, 'l2': args.l2}
+
+    if args.folds:
+        rng.shuffle(examples)
+        scores = []
+        for fold in range(args.folds):
+            held_out = examples[fold::args.folds]
+            kept = [example for i, example in enumerate(examples) if i % args.folds != fold]
+            weights = train(augment(kept, args.copies, rng), **options)
+            scores.append(accuracy(weights, held_out))
+            print(f"fold {fold + 1}: {scores[-1]:.1%} held-out accuracy")
+        print(f"mean: {np.mean(scores):.1%}")
+        return
+
+    weights = train(augment(examples, args.copies, rng), **options)
+    print(f"{len(examples)} examples, training accuracy {accuracy(weights, examples):.1%}")
+    np.save(args.output, weights)
+    print(f"Weights written to {args.output} ({weights.nbytes // 1024} KiB)")
+
+
+if __name__ == '__main__':
+    main()